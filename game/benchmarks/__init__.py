@@ -0,0 +1,23 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Offline benchmarks for PARPG. They run without the FIFE engine: see
+   fakefife.py for the stand-in that is installed in its place.
+   Run them from the game directory, e.g. python -m benchmarks.mapload.
+   benchmarks.suite runs all map loading cases and keeps the results in a
+   file that later runs can be compared with."""
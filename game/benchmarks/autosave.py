@@ -0,0 +1,76 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Measures how long an autosave holds up the game thread (taking the
+   snapshot and starting the worker), against the time the worker takes to
+   write it and the time a save on the game thread would take. The delta
+   rows are autosaves after the player changed CHANGED of the objects.
+
+   usage: python -m benchmarks.autosave [objects ...]"""
+
+import sys, os, time, random, tempfile, shutil
+
+import fakefife
+fakefife.install()
+
+from benchmarks.suite import useSettings
+from benchmarks.savegame import makeState, CHANGED
+from scripts.autosave import Autosaver
+from scripts.savegame import writeGame
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+REPEATS = 3
+
+def main(sizes):
+    useSettings()
+    tmp = tempfile.mkdtemp(prefix='parpg-bench-')
+    try:
+        print '%8s %8s %12s %12s %12s' % ('objects', 'mode', 
+            'blocked (ms)', 'worker (ms)', 'sync (ms)')
+        for size in sizes:
+            state = makeState(size)
+            for mode in ('full', 'delta'):
+                if mode == 'delta':
+                    for obj in state.objects.values():
+                        state.setBaseline(obj)
+                    rand = random.Random(1)
+                    for obj in rand.sample(state.objects.values(), 
+                                           int(size * CHANGED)):
+                        obj.locked = not obj.locked
+                saver = Autosaver(tmp, 0, REPEATS)
+                blocked = []
+                worker = []
+                for i in range(REPEATS):
+                    saver.save(state)
+                    blocked.append(saver.stats['last_blocked'])
+                    saver.wait()
+                    worker.append(saver.stats['write'])
+                start = time.time()
+                f = open(os.path.join(tmp, 'sync.dat'), 'wb')
+                writeGame(f, state, delta=True)
+                os.fsync(f.fileno())
+                f.close()
+                sync = time.time() - start
+                print '%8d %8s %12.1f %12.1f %12.1f' % (size, mode, 
+                    min(blocked) * 1000, min(worker) * 1000, sync * 1000)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
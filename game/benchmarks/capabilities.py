@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Compares GameObject.trueAttr with the class capability bitmask, for
+   single checks and for bulk queries like "all NPCs on a map".
+
+   usage: python -m benchmarks.capabilities [objects [maps]]"""
+
+import sys, time, random
+
+import fakefife
+fakefife.install()
+
+from scripts.gamestate import GameState
+from scripts.objects.base import NPC, CONTAINER, SCRIPTABLE
+from scripts.objects.containers import WoodenCrate
+from scripts.objects.actors import NonPlayerCharacter
+
+DEFAULT_OBJECTS = 10000
+DEFAULT_MAPS = 50
+# share of the objects that are NPCs, the rest are crates
+NPC_SHARE = 0.1
+REPEATS = 20
+
+def timeit(function, *args):
+    """@return: seconds per call of function, averaged over REPEATS calls"""
+    start = time.time()
+    for i in xrange(REPEATS):
+        function(*args)
+    return (time.time() - start) / REPEATS
+
+def checkTrueAttr(objects):
+    for obj in objects:
+        obj.trueAttr("NPC")
+
+def checkCapabilities(objects):
+    for obj in objects:
+        obj.capabilities & NPC
+
+def checkHasCapability(objects):
+    for obj in objects:
+        obj.hasCapability(CONTAINER | SCRIPTABLE)
+
+def scanNPCs(state, map_id):
+    """All NPCs on a map, the way Engine.save filtered them"""
+    return [obj for obj in state.objects.values()
+            if obj.trueAttr("NPC") and obj.map_id == map_id]
+
+def indexNPCs(state, map_id):
+    return state.getObjectsWithCapability(NPC, map_id)
+
+def main(objects, maps):
+    rand = random.Random(0)
+    state = GameState()
+    for i in xrange(objects):
+        if rand.random() < NPC_SHARE:
+            obj = NonPlayerCharacter("npc%d" % i)
+        else:
+            obj = WoodenCrate("crate%d" % i)
+        state.addObject(obj, "map%d" % rand.randrange(maps))
+    assert state.checkConsistency() == []
+    everything = state.objects.values()
+    assert len(scanNPCs(state, "map0")) == len(indexNPCs(state, "map0"))
+
+    print '%d objects on %d maps, %d NPCs' % (objects, maps,
+        len(state.getObjectsWithCapability(NPC)))
+    print '%28s %12s' % ('operation', 'time (us)')
+    for name, function, arg in (
+            ('trueAttr per object', checkTrueAttr, everything),
+            ('capabilities & per object', checkCapabilities, everything),
+            ('hasCapability per object', checkHasCapability, everything)):
+        print '%28s %12.3f' % (name, timeit(function, arg) / objects * 1e6)
+    for name, function in (('NPCs on a map, trueAttr scan', scanNPCs),
+                           ('NPCs on a map, index', indexNPCs)):
+        print '%28s %12.2f' % (name, timeit(function, state, "map0") * 1e6)
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [DEFAULT_OBJECTS, DEFAULT_MAPS][len(args):]))
@@ -0,0 +1,498 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""A very small stand-in for the parts of the FIFE python API that the map
+   loaders and the game objects use. It only records what it is told to
+   do, so that the loading code can be timed without a display or the real
+   engine.
+
+   Call install() before importing anything that does 'import fife'."""
+
+import sys, os, types
+
+CELL_EDGES_ONLY, CELL_EDGES_AND_DIAGONALS, FREEFORM = range(3)
+
+class Exception(Exception):
+    def getMessage(self):
+        return str(self)
+
+class ResourceLoader(object):
+    def __init__(self):
+        pass
+
+class InstanceActionListener(object):
+    def __init__(self):
+        pass
+
+class MapChangeListener(object):
+    def __init__(self):
+        pass
+
+class ResourceLocation(object):
+    def __init__(self, filename):
+        self.filename = filename
+
+    def getFilename(self):
+        return self.filename
+
+class ExactModelCoordinate(object):
+    __slots__ = ('x', 'y', 'z')
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = x, y, z
+
+class ModelCoordinate(ExactModelCoordinate):
+    __slots__ = ()
+
+class Rect(object):
+    def __init__(self, x, y, w, h):
+        self.x, self.y, self.w, self.h = x, y, w, h
+
+class Location(object):
+    def __init__(self, layer=None):
+        if isinstance(layer, Location):
+            self.layer, self.coords = layer.layer, layer.coords
+        else:
+            self.layer, self.coords = layer, ExactModelCoordinate()
+
+    def getLayer(self):
+        return self.layer
+
+    def setLayerCoordinates(self, coords):
+        self.coords = coords
+    setMapCoordinates = setLayerCoordinates
+
+    def getLayerCoordinates(self):
+        return self.coords
+    getExactLayerCoordinates = getMapCoordinates = getLayerCoordinates
+
+class ObjectVisual(object):
+    def __init__(self):
+        self.angles = []
+
+    @staticmethod
+    def create(obj):
+        obj.visual = ObjectVisual()
+        return obj.visual
+
+    def addStaticImage(self, angle, image_id):
+        self.angles.append(angle)
+
+    def getStaticImageAngles(self):
+        return self.angles
+
+class ActionVisual(object):
+    @staticmethod
+    def create(action):
+        action.visual = ActionVisual()
+        return action.visual
+
+    def addAnimation(self, angle, anim_id):
+        pass
+
+class InstanceVisual(object):
+    __slots__ = ('stackpos',)
+    def __init__(self):
+        self.stackpos = 0
+
+    @staticmethod
+    def create(inst):
+        inst.visual = InstanceVisual()
+        return inst.visual
+
+    def setStackPosition(self, pos):
+        self.stackpos = pos
+
+class Action(object):
+    def __init__(self, id):
+        self.id = id
+        self.visual = None
+        self.duration = 0
+
+    def getId(self):
+        return self.id
+
+    def get2dGfxVisual(self):
+        return self.visual
+
+    def setDuration(self, duration):
+        self.duration = duration
+
+class Object(object):
+    def __init__(self, id, nspace, parent=None):
+        self.id, self.nspace = id, nspace
+        self.visual = None
+        self.actions = {}
+        self.blocking = self.static = False
+
+    def getId(self):
+        return self.id
+
+    def getNamespace(self):
+        return self.nspace
+
+    def get2dGfxVisual(self):
+        return self.visual
+
+    def createAction(self, id, is_default=False):
+        action = Action(id)
+        self.actions[id] = action
+        return action
+
+    def getAction(self, id):
+        return self.actions.get(id)
+
+    def setResourceLocation(self, location):
+        self.location = location
+
+    def setBlocking(self, blocking):
+        self.blocking = blocking
+
+    def setStatic(self, static):
+        self.static = static
+
+    def setPather(self, pather):
+        pass
+
+class Instance(object):
+    __slots__ = ('object', 'location', 'id', 'rotation', 'visual', 'action')
+    def __init__(self, object, location, id):
+        self.object, self.location, self.id = object, location, id
+        self.rotation, self.visual, self.action = 0, None, None
+
+    def getId(self):
+        return self.id
+
+    def getObject(self):
+        return self.object
+
+    def getLocation(self):
+        return self.location
+
+    def getFacingLocation(self):
+        return self.location
+
+    def setRotation(self, rotation):
+        self.rotation = rotation
+
+    def getRotation(self):
+        return self.rotation
+
+    def get2dGfxVisual(self):
+        return self.visual
+
+    def act(self, action, target, repeating=False):
+        self.action = action
+
+    def move(self, action, target, speed):
+        self.action = action
+
+    def say(self, text, duration=0):
+        pass
+
+    def addActionListener(self, listener):
+        pass
+
+class CellGrid(object):
+    def __init__(self, type):
+        self.type = type
+
+    def getType(self):
+        return self.type
+
+    def setRotation(self, rotation):
+        self.rotation = rotation
+
+    def setXScale(self, scale):
+        self.x_scale = scale
+
+    def setYScale(self, scale):
+        self.y_scale = scale
+
+    def setXShift(self, shift):
+        self.x_shift = shift
+
+    def setYShift(self, shift):
+        self.y_shift = shift
+
+class Layer(object):
+    def __init__(self, id, map, cellgrid):
+        self.id, self.map, self.cellgrid = id, map, cellgrid
+        self.instances = []
+        # instances with an id, by id
+        self.index = {}
+        self.pathing = CELL_EDGES_ONLY
+
+    def getId(self):
+        return self.id
+
+    def getMap(self):
+        return self.map
+
+    def getCellGrid(self):
+        return self.cellgrid
+
+    def setPathingStrategy(self, strategy):
+        self.pathing = strategy
+
+    def createInstance(self, object, coords, id=''):
+        location = Location(self)
+        location.setLayerCoordinates(coords)
+        inst = Instance(object, location, id)
+        self.instances.append(inst)
+        if id:
+            self.index[id] = inst
+        return inst
+
+    def deleteInstance(self, inst):
+        self.instances.remove(inst)
+        if self.index.get(inst.id) is inst:
+            del self.index[inst.id]
+
+    def getInstances(self):
+        return self.instances
+
+    def getInstance(self, id):
+        return self.index.get(id)
+
+class Map(object):
+    def __init__(self, id):
+        self.id = id
+        self.layers = []
+
+    def getId(self):
+        return self.id
+
+    def setResourceFile(self, filename):
+        self.filename = filename
+
+    def createLayer(self, id, cellgrid):
+        if self.getLayer(id) is not None:
+            raise Exception('Layer %s already exists' % id)
+        layer = Layer(id, self, cellgrid)
+        self.layers.append(layer)
+        return layer
+
+    def getLayer(self, id):
+        for layer in self.layers:
+            if layer.id == id:
+                return layer
+        return None
+
+    def getLayers(self):
+        return self.layers
+
+class Model(object):
+    def __init__(self):
+        self.maps = {}
+        self.objects = {}
+
+    def createMap(self, id):
+        if id in self.maps:
+            raise Exception('Map %s already exists' % id)
+        self.maps[id] = Map(id)
+        return self.maps[id]
+
+    def deleteMap(self, map):
+        del self.maps[map.getId()]
+
+    def getMaps(self):
+        return self.maps.values()
+
+    def getCellGrid(self, type):
+        return CellGrid(type)
+
+    def getPather(self, name):
+        return name
+
+    def createObject(self, id, nspace, parent=None):
+        if (id, nspace) in self.objects:
+            raise Exception('Object %s:%s already exists' % (nspace, id))
+        obj = Object(id, nspace, parent)
+        self.objects[(id, nspace)] = obj
+        return obj
+
+    def getObject(self, id, nspace):
+        return self.objects.get((id, nspace))
+
+    def deleteObjects(self):
+        self.objects = {}
+
+class Camera(object):
+    def __init__(self, id, layer, viewport, coords):
+        self.id, self.layer, self.viewport = id, layer, viewport
+        self.rotation = self.tilt = 0.0
+        self.zoom = 1.0
+
+    def getId(self):
+        return self.id
+
+    def setCellImageDimensions(self, width, height):
+        self.cell_dimensions = (width, height)
+
+    def setRotation(self, rotation):
+        self.rotation = rotation
+
+    def getRotation(self):
+        return self.rotation
+
+    def setTilt(self, tilt):
+        self.tilt = tilt
+
+    def setZoom(self, zoom):
+        self.zoom = zoom
+
+    def attach(self, instance):
+        self.attached = instance
+
+class View(object):
+    def __init__(self):
+        self.cameras = []
+
+    def addCamera(self, id, layer, viewport, coords):
+        for cam in self.cameras:
+            if cam.id == id:
+                raise Exception('Camera %s already exists' % id)
+        cam = Camera(id, layer, viewport, coords)
+        self.cameras.append(cam)
+        return cam
+
+    def getCameras(self):
+        return self.cameras
+
+    def clearCameras(self):
+        self.cameras = []
+
+    def resetRenderers(self):
+        pass
+
+class RenderBackend(object):
+    def getScreenWidth(self):
+        return 1024
+
+    def getScreenHeight(self):
+        return 768
+
+class RawData(object):
+    """File wrapper offering the bits of fife.RawData the loaders use"""
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.length = os.fstat(self.file.fileno()).st_size
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def readString(self, size):
+        return self.file.read(size)
+
+    def getDataLength(self):
+        return self.length
+
+    def getCurrentIndex(self):
+        return self.file.tell()
+
+class VFS(object):
+    def open(self, filename):
+        return RawData(filename)
+
+    def exists(self, filename):
+        return os.path.exists(filename)
+
+    def listFiles(self, path):
+        return tuple(f for f in os.listdir(path)
+                     if os.path.isfile(os.path.join(path, f)))
+
+    def listDirectories(self, path):
+        return tuple(f for f in os.listdir(path)
+                     if os.path.isdir(os.path.join(path, f)))
+
+class Pool(object):
+    """Image and animation pool. Resources are never actually loaded"""
+    def __init__(self):
+        self.resources = []
+
+    def addResourceFromFile(self, filename):
+        self.resources.append(Resource())
+        return len(self.resources) - 1
+
+    def getImage(self, id):
+        return self.resources[id]
+    getAnimation = getImage
+
+class Resource(object):
+    def setXShift(self, shift):
+        pass
+
+    def setYShift(self, shift):
+        pass
+
+    def getDuration(self):
+        return 100
+
+class Engine(object):
+    def __init__(self):
+        self.vfs = VFS()
+        self.model = Model()
+        self.image_pool = Pool()
+        self.anim_pool = Pool()
+        self.view = View()
+        self.backend = RenderBackend()
+
+    def getVFS(self):
+        return self.vfs
+
+    def getModel(self):
+        return self.model
+
+    def getImagePool(self):
+        return self.image_pool
+
+    def getAnimationPool(self):
+        return self.anim_pool
+
+    def getView(self):
+        return self.view
+
+    def getRenderBackend(self):
+        return self.backend
+
+# the parts of FIFE's python 'serializers' extension used by local_loaders
+class WrongFileType(Exception):
+    pass
+
+class NameClash(Exception):
+    pass
+
+def reverse_root_subfile(masterfile, subfile):
+    """Turn a path relative to masterfile into one relative to the root"""
+    path = os.path.join(os.path.dirname(masterfile), subfile)
+    return os.path.normpath(path).replace(os.path.sep, '/')
+
+def install():
+    """Register this module as 'fife' (and the serializers extension) in
+       sys.modules, unless a fife module has already been imported."""
+    if 'fife' in sys.modules:
+        return sys.modules['fife']
+    this = sys.modules[__name__]
+    serializers = types.ModuleType('serializers')
+    for name in ('WrongFileType', 'NameClash', 'reverse_root_subfile'):
+        setattr(serializers, name, getattr(this, name))
+    serializers.__all__ = ['WrongFileType', 'NameClash',
+                           'reverse_root_subfile']
+    sys.modules['fife'] = this
+    sys.modules['serializers'] = serializers
+    return this
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Compares the per-map index of GameState with the full scans it
+   replaced: getObjectsFromMap and the objectActive lookup that
+   World.mouseMoved does for every hovered instance.
+
+   usage: python -m benchmarks.gamestate [objects [maps]]"""
+
+import sys, time, random
+
+import fakefife
+fakefife.install()
+
+from scripts.gamestate import GameState
+from scripts.objects.base import GameObject
+
+DEFAULT_OBJECTS = 10000
+DEFAULT_MAPS = 50
+LOOKUPS = 2000
+
+def scanObjects(state, map_id):
+    """getObjectsFromMap as it was before the index"""
+    return [i for i in state.objects.values() if i.map_id == map_id]
+
+def scanActive(state, ident):
+    """Engine.objectActive as it was before the index"""
+    for i in scanObjects(state, state.currentMap):
+        if (i.ID == ident):
+            return i
+    return False
+
+def indexActive(state, ident):
+    obj = state.getObjectOnMap(ident, state.currentMap)
+    if obj is None:
+        return False
+    return obj
+
+def timeit(function, *args):
+    """@return: seconds per call of function, averaged over LOOKUPS calls"""
+    start = time.time()
+    for i in xrange(LOOKUPS):
+        function(*args)
+    return (time.time() - start) / LOOKUPS
+
+def main(objects, maps):
+    rand = random.Random(0)
+    state = GameState()
+    start = time.time()
+    for i in xrange(objects):
+        state.addObject(GameObject("obj%d" % i), "map%d" % rand.randrange(maps))
+    add = time.time() - start
+    assert state.checkConsistency() == []
+    state.currentMap = "map0"
+    # a hovered object on the current map, the usual objectActive case
+    ident = iter(state.getObjectsFromMap("map0")).next().ID
+
+    print '%d objects on %d maps, %.2f us per addObject' % (objects, maps,
+        add / objects * 1e6)
+    print '%20s %14s %14s %10s' % ('operation', 'scan (us)', 'index (us)',
+                                   'speedup')
+    for name, old, new, arg in (
+            ('getObjectsFromMap', scanObjects, 
+             lambda s, m: s.getObjectsFromMap(m), "map0"),
+            ('objectActive hit', scanActive, indexActive, ident),
+            ('objectActive miss', scanActive, indexActive, "nothing")):
+        old_time, new_time = timeit(old, state, arg), timeit(new, state, arg)
+        print '%20s %14.2f %14.2f %9.0fx' % (name, old_time * 1e6,
+            new_time * 1e6, old_time / max(new_time, 1e-9))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [DEFAULT_OBJECTS, DEFAULT_MAPS][len(args):]))
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Writes synthetic map files for the benchmarks. The maps use the real
+   tile and agent objects from objects/ so that they can also be loaded
+   in-game."""
+
+import os, random
+
+# object id -> object file, relative to the game directory
+GROUND_OBJECTS = {
+    'grass-a': 'objects/ground/grass/grass-a.xml',
+    'grass-b': 'objects/ground/grass/grass-b.xml',
+    'gravel': 'objects/ground/gravel/gravel.xml',
+    'snow02': 'objects/ground/snow/snow0/snow02.xml',
+    'brick': 'objects/ground/brick/brick.xml',
+}
+
+# PARPG object type -> (object id, object file, extra instance attributes)
+# for the object mix of generateMap
+PARPG_OBJECTS = {
+    'WoodenCrate': ('crate', 'objects/objects/crate/crate.xml',
+                    'is_open="False" locked="False" name="Crate" '
+                    'text="A synthetic crate"'),
+    'NonPlayerCharacter': ('npc-woman',
+                           'objects/agents/npcs/npc_woman/npc-woman.xml',
+                           'text="A synthetic NPC"'),
+}
+PC_OBJECT = ('PC', 'objects/agents/player/player.xml')
+
+def generateMap(filename, instances, layers=1, objects=None, seed=0,
+                mix=None, pc=False):
+    """Write a map with the given number of instances spread evenly over
+       the given number of square layers.
+       @type filename: string
+       @param filename: Name of the map file to write
+       @type instances: integer
+       @param instances: Total number of instances in the map
+       @type layers: integer
+       @param layers: Number of layers
+       @type objects: dict
+       @param objects: Object id to object file mapping used for the tiles
+       @type seed: integer
+       @param seed: Seed for the tile choice, so runs are repeatable
+       @type mix: dict
+       @param mix: PARPG object type (see PARPG_OBJECTS) to the fraction
+                   of the instances that are objects of that type. They go
+                   on the last layer, in place of tiles.
+       @type pc: boolean
+       @param pc: Put the player character on the last layer
+       @return: None"""
+    if objects is None:
+        objects = GROUND_OBJECTS
+    if mix is None:
+        mix = {}
+    rand = random.Random(seed)
+    ids = sorted(objects.keys())
+    per_layer = max(1, instances / layers)
+    side = max(1, int(per_layer ** 0.5))
+    root = os.path.dirname(os.path.abspath(filename))
+
+    # the PARPG objects of the last layer, as (object id, type, attributes)
+    specials = []
+    files = [objects[id] for id in ids]
+    for object_type in sorted(mix):
+        object_id, object_file, attributes = PARPG_OBJECTS[object_type]
+        specials.extend([(object_id, object_type, attributes)] *
+                        int(instances * mix[object_type]))
+        files.append(object_file)
+    if pc:
+        specials.insert(0, (PC_OBJECT[0], 'PlayerCharacter', ''))
+        files.append(PC_OBJECT[1])
+
+    out = open(filename, 'wt')
+    out.write('<?xml version="1.0" encoding="ascii"?>\n')
+    out.write('<map id="synthetic-%d" format="1.0">\n' % instances)
+    for path in files:
+        path = os.path.relpath(os.path.abspath(path), root)
+        out.write('\t<import file="%s"></import>\n'
+                  % path.replace(os.path.sep, '/'))
+    written = 0
+    for l in range(layers):
+        out.write('\t<layer grid_type="square" id="Layer%d" x_scale="1.0" '
+                  'pathing="cell_edges_only" y_scale="1.0" rotation="0.0" '
+                  'x_offset="0.0" y_offset="0.0">\n\t\t<instances>\n' % l)
+        count = per_layer
+        start = 0
+        if l == layers - 1:
+            count = instances - written
+            start = min(len(specials), count)
+            for i in xrange(start):
+                object_id, object_type, attributes = specials[i]
+                id = '%s%06d' % (object_type, i)
+                if object_type == 'PlayerCharacter':
+                    id = 'PC'
+                out.write('\t\t\t<i x="%d.0" o="%s" z="0.0" y="%d.0" r="0" '
+                          'ns="PARPG" id="%s" object_type="%s" %s></i>\n'
+                          % (i % side, object_id, i / side, id, object_type,
+                             attributes))
+        for i in xrange(start, count):
+            out.write('\t\t\t<i x="%d.0" o="%s" z="0.0" y="%d.0" r="0" '
+                      'ns="PARPG"></i>\n'
+                      % (i % side, rand.choice(ids), i / side))
+        written += count
+        out.write('\t\t</instances>\n\t</layer>\n')
+    out.write('\t<camera ref_cell_width="72" zoom="1.0" tilt="-60.0" '
+              'id="main" ref_layer_id="Layer0" ref_cell_height="38" '
+              'rotation="45.0">\n\t</camera>\n</map>\n')
+    out.close()
+
+def generateObjects(filename, objects, doors=0, seed=0):
+    """Write an _objects.xml file, as read by ObjectXMLParser.
+       @type filename: string
+       @param filename: Name of the file to write
+       @type objects: integer
+       @param objects: Number of <object> elements
+       @type doors: integer
+       @param doors: Number of <door> elements
+       @type seed: integer
+       @param seed: Seed for the positions, so runs are repeatable
+       @return: None"""
+    rand = random.Random(seed)
+    out = open(filename, 'wt')
+    out.write('<?xml version="1.0" encoding="ascii"?>\n<objects format="1.0">\n')
+    out.write('\t<PC xpos="0.0" ypos="0.0"></PC>\n')
+    for i in xrange(objects):
+        out.write('\t<object display="True" gfx="crate" xpos="%d.0" '
+                  'ypos="%d.0" id="crate%06d" carry="0" contain="1" '
+                  'text="A synthetic crate"></object>\n'
+                  % (rand.randint(-100, 100), rand.randint(-100, 100), i))
+    for i in xrange(doors):
+        out.write('\t<door display="True" gfx="grass-a" xpos="%d" ypos="0" '
+                  'id="door%03d" carry="0" contain="0" text="Door" '
+                  'map="maps/map.xml" txpos="0" typos="0"></door>\n' % (i, i))
+    out.write('</objects>\n')
+    out.close()
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Compares the streaming map loader with the whole-tree (ET.parse) one and
+   with loading from the compiled map cache on synthetic maps. Every load
+   runs in its own process so that the peak RSS of one run does not hide
+   the other.
+
+   usage: python -m benchmarks.mapload [instances ...]"""
+
+import sys, os, time, resource, subprocess, tempfile, shutil
+
+import fakefife
+fakefife.install()
+
+# loaders has to come first, it imports xmlmap itself
+from local_loaders import loaders
+from local_loaders.xmlmap import XMLMapLoader
+from local_loaders import mapcache
+from benchmarks.mapgen import generateMap
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+MODES = ('tree', 'streaming', 'cached')
+
+class Data(object):
+    """Stands in for the PARPG Engine; no PARPG objects are created"""
+    def createObjects(self, layer, objects):
+        pass
+
+def loadMap(filename, mode):
+    """Load a map with a fresh fake engine.
+       @type mode: string
+       @param mode: One of MODES
+       @return: Seconds the load took"""
+    engine = fakefife.Engine()
+    loader = XMLMapLoader(engine, Data(), None,
+                          streaming=(mode == 'streaming'),
+                          use_cache=(mode == 'cached'))
+    start = time.time()
+    loader.loadResource(fakefife.ResourceLocation(filename))
+    return time.time() - start
+
+def peakRSS():
+    """Peak resident set size of this process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def runChild(filename, mode):
+    """Run one load in a separate interpreter.
+       @return: (seconds, peak RSS in MB)"""
+    out = subprocess.check_output([sys.executable, '-m', 'benchmarks.mapload',
+                                   '--child', filename, mode])
+    wall, rss = out.split()[-2:]
+    return float(wall), float(rss)
+
+def main(sizes):
+    tmp = tempfile.mkdtemp(prefix='parpg-bench-')
+    try:
+        print '%10s %10s %10s %12s' % ('instances', 'mode', 'wall (s)',
+                                       'peak RSS (MB)')
+        for size in sizes:
+            filename = os.path.join(tmp, 'map%d.xml' % size)
+            generateMap(filename, size)
+            # the cached run measures a warm cache
+            mapcache.buildCaches([filename])
+            for mode in MODES:
+                wall, rss = runChild(filename, mode)
+                print '%10d %10s %10.2f %12.1f' % (size, mode, wall, rss)
+            os.remove(mapcache.cacheFile(filename))
+            os.remove(filename)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        # silence the loader, the parent only reads the last line
+        log, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        wall = loadMap(sys.argv[2], sys.argv[3])
+        sys.stdout = log
+        print wall, peakRSS()
+    else:
+        main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
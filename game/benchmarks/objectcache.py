@@ -0,0 +1,107 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Measures how many model lookups the per-load object cache of
+   XMLMapLoader saves. The fake model counts every call that would cross
+   into the engine (getObject, get2dGfxVisual and getAction).
+
+   usage: python -m benchmarks.objectcache [instances ...]"""
+
+import sys, os, time, tempfile, shutil
+
+import fakefife
+fakefife.install()
+
+# loaders has to come first, it imports xmlmap itself
+from local_loaders import loaders
+from local_loaders.xmlmap import XMLMapLoader
+from benchmarks.mapgen import generateMap
+
+DEFAULT_SIZES = (10000, 100000)
+
+class CountingObject(fakefife.Object):
+    def get2dGfxVisual(self):
+        self.model.calls += 1
+        return fakefife.Object.get2dGfxVisual(self)
+
+    def getAction(self, id):
+        self.model.calls += 1
+        return fakefife.Object.getAction(self, id)
+
+class CountingModel(fakefife.Model):
+    def __init__(self):
+        fakefife.Model.__init__(self)
+        self.calls = 0
+
+    def createObject(self, id, nspace, parent=None):
+        obj = CountingObject(id, nspace, parent)
+        obj.model = self
+        self.objects[(id, nspace)] = obj
+        return obj
+
+    def getObject(self, id, nspace):
+        self.calls += 1
+        return fakefife.Model.getObject(self, id, nspace)
+
+class UncachedLoader(XMLMapLoader):
+    """Resolves the object of every instance, like the loader used to"""
+    def lookupObject(self, objectID, nspace):
+        self.object_cache = {}
+        return XMLMapLoader.lookupObject(self, objectID, nspace)
+
+class Data(object):
+    def createObjects(self, layer, objects):
+        pass
+
+def loadMap(filename, loader_class):
+    """Load a map with a fresh fake engine using a counting model.
+       @return: (seconds, model calls, loader)"""
+    # the objects of the imports went to the model of the last load
+    loaders.evictImports()
+    engine = fakefife.Engine()
+    engine.model = CountingModel()
+    loader = loader_class(engine, Data(), None, use_cache=False)
+    log, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        start = time.time()
+        loader.loadResource(fakefife.ResourceLocation(filename))
+        wall = time.time() - start
+    finally:
+        sys.stdout = log
+    return wall, engine.model.calls, loader
+
+def main(sizes):
+    tmp = tempfile.mkdtemp(prefix='parpg-bench-')
+    try:
+        print '%10s %10s %10s %12s %10s %10s' % ('instances', 'loader',
+            'wall (s)', 'model calls', 'hits', 'misses')
+        for size in sizes:
+            filename = os.path.join(tmp, 'map%d.xml' % size)
+            generateMap(filename, size)
+            for name, loader_class in (('uncached', UncachedLoader),
+                                       ('cached', XMLMapLoader)):
+                wall, calls, loader = loadMap(filename, loader_class)
+                print '%10d %10s %10.2f %12d %10d %10d' % (size, name, wall,
+                    calls, loader.object_cache_hits,
+                    loader.object_cache_misses)
+            os.remove(filename)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
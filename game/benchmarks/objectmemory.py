@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Measures the memory taken by game objects now that they are slotted
+   and share their defaults, against the same objects keeping all their
+   attributes in a __dict__ like they used to. Every kind runs in its own
+   interpreter so the RSS of one does not hide the other.
+
+   usage: python -m benchmarks.objectmemory [objects]"""
+
+import sys, json, subprocess, cPickle
+
+import fakefife
+fakefife.install()
+
+from benchmarks.suite import peakRSS
+from scripts.objects.containers import WoodenCrate
+
+DEFAULT_OBJECTS = 100000
+KINDS = ('dict', 'slots')
+
+# every how many objects has a description of its own
+OVERRIDE_EVERY = 10
+
+def fresh(text):
+    """@return: A new string equal to text, like the map parser returns"""
+    return text[:1] + text[1:]
+
+class DictCrate(object):
+    """A crate with the attributes of a WoodenCrate in its __dict__"""
+    pass
+
+def createObjects(kind, count):
+    """@return: count crates of the given kind"""
+    objects = []
+    for i in xrange(count):
+        text = "A battered crate"
+        if i % OVERRIDE_EVERY == 0:
+            text = "A dusty crate"
+        crate = WoodenCrate("crate%d" % i, xpos=float(i % 100), 
+                            ypos=float(i // 100), map_id="map",
+                            name=fresh("Wooden Crate"), text=fresh(text))
+        if kind == 'dict':
+            state = crate.__getstate__()
+            del state['overrides']
+            for field in ('name', 'text', 'desc', 'gfx'):
+                state[field] = fresh(getattr(crate, field))
+            crate = DictCrate()
+            crate.__dict__.update(state)
+        objects.append(crate)
+    return objects
+
+def runChild(kind, count):
+    """Create the objects and report RSS growth and pickle size"""
+    before = peakRSS()
+    objects = createObjects(kind, count)
+    rss = peakRSS() - before
+    size = len(cPickle.dumps(objects, 2))
+    print json.dumps({'kind': kind, 'rss_mb': rss, 
+                      'pickle_mb': size / 1024.0 / 1024.0})
+
+def main(count):
+    print '%d objects' % count
+    print '%8s %12s %12s %14s' % ('kind', 'RSS (MB)', 'per object', 
+                                  'pickle (MB)')
+    for kind in KINDS:
+        out = subprocess.check_output([sys.executable, '-m', 
+            'benchmarks.objectmemory', '--child', kind, str(count)])
+        result = json.loads(out.splitlines()[-1])
+        print '%8s %12.1f %10.0f B %14.1f' % (kind, result['rss_mb'],
+            result['rss_mb'] * 1024 * 1024 / count, result['pickle_mb'])
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        runChild(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int((sys.argv[1:] or [DEFAULT_OBJECTS])[0]))
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Compares the binary save format with the protocol 0 pickle the game
+   used to save with: time to save and load, and file size. The delta
+   rows are delta saves after the player changed CHANGED of the objects.
+
+   usage: python -m benchmarks.savegame [objects ...]"""
+
+import sys, os, time, random, pickle, tempfile, shutil
+
+import fakefife
+fakefife.install()
+
+from benchmarks.suite import useSettings
+from scripts.gamestate import GameState
+from scripts.savegame import writeGame, readGame, readMap
+from scripts.objects.actors import PlayerCharacter
+from scripts.objects.containers import WoodenCrate
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+MAPS = 50
+CHANGED = 0.01
+
+def makeState(count):
+    """@return: A GameState with count crates spread over MAPS maps"""
+    rand = random.Random(0)
+    state = GameState()
+    state.currentMap = "map0"
+    state.PC = PlayerCharacter("PC")
+    # Engine.save used to clear the SWIG behaviour before pickling
+    state.PC.behaviour = None
+    for i in xrange(count):
+        crate = WoodenCrate("crate%d" % i, xpos=float(rand.randrange(100)),
+                            ypos=float(rand.randrange(100)),
+                            locked=rand.random() < 0.5)
+        if i % 10 == 0:
+            crate.text = "A crate with a note on it"
+        state.addObject(crate, "map%d" % rand.randrange(MAPS))
+    return state
+
+def timeit(function, *args):
+    """@return: (seconds, result) of function(*args)"""
+    start = time.time()
+    result = function(*args)
+    return time.time() - start, result
+
+def savePickle(filename, state):
+    f = open(filename, 'w')
+    pickle.dump(state, f)
+    f.close()
+
+def loadPickle(filename):
+    f = open(filename, 'r')
+    state = pickle.load(f)
+    f.close()
+    return state
+
+def saveBinary(filename, state):
+    f = open(filename, 'wb')
+    writeGame(f, state)
+    f.close()
+
+def saveDelta(filename, state):
+    f = open(filename, 'wb')
+    writeGame(f, state, delta=True)
+    f.close()
+
+def loadBinary(filename):
+    f = open(filename, 'rb')
+    state = readGame(f)
+    f.close()
+    return state
+
+def loadOneMap(filename):
+    f = open(filename, 'rb')
+    objects = readMap(f, "map0")
+    f.close()
+    return objects
+
+def main(sizes):
+    useSettings()
+    tmp = tempfile.mkdtemp(prefix='parpg-bench-')
+    try:
+        print '%8s %8s %10s %10s %12s %14s' % ('objects', 'format', 
+            'save (s)', 'load (s)', 'size (KB)', 'one map (s)')
+        for size in sizes:
+            state = makeState(size)
+            for obj in state.objects.values():
+                state.setBaseline(obj)
+            rand = random.Random(1)
+            for obj in rand.sample(state.objects.values(), 
+                                   int(size * CHANGED)):
+                obj.locked = not obj.locked
+            for name, save, load in (('pickle', savePickle, loadPickle),
+                                     ('binary', saveBinary, loadBinary),
+                                     ('delta', saveDelta, loadBinary)):
+                filename = os.path.join(tmp, '%s%d.dat' % (name, size))
+                save_time, result = timeit(save, filename, state)
+                load_time, loaded = timeit(load, filename)
+                if name != 'delta':
+                    assert len(loaded.objects) == size
+                one_map = ''
+                if name != 'pickle':
+                    one_map = '%14.3f' % timeit(loadOneMap, filename)[0]
+                print '%8d %8s %10.3f %10.3f %12.0f %s' % (size, name, 
+                    save_time, load_time, os.path.getsize(filename) / 1024.0,
+                    one_map)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
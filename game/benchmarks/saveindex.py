@@ -0,0 +1,69 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Times listing a directory of saves with what the load browser shows of
+   them: from an up to date index, building the index from the headers of
+   the saves, and reading every save in full as it would take without the
+   header.
+
+   usage: python -m benchmarks.saveindex [saves [objects per save]]"""
+
+import sys, os, time, tempfile, shutil
+
+import fakefife
+fakefife.install()
+
+from benchmarks.suite import useSettings
+from benchmarks.savegame import makeState
+from scripts.savegame import writeGame, readGame
+from scripts.saveindex import listSaves
+
+DEFAULT_SAVES = 300
+DEFAULT_OBJECTS = 1000
+
+def main(saves, objects):
+    useSettings()
+    tmp = tempfile.mkdtemp(prefix='parpg-bench-')
+    try:
+        state = makeState(objects)
+        for i in xrange(saves):
+            f = open(os.path.join(tmp, 'save%d.dat' % i), 'wb')
+            writeGame(f, state)
+            f.close()
+        print '%d saves of %d objects' % (saves, objects)
+        start = time.time()
+        listSaves(tmp)
+        print '%-20s %10.1f ms' % ('build index', (time.time() - start) * 1000)
+        start = time.time()
+        listSaves(tmp)
+        print '%-20s %10.1f ms' % ('from index', (time.time() - start) * 1000)
+        start = time.time()
+        for filename in os.listdir(tmp):
+            if filename.endswith('.dat'):
+                f = open(os.path.join(tmp, filename), 'rb')
+                readGame(f)
+                f.close()
+        print '%-20s %10.1f ms' % ('read every save', 
+                                   (time.time() - start) * 1000)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [DEFAULT_SAVES, DEFAULT_OBJECTS][len(args):]))
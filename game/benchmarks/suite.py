@@ -0,0 +1,264 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Benchmark suite for map loading. Every case runs in its own process on
+   a synthetic map (see mapgen.py), through loaders.loadMapFile (or
+   XMLMapLoader for the tree and streaming modes) with the real PARPG
+   Engine.createObjects behind it, or through ObjectXMLParser. The results
+   (load profile, wall time and peak RSS of every case) are written to a
+   JSON file, which a later run can be compared with to find regressions.
+
+   usage: python -m benchmarks.suite [-q] [-o results.json]
+                                     [-c baseline.json] [-t tolerance]
+                                     [case ...]
+
+   The exit status is 1 if a case got slower or bigger than the baseline
+   by more than the tolerance."""
+
+import sys, os, time, json, platform, resource, subprocess, tempfile, shutil
+from optparse import OptionParser
+
+import fakefife
+fakefife.install()
+
+# loaders has to come first, it imports xmlmap itself
+from local_loaders import loaders
+from local_loaders.xmlmap import XMLMapLoader
+from local_loaders import mapcache
+from benchmarks.mapgen import generateMap, generateObjects
+
+# the PARPG objects of the 'objects' maps, as a fraction of the instances
+OBJECT_MIX = {'WoodenCrate': 0.01, 'NonPlayerCharacter': 0.001}
+
+# cold: no compiled map cache yet, cached: a warm cache
+MAP_MODES = ('tree', 'streaming', 'cold', 'cached')
+
+def mapCase(kind, instances, layers, mode):
+    """A map loading case; kind is 'tiles' or 'objects' (with OBJECT_MIX
+       and a player character)"""
+    return {'name': '%s-%dk-%dl-%s' % (kind, instances / 1000, layers, mode),
+            'kind': kind, 'instances': instances, 'layers': layers,
+            'mode': mode}
+
+CASES = []
+for _instances, _layers in ((10000, 1), (100000, 4)):
+    for _kind in ('tiles', 'objects'):
+        for _mode in MAP_MODES:
+            CASES.append(mapCase(_kind, _instances, _layers, _mode))
+for _objects in (1000, 10000):
+    CASES.append({'name': 'objectxml-%dk' % (_objects / 1000),
+                  'kind': 'objectxml', 'objects': _objects})
+# the cases run with -q
+QUICK_CASES = [case['name'] for case in CASES
+               if '-10k-' in case['name'] or case['name'] == 'objectxml-1k']
+
+class HeadlessView(object):
+    """Stands in for the World: the Engine hands it the instances of the
+       PARPG objects it creates"""
+    def __init__(self):
+        self.instances = {}
+
+    def getLoadingMap(self):
+        return self
+
+    def addObject(self, name, instance):
+        self.instances[name] = instance
+
+def useSettings(filename='settings-dist.xml'):
+    """Make settings.Setting read filename: settings.xml only exists once
+       the game has been run."""
+    import settings
+    settings.Setting.tree = settings.ET.parse(filename)
+    settings.Setting.root_element = settings.Setting.tree.getroot()
+
+def peakRSS():
+    """Peak resident set size of this process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def runMapCase(case, filename):
+    """Load the map of a case with a fresh fake engine.
+       @rtype: dict
+       @return: The results"""
+    useSettings()
+    from scripts.engine import Engine
+    view = HeadlessView()
+    data = Engine(view)
+    start = time.time()
+    if case['mode'] in ('cold', 'cached'):
+        loaders.loadMapFile(filename, fakefife.Engine(), data)
+    else:
+        loader = XMLMapLoader(fakefife.Engine(), data, None,
+                              streaming=(case['mode'] == 'streaming'),
+                              use_cache=False)
+        loader.loadResource(fakefife.ResourceLocation(filename))
+        loaders.recordProfile(loader.profile)
+    wall = time.time() - start
+    profile = loaders.load_profiles[-1]
+    return {'seconds': wall, 'phases': profile['phases'],
+            'instances': sum(profile['instances'].values()),
+            'objects': profile['objects'],
+            'not_found': sum(profile['not_found'].values())}
+
+def runObjectCase(case, filename):
+    """Read the _objects.xml file of a case with ObjectXMLParser.
+       @rtype: dict
+       @return: The results"""
+    from scripts.objectLoader import ObjectXMLParser
+    parser = ObjectXMLParser()
+    start = time.time()
+    f = open(filename)
+    parser.getObjects(f)
+    f.close()
+    return {'seconds': time.time() - start,
+            'objects': len(parser.local_info)}
+
+def prepareCase(case, tmp):
+    """Write the input file of a case into tmp, returns its name"""
+    if case['kind'] == 'objectxml':
+        filename = os.path.join(tmp, 'objects%d_objects.xml' % case['objects'])
+        if not os.path.exists(filename):
+            generateObjects(filename, case['objects'], doors=10)
+        return filename
+    filename = os.path.join(tmp, '%s%d-%d.xml' % (case['kind'],
+                                                  case['instances'],
+                                                  case['layers']))
+    if not os.path.exists(filename):
+        if case['kind'] == 'objects':
+            generateMap(filename, case['instances'], case['layers'],
+                        mix=OBJECT_MIX, pc=True)
+        else:
+            generateMap(filename, case['instances'], case['layers'])
+    cache = mapcache.cacheFile(filename)
+    if case['mode'] == 'cached':
+        mapcache.buildCaches([filename])
+    elif os.path.exists(cache):
+        os.remove(cache)
+    return filename
+
+def runChild(case, filename):
+    """Run one case in a separate interpreter, so that the peak RSS of one
+       case does not hide the other.
+       @rtype: dict
+       @return: The results"""
+    out = subprocess.check_output([sys.executable, '-m', 'benchmarks.suite',
+                                   '--child', json.dumps(case), filename])
+    return json.loads(out.splitlines()[-1])
+
+def revision():
+    """The git revision of the tree, if there is one"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    """Print how every case changed against a baseline.
+       @type results: dict
+       @param results: The results of this run
+       @type baseline: dict
+       @param baseline: The results of an earlier run
+       @type tolerance: float
+       @param tolerance: Allowed increase, 0.2 is 20%
+       @rtype: list
+       @return: The names of the cases that regressed"""
+    regressions = []
+    print
+    print '%-28s %10s %10s %10s %10s' % ('case', 'seconds', 'change',
+                                         'RSS (MB)', 'change')
+    for name in sorted(results['results']):
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        new = results['results'][name]
+        changes = []
+        for key in ('seconds', 'rss_mb'):
+            change = new[key] / max(old[key], 1e-6) - 1.0
+            changes.append(change)
+            if change > tolerance:
+                regressions.append(name)
+        print '%-28s %10.3f %+9.0f%% %10.1f %+9.0f%%' % (
+              name, new['seconds'], changes[0] * 100, new['rss_mb'],
+              changes[1] * 100)
+    return sorted(set(regressions))
+
+def main(args):
+    parser = OptionParser(usage='%prog [options] [case ...]')
+    parser.add_option('-q', '--quick', action='store_true',
+                      help='only run the small cases')
+    parser.add_option('-o', '--output', default='benchmark-results.json',
+                      help='file to write the results to [%default]')
+    parser.add_option('-c', '--compare', metavar='BASELINE',
+                      help='results file of an earlier run to compare with')
+    parser.add_option('-t', '--tolerance', type='float', default=0.2,
+                      help='allowed increase against the baseline '
+                           '[%default]')
+    options, names = parser.parse_args(args)
+    if not names:
+        names = [case['name'] for case in CASES]
+        if options.quick:
+            names = QUICK_CASES
+    cases = [case for case in CASES if case['name'] in names]
+    unknown = set(names) - set([case['name'] for case in cases])
+    if unknown:
+        parser.error('unknown cases: ' + ', '.join(sorted(unknown)))
+
+    results = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'revision': revision(),
+               'results': {}}
+    tmp = tempfile.mkdtemp(prefix='parpg-bench-')
+    try:
+        print '%-28s %10s %10s' % ('case', 'seconds', 'RSS (MB)')
+        for case in cases:
+            result = runChild(case, prepareCase(case, tmp))
+            result.update(case)
+            results['results'][case['name']] = result
+            print '%-28s %10.3f %10.1f' % (case['name'], result['seconds'],
+                                           result['rss_mb'])
+    finally:
+        shutil.rmtree(tmp)
+
+    out = open(options.output, 'w')
+    json.dump(results, out, indent=1, sort_keys=True)
+    out.close()
+    print 'Results written to', options.output
+
+    if options.compare:
+        regressions = compare(results, json.load(open(options.compare)),
+                              options.tolerance)
+        if regressions:
+            print 'Regressions:', ', '.join(regressions)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        case = json.loads(sys.argv[2])
+        # silence the loader, the parent only reads the last line
+        log, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        if case['kind'] == 'objectxml':
+            result = runObjectCase(case, sys.argv[3])
+        else:
+            result = runMapCase(case, sys.argv[3])
+        result['rss_mb'] = peakRSS()
+        sys.stdout = log
+        print json.dumps(result)
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Times building a grass transition layer with utilities/transition.py on
+   random ground maps: with NumPy if it is installed, tile by tile from the
+   co-ordinate grid, and with the brute force search the grid replaced 
+   (only up to BRUTE_FORCE_LIMIT tiles, past that it takes minutes).
+   Then it compares loading the map and building the transitions once for
+   each of TERRAINS with building them all in one go, and times SaveMap 
+   packing those into layers and writing them (with the packing SaveMap 
+   used to have up to BRUTE_FORCE_LIMIT tiles), and SpliceMap writing 
+   them into a copy of the map.
+
+   usage: python -m benchmarks.transition [tiles ...]"""
+
+import sys, os, time, tempfile, shutil
+
+from benchmarks.mapgen import generateMap
+from utilities import transition
+from utilities.transition import LocalMap
+from scripts.tests.transitionTests import TileByTileMap, BruteForceMap, \
+     SlowSaveMap
+
+DEFAULT_SIZES = (2500, 10000, 102400, 1000000)
+BRUTE_FORCE_LIMIT = 2500
+# the terrains of mapgen.GROUND_OBJECTS
+TERRAINS = ["grass", "gravel", "snow", "brick"]
+
+def build(cls, filename):
+    """@return: (seconds to load, seconds to build, transition tiles)"""
+    start = time.time()
+    local_map = cls()
+    local_map.LoadFromXML(filename)
+    local_map.GetSize()
+    loaded = time.time()
+    local_map.BuildTransLayer("grass")
+    return loaded - start, time.time() - loaded, len(local_map.ttiles)
+
+def save(cls, filename, output, splice=False):
+    """@return: (seconds to save or splice, transition tiles, layers)"""
+    local_map = cls()
+    local_map.LoadFromXML(filename)
+    local_map.GetSize()
+    local_map.BuildTransLayers(TERRAINS)
+    count = len(local_map.ttiles)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        if splice:
+            local_map.SpliceMap(filename, output)
+        else:
+            local_map.SaveMap(output)
+        seconds = time.time() - start
+    finally:
+        sys.stdout = stdout
+    layers = open(output).read().count('<layer ')
+    return seconds, count, layers
+
+def main(sizes):
+    tmp = tempfile.mkdtemp(prefix='parpg-bench-')
+    try:
+        print '%8s %10s %10s %10s %10s %16s' % ('tiles', 'load (s)', 
+            'output', 'numpy (s)', 'grid (s)', 'brute force (s)')
+        for size in sizes:
+            filename = os.path.join(tmp, 'map%d.xml' % size)
+            generateMap(filename, size)
+            load, grid, count = build(TileByTileMap, filename)
+            vectorized = '%10s' % '-'
+            if transition.numpy is not None:
+                vectorized = '%10.3f' % build(LocalMap, filename)[1]
+            brute = ''
+            if size <= BRUTE_FORCE_LIMIT:
+                brute = '%16.3f' % build(BruteForceMap, filename)[1]
+            print '%8d %10.3f %10d %s %10.3f %s' % (size, load, count, 
+                                                    vectorized, grid, brute)
+        print
+        print '%8s %10s %10s   %s' % ('tiles', 'each (s)', 'one go (s)', 
+                                     'one go per terrain (ms)')
+        for size in sizes:
+            filename = os.path.join(tmp, 'map%d.xml' % size)
+            start = time.time()
+            for search in TERRAINS:
+                local_map = LocalMap()
+                local_map.LoadFromXML(filename)
+                local_map.GetSize()
+                local_map.BuildTransLayer(search)
+            each = time.time() - start
+            start = time.time()
+            local_map = LocalMap()
+            local_map.LoadFromXML(filename)
+            local_map.GetSize()
+            stats = local_map.BuildTransLayers(TERRAINS)
+            print '%8d %10.3f %10.3f   %s' % (size, each, time.time() - start,
+                ' '.join(['%s %.0f' % (search, stats[search][0] * 1000)
+                          for search in TERRAINS]))
+        print
+        print '%8s %10s %8s %10s %10s %14s' % ('tiles', 'output', 'layers', 
+            'save (s)', 'splice (s)', 'old save (s)')
+        for size in sizes:
+            filename = os.path.join(tmp, 'map%d.xml' % size)
+            output = os.path.join(tmp, 'new%d.xml' % size)
+            seconds, count, layers = save(LocalMap, filename, output)
+            spliced = save(LocalMap, filename, output, True)[0]
+            old = ''
+            if size <= BRUTE_FORCE_LIMIT:
+                old = '%14.3f' % save(SlowSaveMap, filename, output)[0]
+            print '%8d %10d %8d %10.3f %10.3f %s' % (size, count, layers, 
+                                                     seconds, spliced, old)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
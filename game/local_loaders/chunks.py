@@ -0,0 +1,190 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Chunked maps.
+# Instead of creating every instance of a map at load time, a chunked map
+# groups the instances of every layer into square chunks of CHUNK_SIZE by
+# CHUNK_SIZE cells, and only has the chunks within CHUNK_RADIUS chunks of
+# the player character in the model. Chunks are created and deleted as the
+# PC moves. The instances are recreated from the compiled map (see
+# mapcache.py), so they get the same ids every time; the PARPG objects on
+# them keep their state in the GameState, which Engine.addObject reuses
+# when they come back. The actors are never unloaded, as they walk around.
+# All layers are assumed to share one cell grid, which holds for every map
+# made with the editor so far.
+# There are NO references to FIFE here.
+
+import math
+from array import array
+
+from mapcache import instanceAt
+
+# chunk edge in cells
+CHUNK_SIZE = 32
+# chunks kept around the chunk of the PC, in each direction
+CHUNK_RADIUS = 2
+# PARPG object types created at load time and never unloaded
+PINNED_TYPES = ('PlayerCharacter', 'NonPlayerCharacter')
+
+def chunkKey(x, y, size=CHUNK_SIZE):
+    """The chunk a position is in.
+       @type x: float
+       @param x: Layer x coordinate
+       @type y: float
+       @param y: Layer y coordinate
+       @type size: integer
+       @param size: Chunk edge in cells
+       @rtype: tuple
+       @return: (chunk x, chunk y)"""
+    return (int(math.floor(float(x) / size)), int(math.floor(float(y) / size)))
+
+def chunksAround(key, radius=CHUNK_RADIUS):
+    """The chunks within radius of a chunk, the chunk itself included"""
+    cx, cy = key
+    return set([(x, y) for x in range(cx - radius, cx + radius + 1)
+                       for y in range(cy - radius, cy + radius + 1)])
+
+def pinnedIndices(layer, pinned_types=PINNED_TYPES):
+    """Indices of the instances of a compiled layer that are never unloaded"""
+    attrs, columns, parpg = layer
+    return set([n for n, values in parpg if values[0] in pinned_types])
+
+def indexLayer(layer, size=CHUNK_SIZE, pinned=()):
+    """Group the instances of a compiled layer by chunk.
+       @type layer: tuple
+       @param layer: One of the entries of compiled['layers']
+       @type size: integer
+       @param size: Chunk edge in cells
+       @type pinned: set
+       @param pinned: Indices of instances to leave out
+       @rtype: dict
+       @return: chunk key -> array of instance indices"""
+    attrs, columns, parpg = layer
+    xs, ys = columns['x'], columns['y']
+    chunks = {}
+    for n in xrange(len(xs)):
+        if n in pinned:
+            continue
+        key = chunkKey(xs[n], ys[n], size)
+        try:
+            chunks[key].append(n)
+        except KeyError:
+            chunks[key] = array('i', [n])
+    return chunks
+
+class ChunkedMap(object):
+    """The chunks of a map and which of them are in the model"""
+    def __init__(self, compiled, layers, create, delete, size=CHUNK_SIZE,
+                 radius=CHUNK_RADIUS, pinned_types=PINNED_TYPES):
+        """Index the chunks of a map; no chunk is loaded yet.
+           @type compiled: dict
+           @param compiled: The compiled map
+           @type layers: list
+           @param layers: (compiled layer, layer object) for every layer
+                          that was created
+           @type create: function
+           @param create: Called with a layer object and the values of an
+                          instance (see mapcache.iterInstances), creates
+                          the instance and returns it, or None if there
+                          is none (any more): those are not kept, so they
+                          are never deleted
+           @type delete: function
+           @param delete: Called with a layer object and an instance,
+                          deletes the instance
+           @type size: integer
+           @param size: Chunk edge in cells
+           @type radius: integer
+           @param radius: Chunks kept around the chunk of the PC
+           @type pinned_types: tuple
+           @param pinned_types: PARPG object types that are not chunked"""
+        self.compiled = compiled
+        self.create = create
+        self.delete = delete
+        self.size = size
+        self.radius = radius
+        self.pinned_types = pinned_types
+        # chunk key -> [(compiled layer, PARPG values by index, layer
+        # object, instance indices)]
+        self.chunks = {}
+        # chunk key -> [(layer object, instance)] of the loaded chunks
+        self.loaded = {}
+        # the chunk the PC was in at the last update
+        self.center = None
+        self.stats = {'loaded': 0, 'unloaded': 0, 'created': 0,
+                      'deleted': 0}
+        self.layers = layers
+        for layer, layer_obj in layers:
+            parpg = dict(layer[2])
+            pinned = pinnedIndices(layer, pinned_types)
+            for key, indices in indexLayer(layer, size, pinned).iteritems():
+                self.chunks.setdefault(key, []).append((layer, parpg,
+                                                        layer_obj, indices))
+
+    def pinnedInstances(self):
+        """Iterate over (layer object, instance values) of the instances
+           that are not chunked; the loader creates those right away."""
+        for layer, layer_obj in self.layers:
+            for n in sorted(pinnedIndices(layer, self.pinned_types)):
+                yield layer_obj, instanceAt(self.compiled, layer, n)
+
+    def update(self, x, y):
+        """Load the chunks around a position and unload the others. Does
+           nothing while the position stays in the same chunk.
+           @type x: float
+           @param x: Layer x coordinate of the PC
+           @type y: float
+           @param y: Layer y coordinate of the PC
+           @rtype: list
+           @return: Ids of the instances that were deleted"""
+        center = chunkKey(x, y, self.size)
+        if center == self.center:
+            return []
+        self.center = center
+        wanted = chunksAround(center, self.radius)
+        deleted = []
+        for key in self.loaded.keys():
+            if key not in wanted:
+                deleted.extend(self.unloadChunk(key))
+        for key in wanted:
+            if key not in self.loaded and key in self.chunks:
+                self.loadChunk(key)
+        return deleted
+
+    def loadChunk(self, key):
+        """Create the instances of a chunk"""
+        instances = []
+        for layer, parpg, layer_obj, indices in self.chunks[key]:
+            for n in indices:
+                inst = self.create(layer_obj, *instanceAt(self.compiled,
+                                                          layer, n, parpg))
+                if inst is not None:
+                    instances.append((layer_obj, inst))
+        self.loaded[key] = instances
+        self.stats['loaded'] += 1
+        self.stats['created'] += len(instances)
+
+    def unloadChunk(self, key):
+        """Delete the instances of a chunk, returns their ids"""
+        ids = []
+        for layer_obj, inst in self.loaded.pop(key):
+            ids.append(inst.getId())
+            self.delete(layer_obj, inst)
+        self.stats['unloaded'] += 1
+        self.stats['deleted'] += len(ids)
+        return ids
+
+    def loadedInstances(self):
+        """Number of chunked instances in the model right now"""
+        return sum([len(instances) for instances in self.loaded.values()])
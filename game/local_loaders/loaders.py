@@ -16,16 +16,51 @@
 # Most of this code was copied from the FIFE file loaders.py
 # It is part of the local code base now so we customize what happens as 
 # we read map files
-import fife
+import fife, time, os, json
+from multiprocessing.pool import ThreadPool
 
-from xmlmap import XMLMapLoader
+from xmlmap import XMLMapLoader, prepareMap, readMapId, PROFILE_PHASES
 from serializers import WrongFileType, NameClash
 
-from serializers.xmlobject import XMLObjectLoader
+from xmlobject import XMLObjectLoader, parseObjectFile
+from mapjob import MapLoadJob
+from chunks import CHUNK_RADIUS
 
 fileExtensions = ('xml',)
 
-def loadMapFile(path, engine, data, callback=None):
+# number of threads used to read the object files imported by a map
+IMPORT_THREADS = 4
+
+# Import registry. Objects stay registered with the model when the map
+# changes, so every object file only has to be imported once per process:
+# after that, importing it again is answered from here without any I/O.
+# normalized path -> ImportEntry
+_imports = {}
+# hits: imports answered from the registry, misses: files actually loaded,
+# time_saved: seconds the hits took to load the first time
+import_stats = {'hits': 0, 'misses': 0, 'time_saved': 0.0}
+
+# profiles of the last map loads, oldest first (see XMLMapLoader.profile)
+load_profiles = []
+MAX_PROFILES = 20
+# file every profile is appended to as a line of JSON, None for no log
+profile_log = None
+# print every profile as it is recorded; they can always be seen with the
+# profile console command
+print_profiles = False
+
+class ImportEntry(object):
+    """An object file in the import registry"""
+    def __init__(self, path, object, load_time):
+        self.path = path
+        # the object registered from the file, None for non-object files
+        # and objects that already existed
+        self.object = object
+        self.load_time = load_time
+        self.hits = 0
+
+def loadMapFile(path, engine, data, callback=None, chunk_size=0,
+                chunk_radius=CHUNK_RADIUS):
     """     load map file and get (an optional) callback if major stuff is done:
     - map creation
     - parsed impor0ts
@@ -38,19 +73,164 @@ def loadMapFile(path, engine, data, callback=None):
         path = filename for map
         engine = FIFE engine
         data = Engine object for PARPG data
+        chunk_size = load the map in chunks of this many cells, see
+                     chunks.py; the map then has a chunks attribute
+        chunk_radius = chunks to keep around the PC
         
     @return    map    : map object
     """
-    map_loader = XMLMapLoader(engine, data, callback)
+    map_loader = XMLMapLoader(engine, data, callback, chunk_size=chunk_size,
+                              chunk_radius=chunk_radius)
     map = map_loader.loadResource(fife.ResourceLocation(path))
-    print "--- Loading map took: ", map_loader.time_to_load, " seconds."
+    recordProfile(map_loader.profile)
     return map
 
-def loadImportFile(path, engine):
+def loadMapFileAsync(path, engine, data, threaded=True, clock=time.time,
+                     prepared=None, chunk_size=0, chunk_radius=CHUNK_RADIUS):
+    """Start loading a map file in the background, while the current map
+    keeps running. The file is compiled and its imports are read on a
+    worker thread; the map is then built on the main thread in slices of
+    job.step(seconds), which is called once per frame until it returns
+    True. The map has no cameras yet: finishMapFileAsync(job) creates
+    them and returns the map, once it replaces the current map.
+    
+    Inputs:
+        path = filename for map
+        engine = FIFE engine
+        data = Engine object for PARPG data
+        threaded = use a worker thread. If False, the whole load happens
+                   in job.step, which together with a mapjob.SimulatedClock
+                   makes it deterministic
+        clock = function returning the time in seconds
+        prepared = what prepareMapFile returned for path, if the map was
+                   read ahead of time (see mapprefetch.py)
+        chunk_size, chunk_radius = see loadMapFile
+        
+    @return    job    : mapjob.MapLoadJob
+    """
+    map_loader = XMLMapLoader(engine, data, None, chunk_size=chunk_size,
+                              chunk_radius=chunk_radius)
+    if prepared is None:
+        location = fife.ResourceLocation(path)
+        prepare = lambda: map_loader.prepare(location)
+    else:
+        map_loader.begin(path)
+        map_loader.profile['mode'] = 'prefetched'
+        prepare = lambda: prepared
+    job = MapLoadJob(prepare, map_loader.applySteps, threaded, clock)
+    job.loader = map_loader
+    return job
+
+def finishMapFileAsync(job):
+    """Complete a map load started with loadMapFileAsync once its job is
+    done: create the cameras of the map and record the profile of the load.
+    
+    Inputs:
+        job = the finished job
+        
+    @return    map    : map object
+    """
+    job.loader.createCameras()
+    profile = job.loader.profile
+    profile['frames'] = job.frames
+    recordProfile(profile)
+    return job.loader.map
+
+def recordProfile(profile):
+    """Keep the profile of a map load in load_profiles. Print it if
+    print_profiles is set, and append it to profile_log if that is set.
+    
+    Inputs:
+        profile = XMLMapLoader.profile of a finished load
+    """
+    load_profiles.append(profile)
+    del load_profiles[:-MAX_PROFILES]
+    if print_profiles:
+        print formatProfile(profile)
+    if profile_log:
+        try:
+            log = open(profile_log, 'a')
+            try:
+                log.write(json.dumps(profile, sort_keys=True) + '\n')
+            finally:
+                log.close()
+        except IOError, e:
+            print 'Could not write the map load profile to', profile_log, \
+                  '(', e, ')'
+
+def formatProfile(profile, verbose=True):
+    """Describe the profile of a map load.
+    
+    Inputs:
+        profile = XMLMapLoader.profile of a finished load
+        verbose = include layers, lookups, imports and missing objects,
+                  otherwise the result is a single line
+        
+    @return    text    : the description
+    """
+    phases = profile['phases']
+    lines = ["--- Loading map %s took %.3f seconds (%s): %s" % (
+             profile['map'], phases['total'], profile['mode'],
+             ', '.join(["%s %.3f" % (phase, phases[phase])
+                        for phase in PROFILE_PHASES[:-1]]))]
+    if not verbose:
+        return lines[0]
+    for id in sorted(profile['layers']):
+        lines.append("--- Layer %s: %d instances in %.3f seconds" %
+                     (id, profile['instances'][id], profile['layers'][id]))
+    lines.append("--- PARPG objects: %d" % profile['objects'])
+    lookups, imports = profile['lookups'], profile['imports']
+    lines.append("--- Object lookups: %d resolved, %d served from cache." %
+                 (lookups['resolved'], lookups['cached']))
+    lines.append("--- Imports: %d object files, read in %.3f seconds on %d"
+                 " threads, registered in %.3f seconds." %
+                 (imports['files'], imports['read'], IMPORT_THREADS,
+                  imports['register']))
+    lines.append("--- Import registry: %d object files already imported,"
+                 " saving %.3f seconds." %
+                 (imports['registry_hits'], imports['time_saved']))
+    for object, count in sorted(profile['not_found'].items()):
+        lines.append("--- Not found: %s (%d instances)" % (object, count))
+    return '\n'.join(lines)
+
+def prepareMapFile(path):
+    """Read a map file and the object files it imports ahead of time, for
+    loadMapFileAsync. This needs no engine, so it can run on any thread.
+    
+    Inputs:
+        path = filename for map
+        
+    @return    prepared    : the data to pass to loadMapFileAsync
+    """
+    return prepareMap(path)
+
+def loadImportFile(path, engine, desc=None, read_time=0.0):
+    """Register the object of an object file with the model. Files that
+    are in the import registry are not read again.
+    
+    Inputs:
+        path = filename of the object file
+        engine = FIFE engine
+        desc = descriptor of the object file, as read by prefetchImports.
+               If it is not given, the file is read now.
+        read_time = seconds it took to read desc
+    """
+    key = normalizeImportPath(path)
+    entry = _imports.get(key)
+    if entry is not None:
+        entry.hits += 1
+        import_stats['hits'] += 1
+        import_stats['time_saved'] += entry.load_time
+        return entry.object
+
+    start = time.time()
     object_loader = XMLObjectLoader(engine.getImagePool(), engine.getAnimationPool(), engine.getModel(), engine.getVFS())
     res = None
     try:
-        res = object_loader.loadResource(fife.ResourceLocation(path))
+        if desc is None:
+            res = object_loader.loadResource(fife.ResourceLocation(path))
+        else:
+            res = object_loader.registerObject(desc)
         print 'imported object file ' + path
     except WrongFileType:
         pass
@@ -58,4 +238,86 @@ def loadImportFile(path, engine):
     except NameClash:
         pass
 #        print 'ignored already loaded file ' + path
+    import_stats['misses'] += 1
+    _imports[key] = ImportEntry(key, res, read_time + time.time() - start)
     return res
+
+def normalizeImportPath(path):
+    """The key of an object file in the import registry"""
+    return os.path.normpath(path).replace(os.path.sep, '/')
+
+def isImported(path):
+    """Whether an object file is in the import registry"""
+    return normalizeImportPath(path) in _imports
+
+def listImports():
+    """List the import registry.
+    
+    @return    list   : ImportEntry for each imported file, sorted by path
+    """
+    return [_imports[key] for key in sorted(_imports)]
+
+def evictImports(paths=None):
+    """Remove object files from the import registry, so that they are read
+    again the next time they are imported. This does not remove their
+    objects from the model; after model.deleteObjects() the whole registry
+    has to be evicted.
+    
+    Inputs:
+        paths = files to remove; all of them if None
+    """
+    if paths is None:
+        _imports.clear()
+        return
+    for path in paths:
+        _imports.pop(normalizeImportPath(path), None)
+
+def prewarmImports(paths, engine):
+    """Import object files ahead of time, e.g. those of a map that is
+    likely to be loaded next. Files that are already imported are skipped.
+    
+    Inputs:
+        paths = object files to import
+        engine = FIFE engine
+        
+    @return    int    : number of files that were imported
+    """
+    paths = [path for path in paths if not isImported(path)]
+    prefetched = prefetchImports(paths)
+    for path in paths:
+        desc, read_time = prefetched[path]
+        if isinstance(desc, Exception):
+            desc = None
+        loadImportFile(path, engine, desc, read_time)
+    return len(paths)
+
+def _readImport(path):
+    """Worker of prefetchImports: read one object file"""
+    start = time.time()
+    try:
+        desc = parseObjectFile(path)
+    except Exception, e:
+        desc = e
+    return path, desc, time.time() - start
+
+def prefetchImports(paths, threads=IMPORT_THREADS):
+    """Read and parse object files concurrently, without touching the
+    engine. The descriptors can then be registered with loadImportFile.
+
+    Inputs:
+        paths = list of object files
+        threads = number of reader threads
+
+    @return    dict   : path -> (descriptor, or the exception raised while
+                        reading the file, seconds spent reading it)
+    """
+    if threads < 2 or len(paths) < 2:
+        results = [_readImport(path) for path in paths]
+    else:
+        pool = ThreadPool(min(threads, len(paths)))
+        try:
+            results = pool.map(_readImport, paths)
+        finally:
+            pool.close()
+            pool.join()
+    return dict([(path, (desc, seconds)) for path, desc, seconds in results])
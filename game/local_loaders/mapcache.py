@@ -0,0 +1,390 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compiled map cache.
+# Reading a map means parsing the XML and converting every attribute of
+# every instance, even though the map files hardly ever change. This module
+# turns a map file into a compiled form (layer, import and camera attributes
+# plus the instances packed into flat arrays) and keeps it in a cache file
+# next to the map, so later loads can skip the XML completely.
+# The cache is keyed on the map's path, modification time and size and on
+# the map FORMAT, so a stale cache is never used.
+# There are NO references to FIFE here, so this also works as a tool:
+
+# usage: mapcache.py [-f] [map file or directory ...]
+# compiles every given map (default: all maps in maps/). -f rebuilds caches
+# that are still up to date.
+
+import sys, os, marshal
+from array import array
+try:
+    import xml.etree.cElementTree as ET
+except:
+    import xml.etree.ElementTree as ET
+
+FORMAT = '1.0'
+
+# bump this whenever the layout of the compiled data changes
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.cache'
+
+# stored in the integer columns when the attribute was not given
+NO_VALUE = -2**31
+
+# the different spellings FIFE accepts for an instance element
+INSTANCE_TAGS = ('i', 'inst', 'instance')
+
+# PARPG object attributes read from instances that have an object_type
+PARPG_ATTRIBUTES = ('object_type', 'is_open', 'locked', 'name', 'text')
+
+# the instance columns and their array type codes
+COLUMNS = (('object', 'i'), ('namespace', 'i'), ('x', 'd'), ('y', 'd'),
+           ('z', 'd'), ('rotation', 'i'), ('stackpos', 'i'), ('id', 'i'))
+
+def _raise(msg):
+    raise SyntaxError(msg)
+
+class InstanceReader(object):
+    """Turns instance elements into plain values. Keeps track of the
+       values an instance inherits from the ones before it (namespace and
+       coordinates)."""
+    def __init__(self, err=_raise):
+        """@type err: function
+           @param err: Called with a message when an instance is invalid"""
+        self.err = err
+        self.nspace = None
+        self.x = 0.0
+        self.y = 0.0
+
+    def read(self, instance):
+        """Read an instance element.
+           @type instance: Element
+           @param instance: The <i> element
+           @rtype: tuple
+           @return: (object id, namespace, x, y, z, rotation, stackpos, id,
+                     PARPG attributes). Rotation and stackpos are None when
+                     not given, PARPG attributes is None for plain instances
+                     and a tuple ordered as PARPG_ATTRIBUTES otherwise."""
+        objectID = instance.get('object')
+        if not objectID:
+            objectID = instance.get('obj')
+        if not objectID:
+            objectID = instance.get('o')
+
+        if not objectID: self.err('<instance> does not specify an object attribute.')
+
+        nspace = instance.get('namespace')
+        if not nspace:
+            nspace = instance.get('ns')
+        if not nspace:
+            nspace = self.nspace
+
+        if not nspace: self.err('<instance> %s does not specify an object namespace, and no default is available.' % str(objectID))
+
+        self.nspace = nspace
+
+        x = instance.get('x')
+        y = instance.get('y')
+        z = instance.get('z')
+        stackpos = instance.get('stackpos')
+        id = instance.get('id')
+
+        if x:
+            x = float(x)
+            self.x = x
+        else:
+            self.x = self.x + 1
+            x = self.x
+
+        if y:
+            y = float(y)
+            self.y = y
+        else:
+            y = self.y
+
+        if z:
+            z = float(z)
+        else:
+            z = 0.0
+
+        if not id:
+            id = ''
+        else:
+            id = str(id)
+
+        rotation = instance.get('r')
+        if not rotation:
+            rotation = instance.get('rotation')
+        if rotation:
+            rotation = int(rotation)
+        else:
+            rotation = None
+
+        if stackpos:
+            stackpos = int(stackpos)
+        else:
+            stackpos = None
+
+        parpg = None
+        if instance.get('object_type'):
+            parpg = tuple([instance.get(a) for a in PARPG_ATTRIBUTES])
+
+        return (str(objectID), str(nspace), x, y, z, rotation, stackpos, id,
+                parpg)
+
+class _StringTable(object):
+    """Maps strings to their index in a list, adding them as needed"""
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, string):
+        try:
+            return self.index[string]
+        except KeyError:
+            self.index[string] = len(self.strings)
+            self.strings.append(string)
+            return self.index[string]
+
+def compileMap(filename, f=None):
+    """Compile a map file. The file is streamed, so it is never held in
+       memory as a whole.
+       @type filename: string
+       @param filename: Map file to compile
+       @type f: file
+       @param f: Open file to read filename from, instead of opening it
+       @rtype: dict
+       @return: The compiled map"""
+    def err(msg):
+        raise SyntaxError(''.join(['File: ', filename, ' . ', msg]))
+
+    reader = InstanceReader(err)
+    strings = _StringTable()
+    compiled = {'imports': [], 'layers': [], 'cameras': [],
+                'strings': strings.strings}
+    map_elt = None
+    columns = None
+    parpg = None
+    in_instances = False
+
+    if f is None:
+        f = filename
+    for event, elt in ET.iterparse(f, events=('start', 'end')):
+        tag = elt.tag
+        if event == 'start':
+            if map_elt is None:
+                if tag != 'map':
+                    err('No <map> element found at top level of map file definition.')
+                map_elt = elt
+                compiled['map'] = dict(elt.attrib)
+            elif tag == 'layer':
+                columns = dict([(name, array(code)) for name, code in COLUMNS])
+                parpg = []
+                compiled['layers'].append((dict(elt.attrib), columns, parpg))
+            elif tag == 'instances':
+                in_instances = True
+            continue
+
+        if tag in INSTANCE_TAGS and in_instances and columns is not None:
+            objectID, nspace, x, y, z, rotation, stackpos, id, attrs = \
+                reader.read(elt)
+            if attrs is not None:
+                parpg.append((len(columns['x']), attrs))
+            columns['object'].append(strings.add(objectID))
+            columns['namespace'].append(strings.add(nspace))
+            columns['x'].append(x)
+            columns['y'].append(y)
+            columns['z'].append(z)
+            columns['rotation'].append(NO_VALUE if rotation is None
+                                       else rotation)
+            columns['stackpos'].append(NO_VALUE if stackpos is None
+                                       else stackpos)
+            columns['id'].append(strings.add(id))
+            elt.clear()
+        elif tag == 'instances':
+            in_instances = False
+            elt.clear()
+        elif tag == 'import':
+            compiled['imports'].append(dict(elt.attrib))
+        elif tag == 'layer':
+            columns = None
+            elt.clear()
+        elif tag == 'camera':
+            compiled['cameras'].append(dict(elt.attrib))
+
+    if map_elt is None:
+        err('No <map> element found at top level of map file definition.')
+    return compiled
+
+def iterInstances(compiled, layer):
+    """Iterate over the instances of a compiled layer. The values are
+       the same as those returned by InstanceReader.read.
+       @type compiled: dict
+       @param compiled: The compiled map
+       @type layer: tuple
+       @param layer: One of the entries of compiled['layers']"""
+    strings = compiled['strings']
+    attrs, columns, parpg = layer
+    parpg = dict(parpg)
+    objects, nspaces, ids = columns['object'], columns['namespace'], \
+                            columns['id']
+    xs, ys, zs = columns['x'], columns['y'], columns['z']
+    rotations, stackposs = columns['rotation'], columns['stackpos']
+    for n in xrange(len(xs)):
+        rotation = rotations[n]
+        if rotation == NO_VALUE:
+            rotation = None
+        stackpos = stackposs[n]
+        if stackpos == NO_VALUE:
+            stackpos = None
+        yield (strings[objects[n]], strings[nspaces[n]], xs[n], ys[n],
+               zs[n], rotation, stackpos, strings[ids[n]], parpg.get(n))
+
+def instanceAt(compiled, layer, n, parpg=None):
+    """The values of instance n of a compiled layer, as yielded by
+       iterInstances.
+       @type parpg: dict
+       @param parpg: dict(layer[2]); pass it in when getting many
+                     instances of the same layer"""
+    strings = compiled['strings']
+    attrs, columns, parpg_list = layer
+    if parpg is None:
+        parpg = dict(parpg_list)
+    rotation = columns['rotation'][n]
+    if rotation == NO_VALUE:
+        rotation = None
+    stackpos = columns['stackpos'][n]
+    if stackpos == NO_VALUE:
+        stackpos = None
+    return (strings[columns['object'][n]], strings[columns['namespace'][n]],
+            columns['x'][n], columns['y'][n], columns['z'][n], rotation,
+            stackpos, strings[columns['id'][n]], parpg.get(n))
+
+def instanceCount(compiled):
+    """Total number of instances in a compiled map"""
+    return sum([len(columns['x']) for attrs, columns, parpg
+                in compiled['layers']])
+
+def cacheFile(filename):
+    """Name of the cache file of a map file"""
+    return filename + CACHE_SUFFIX
+
+def cacheKey(filename):
+    """The key a cache file must carry to be valid for a map file"""
+    stat = os.stat(filename)
+    return (os.path.normcase(os.path.abspath(filename)), int(stat.st_mtime),
+            stat.st_size, FORMAT, CACHE_VERSION)
+
+def writeCache(filename, compiled):
+    """Write the cache file for a map file. The file is replaced
+       atomically, so readers never see half a cache.
+       @type filename: string
+       @param filename: The map file the data was compiled from
+       @type compiled: dict
+       @param compiled: The compiled map
+       @return: None"""
+    layers = []
+    for attrs, columns, parpg in compiled['layers']:
+        packed = dict([(name, (column.typecode, column.tostring()))
+                       for name, column in columns.items()])
+        layers.append((attrs, packed, parpg))
+    data = dict(compiled)
+    data['layers'] = layers
+
+    target = cacheFile(filename)
+    temp = target + '.tmp'
+    out = open(temp, 'wb')
+    try:
+        marshal.dump(cacheKey(filename), out)
+        marshal.dump(data, out)
+    finally:
+        out.close()
+    if os.path.exists(target):
+        # rename() will not replace a file on windows
+        os.remove(target)
+    os.rename(temp, target)
+
+def readCache(filename):
+    """Read the cache file for a map file.
+       @type filename: string
+       @param filename: The map file
+       @rtype: dict
+       @return: The compiled map, or None if there is no valid cache"""
+    try:
+        cache = open(cacheFile(filename), 'rb')
+    except IOError:
+        return None
+    try:
+        try:
+            if marshal.load(cache) != cacheKey(filename):
+                return None
+            data = marshal.load(cache)
+        except (EOFError, ValueError, TypeError, OSError):
+            return None
+    finally:
+        cache.close()
+
+    layers = []
+    for attrs, packed, parpg in data['layers']:
+        columns = {}
+        for name, (typecode, raw) in packed.items():
+            columns[name] = array(typecode)
+            columns[name].fromstring(raw)
+        layers.append((attrs, columns, parpg))
+    data['layers'] = layers
+    return data
+
+def loadCompiled(filename):
+    """Get the compiled form of a map, from the cache if it is up to date,
+       otherwise by compiling the map and updating the cache.
+       @type filename: string
+       @param filename: The map file
+       @rtype: dict
+       @return: The compiled map, or None if the map file cannot be read
+                directly (e.g. because it only exists in the VFS)"""
+    if not os.path.isfile(filename):
+        return None
+    compiled = readCache(filename)
+    if compiled is None:
+        compiled = compileMap(filename)
+        try:
+            writeCache(filename, compiled)
+        except (IOError, OSError), e:
+            print 'Could not write map cache for', filename, ':', e
+    return compiled
+
+def buildCaches(paths, force=False):
+    """Compile every map in paths, which can be map files or directories
+       @return: List of the map files that were compiled"""
+    built = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                     if f.endswith('.xml') and not f.endswith('_objects.xml')]
+        else:
+            files = [path]
+        for filename in files:
+            if not force and readCache(filename) is not None:
+                continue
+            writeCache(filename, compileMap(filename))
+            built.append(filename)
+    return built
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    force = '-f' in args
+    args = [a for a in args if a != '-f'] or ['maps']
+    for filename in buildCaches(args, force):
+        print 'Compiled', filename
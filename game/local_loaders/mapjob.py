@@ -0,0 +1,117 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Background map loading.
+# A map is loaded in two stages. The prepare stage does the file I/O and
+# parsing and produces plain python data; it runs on a worker thread while
+# the current map keeps running. The apply stage puts that data into the
+# engine, which has to happen on the main thread; it is a generator, and is
+# run in bounded time slices, one per frame, until it is exhausted.
+# There are NO references to FIFE here.
+
+import sys, time, threading
+
+class SimulatedClock(object):
+    """Clock for deterministic loading (e.g. in tests): time only passes
+       when the clock is read, by the same amount every time. A job stepped
+       with this clock and without a thread always needs the same number of
+       frames."""
+    def __init__(self, tick=0.001):
+        """@type tick: float
+           @param tick: Seconds that pass with every reading"""
+        self.tick = tick
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += self.tick
+        return self.now
+
+class MapLoadJob(object):
+    """A map load running in the background"""
+    def __init__(self, prepare, apply, threaded=True, clock=time.time):
+        """Start the job; with threaded set the prepare stage starts running
+           right away.
+           @type prepare: function
+           @param prepare: Called without arguments, returns the prepared
+                           data. Must not touch the engine.
+           @type apply: function
+           @param apply: Called with the prepared data on the main thread,
+                         returns a generator that applies it and yields
+                         (text, fraction) progress tuples
+           @type threaded: boolean
+           @param threaded: Run the prepare stage on a worker thread. If
+                            False it runs during the first step().
+           @type clock: function
+           @param clock: Returns the current time in seconds"""
+        self.prepare = prepare
+        self.apply = apply
+        self.clock = clock
+        # the latest (text, fraction) progress; the HUD can display this
+        self.progress = ('preparing map', 0.0)
+        self.done = False
+        # number of step() calls (i.e. frames) the job took
+        self.frames = 0
+
+        self._prepared = None
+        self._exc_info = None
+        self._steps = None
+        self._thread = None
+        if threaded:
+            self._thread = threading.Thread(target=self._prepare)
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def _prepare(self):
+        try:
+            self._prepared = self.prepare()
+        except:
+            self._exc_info = sys.exc_info()
+
+    def step(self, budget):
+        """Run the apply stage for about budget seconds. Errors raised by
+           either stage are raised from here.
+           @type budget: float
+           @param budget: Seconds this step may take
+           @rtype: boolean
+           @return: True once the job is finished"""
+        if self.done:
+            return True
+        self.frames += 1
+        if self._steps is None:
+            if self._thread is None:
+                self._prepare()
+            elif self._thread.isAlive():
+                return False
+            if self._exc_info is not None:
+                self.done = True
+                exc_info, self._exc_info = self._exc_info, None
+                raise exc_info[0], exc_info[1], exc_info[2]
+            self._steps = self.apply(self._prepared)
+            self._prepared = None
+
+        deadline = self.clock() + budget
+        for self.progress in self._steps:
+            if self.clock() >= deadline:
+                return False
+        self.done = True
+        self.progress = ('map loaded', 1.0)
+        return True
+
+    def finish(self):
+        """Run the job to completion, e.g. when it is no longer wanted in
+           the background."""
+        while not self.step(1.0):
+            if self._thread is not None and self._steps is None:
+                self._thread.join()
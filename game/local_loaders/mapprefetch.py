@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Adjacent map prefetching.
+# The doors of a map (the <door map="..."> elements of its _objects.xml
+# file) name every map the player can walk to next. While the game is
+# idle, MapPrefetcher prepares those maps on a worker thread (see
+# loaders.prepareMapFile) and keeps the results in a least recently used
+# cache with a memory budget, so a map change through a door only has to
+# create the instances.
+# There are NO references to FIFE here.
+
+import os, threading
+from collections import OrderedDict
+try:
+    import xml.etree.cElementTree as ET
+except:
+    import xml.etree.ElementTree as ET
+
+# default memory budget of the prefetch cache, in bytes
+DEFAULT_BUDGET = 32 * 1024 * 1024
+
+# rough sizes used by estimateSize, in bytes
+ENTRY_OVERHEAD = 64
+DESCRIPTOR_SIZE = 1024
+
+def objectsFile(map_file):
+    """Name of the _objects.xml file belonging to a map file"""
+    return os.path.splitext(map_file)[0] + '_objects.xml'
+
+def doorTargets(map_file):
+    """Maps that can be reached through the doors of a map.
+       @type map_file: string
+       @param map_file: The map file
+       @rtype: list
+       @return: The target map files, in the order of the doors"""
+    path = objectsFile(map_file)
+    targets = []
+    if not os.path.isfile(path):
+        return targets
+    for event, elt in ET.iterparse(path):
+        if elt.tag == 'door':
+            target = elt.get('map')
+            if target and target not in targets:
+                targets.append(target)
+        elt.clear()
+    return targets
+
+def estimateSize(prepared):
+    """Estimate the memory taken by a prepared map, in bytes.
+       @type prepared: tuple
+       @param prepared: What loaders.prepareMapFile returned"""
+    compiled, prefetched = prepared
+    size = ENTRY_OVERHEAD
+    if compiled is not None:
+        size += sum([len(string) + ENTRY_OVERHEAD
+                     for string in compiled['strings']])
+        for attrs, columns, parpg in compiled['layers']:
+            size += sum([column.itemsize * len(column)
+                         for column in columns.values()])
+            size += ENTRY_OVERHEAD * len(parpg)
+        size += ENTRY_OVERHEAD * (len(compiled['imports']) +
+                                  len(compiled['cameras']))
+    if prefetched:
+        size += DESCRIPTOR_SIZE * len(prefetched)
+    return size
+
+class MapPrefetcher(object):
+    """Prepares the maps next to the current one ahead of time"""
+    def __init__(self, prepare, budget=DEFAULT_BUDGET, targets=doorTargets):
+        """@type prepare: function
+           @param prepare: Called with a map file on a worker thread,
+                           returns the prepared map
+           @type budget: integer
+           @param budget: Bytes the prepared maps may take (estimated)
+           @type targets: function
+           @param targets: Returns the maps next to a map file"""
+        self.prepare = prepare
+        self.budget = budget
+        self.targets = targets
+        # map file -> (prepared map, size), least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        # map files waiting to be prefetched
+        self.pending = []
+        # hits/misses: map changes that did/did not find their map here
+        self.stats = {'hits': 0, 'misses': 0, 'prefetched': 0,
+                      'evicted': 0, 'failed': 0}
+
+        self._thread = None
+        self._current = None
+        self._result = None
+
+    def prefetchDoors(self, map_file):
+        """Queue the maps reachable through the doors of a map, replacing
+           whatever was queued before.
+           @type map_file: string
+           @param map_file: The map the player is on now"""
+        current = os.path.normpath(map_file)
+        try:
+            targets = self.targets(map_file)
+        except Exception, e:
+            print 'Could not read the doors of', map_file, '(', e, ')'
+            targets = []
+        self.pending = []
+        for target in targets:
+            target = os.path.normpath(target)
+            if target != current and target not in self.entries and \
+                    target not in self.pending:
+                self.pending.append(target)
+
+    def pump(self):
+        """Do the prefetching; call this once per frame while the game is
+           idle. Stores a map that has been prepared and starts on the next.
+           @rtype: boolean
+           @return: True while there is work left"""
+        if self._thread is not None:
+            if self._thread.isAlive():
+                return True
+            self._collect()
+        while self.pending:
+            filename = self.pending.pop(0)
+            if filename in self.entries:
+                continue
+            self._current = filename
+            self._thread = threading.Thread(target=self._prepare,
+                                            args=(filename,))
+            self._thread.setDaemon(True)
+            self._thread.start()
+            return True
+        return False
+
+    def _prepare(self, filename):
+        try:
+            self._result = self.prepare(filename)
+        except Exception, e:
+            self._result = e
+
+    def _collect(self):
+        """Store the result of the finished worker thread"""
+        filename, prepared = self._current, self._result
+        self._thread, self._current, self._result = None, None, None
+        if isinstance(prepared, Exception):
+            print 'Could not prefetch', filename, '(', prepared, ')'
+            self.stats['failed'] += 1
+            return
+        size = estimateSize(prepared)
+        if size > self.budget:
+            print 'Not prefetching', filename, ': it needs', size, \
+                  'bytes, the budget is', self.budget
+            return
+        self.entries[filename] = (prepared, size)
+        self.size += size
+        self.stats['prefetched'] += 1
+        self.evict()
+
+    def evict(self, budget=None):
+        """Drop least recently used maps until they fit the budget.
+           @type budget: integer
+           @param budget: Bytes to fit in, default self.budget"""
+        if budget is None:
+            budget = self.budget
+        while self.size > budget and self.entries:
+            filename, (prepared, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.stats['evicted'] += 1
+
+    def take(self, map_file):
+        """Get the prepared data of a map the player is changing to. A map
+           that is still being prefetched is waited for. Counts a hit or a
+           miss.
+           @type map_file: string
+           @param map_file: The map being changed to
+           @return: The prepared map, None if it was not prefetched"""
+        filename = os.path.normpath(map_file)
+        if self._current == filename:
+            self._thread.join()
+            self._collect()
+        entry = self.entries.pop(filename, None)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        # still the most recently used: the player may well come back
+        self.entries[filename] = entry
+        self.stats['hits'] += 1
+        return entry[0]
+
+    def hitRate(self):
+        """Fraction of the map changes that found their map prefetched"""
+        total = self.stats['hits'] + self.stats['misses']
+        if not total:
+            return 0.0
+        return float(self.stats['hits']) / total
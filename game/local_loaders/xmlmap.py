@@ -24,24 +24,114 @@ except:
     import xml.etree.ElementTree as ET
 
 import loaders
+import mapcache
+from mapcache import FORMAT, INSTANCE_TAGS, InstanceReader
+from chunks import ChunkedMap, CHUNK_RADIUS
 from serializers import *
 import time
 
-FORMAT = '1.0'
+# number of instances between two progress callbacks when streaming a layer
+PROGRESS_INTERVAL = 500
+
+# the phases timed in XMLMapLoader.profile:
+# read: reading the map file, or its compiled form
+# parse: parsing the XML. When streaming, the parts of it that happen
+#        outside of the layers; the rest is in the layer times
+# imports: reading and registering the imported object files
+# layers: creating the layers and their instances
+# instances: the part of layers spent on the instances themselves
+# objects: the part of layers spent creating PARPG objects
+#          (Engine.createObjects)
+# cameras: creating the cameras
+# total: the whole load
+PROFILE_PHASES = ('read', 'parse', 'imports', 'layers', 'instances',
+                  'objects', 'cameras', 'total')
+
+def prefetchMapImports(source, items):
+    """Read the object files imported by items of the map file source on
+    worker threads (see loaders.prefetchImports), leaving out the files
+    that are already in the import registry.
+    Returns {file: (descriptor, seconds)}."""
+    files = []
+    for item in items:
+        if item.get('file') and not item.get('dir'):
+            file = reverse_root_subfile(source, item.get('file'))
+            # files imported by an earlier map need no reading at all
+            if not loaders.isImported(file):
+                files.append(file)
+    try:
+        return loaders.prefetchImports(files)
+    except Exception, e:
+        print 'Could not prefetch imports, loading them one by one:', e
+        return {}
+
+def prepareMap(source):
+    """The engine-free part of loading the map file source, as done by
+    XMLMapLoader.prepare; it can run on any thread. Returns (compiled
+    map, prefetched imports); both are None if the map is not a plain
+    file."""
+    compiled = mapcache.loadCompiled(source)
+    prefetched = None
+    if compiled is not None:
+        prefetched = prefetchMapImports(source, compiled['imports'])
+    return compiled, prefetched
+
+def readMapId(source):
+    """Read the id of the map declared in the map file source, without
+    loading the map. Returns None if the file can only be read through
+    the VFS or does not start with a <map> element."""
+    try:
+        f = open(source, 'rb')
+    except IOError:
+        return None
+    try:
+        try:
+            for event, elt in ET.iterparse(f, ('start',)):
+                if elt.tag == 'map':
+                    return elt.get('id')
+                return None
+        except SyntaxError:
+            return None
+    finally:
+        f.close()
 
 class XMLMapLoader(fife.ResourceLoader):
-    def __init__(self, engine, data, callback):
+    def __init__(self, engine, data, callback, streaming=True,
+                 progress_interval=PROGRESS_INTERVAL, use_cache=True,
+                 chunk_size=0, chunk_radius=CHUNK_RADIUS):
         """ The XMLMapLoader parses the xml map using several section. 
         Each section fires a callback (if given) which can e. g. be
         used to show a progress bar.
         
         The callback sends two values, a string and a float (which shows
         the overall process): callback(string, float)
+
+        In streaming mode the map is read with iterparse: every instance
+        is created as soon as its element has been read and is then
+        thrown away, so the whole document is never held in memory.
+        Streaming also fires a callback every progress_interval instances.
+
+        If use_cache is set, the map is built from its compiled form (see
+        mapcache.py) when the map file can be read directly; the XML is
+        then only parsed when the cache is missing or out of date.
+
+        Objects are looked up once per load (see lookupObject); the
+        object_cache_hits and object_cache_misses counters show how many
+        lookups the cache saved.
+
+        With a chunk_size, the map is chunked (see chunks.py): only the
+        actors are created at load time, the other instances are left to
+        map.chunks, which creates the chunks around the PC as it moves.
         
         Inputs:
             engine = FIFE engine
             data = Engine object for PARPG data
             callback = function callback
+            streaming = read the map incrementally instead of as a tree
+            progress_interval = instances between two progress callbacks
+            use_cache = load the map through the compiled map cache
+            chunk_size = chunk edge in cells, 0 to create every instance
+            chunk_radius = chunks kept around the chunk of the PC
         """
         fife.ResourceLoader.__init__(self)
         self.thisown = 0
@@ -57,27 +147,365 @@ class XMLMapLoader(fife.ResourceLoader):
         self.map = None
         self.source = None
         self.time_to_load = 0
-
-        self.nspace = None
+        self.streaming = streaming
+        self.progress_interval = progress_interval
+        self.use_cache = use_cache
+        self.chunk_size = chunk_size
+        self.chunk_radius = chunk_radius
+
+        self.reader = None
+        self.import_timings = []
+        self.object_cache = {}
+        self.object_cache_hits = 0
+        self.object_cache_misses = 0
+        # cameras of a background load, see applySteps
+        self.compiled_cameras = []
+        # PARPG objects of the layer being built, created together by
+        # flushObjects; None while they are created one at a time
+        self.layer_objects = None
+        # what the last load spent its time on, see begin
+        self.profile = None
+        self.start_time = 0.0
+        self.import_stats_start = None
 
     def _err(self, msg):
         raise SyntaxError(''.join(['File: ', self.source, ' . ', msg]))
 
+    def begin(self, source):
+        """Reset the per-load state for loading the map file source."""
+        self.source = source
+        self.reader = InstanceReader(self._err)
+        self.import_timings = []
+        self.object_cache = {}
+        self.object_cache_hits = 0
+        self.object_cache_misses = 0
+        self.compiled_cameras = []
+        self.layer_objects = None
+        self.start_time = time.time()
+        self.import_stats_start = dict(loaders.import_stats)
+        # phases: seconds per PROFILE_PHASES entry, layers: seconds per
+        # layer, instances: instance count per layer, not_found: instances
+        # per object that could not be found, objects: PARPG objects created
+        self.profile = {'map': source, 'mode': None,
+                        'phases': dict.fromkeys(PROFILE_PHASES, 0.0),
+                        'layers': {}, 'instances': {}, 'not_found': {},
+                        'objects': 0}
+
+    def _phase(self, phase, start):
+        """Add the time since start to a phase of the profile"""
+        self.profile['phases'][phase] += time.time() - start
+
+    def _layerDone(self, id, count, seconds):
+        """Record the profile of a layer"""
+        self.profile['layers'][str(id)] = seconds
+        self.profile['instances'][str(id)] = count
+        self.profile['phases']['layers'] += seconds
+
+    def finishProfile(self):
+        """Complete the profile at the end of a load. Besides the phases it
+        then holds the object lookups (resolved through the model or
+        served from the per-load cache) and the imports (object files
+        loaded, seconds reading and registering them, files answered from
+        the import registry and the seconds that saved). Returns the
+        profile."""
+        profile = self.profile
+        phases = profile['phases']
+        phases['total'] = time.time() - self.start_time
+        phases['instances'] = max(phases['layers'] - phases['objects'], 0.0)
+        if profile['mode'] == 'streaming':
+            phases['parse'] = max(phases['total'] - phases['read'] -
+                                  phases['imports'] - phases['layers'] -
+                                  phases['cameras'], 0.0)
+        profile['lookups'] = {'resolved': self.object_cache_misses,
+                              'cached': self.object_cache_hits}
+        start, stats = self.import_stats_start, loaders.import_stats
+        profile['imports'] = {
+            'files': len(self.import_timings),
+            'read': sum([t[1] for t in self.import_timings]),
+            'register': sum([t[2] for t in self.import_timings]),
+            'registry_hits': stats['hits'] - start['hits'],
+            'time_saved': stats['time_saved'] - start['time_saved']}
+        self.time_to_load = phases['total']
+        return profile
+
     def loadResource(self, location):
-        start_time = time.time()
-        self.source = location.getFilename()
-        f = self.vfs.open(self.source)
-        f.thisown = 1
-        tree = ET.parse(f)
-        root = tree.getroot()
-            
-        map = self.parseMap(root)
-        self.time_to_load = time.time() - start_time
+        self.begin(location.getFilename())
+        compiled = None
+        if self.use_cache:
+            start = time.time()
+            compiled = mapcache.loadCompiled(self.source)
+            self._phase('read', start)
+        if compiled is None and self.chunk_size:
+            # chunks are made from the compiled form
+            start = time.time()
+            f = self.vfs.open(self.source)
+            f.thisown = 1
+            compiled = mapcache.compileMap(self.source, f)
+            self._phase('parse', start)
+        if compiled is not None:
+            self.profile['mode'] = 'cache'
+            map = self.buildMap(compiled)
+        else:
+            start = time.time()
+            f = self.vfs.open(self.source)
+            f.thisown = 1
+            self._phase('read', start)
+            if self.streaming:
+                self.profile['mode'] = 'streaming'
+                map = self.streamMap(f)
+            else:
+                self.profile['mode'] = 'tree'
+                start = time.time()
+                tree = ET.parse(f)
+                root = tree.getroot()
+                self._phase('parse', start)
+                map = self.parseMap(root)
+        self.finishProfile()
         return map
 
     def parseMap(self, map_elt):
         if not map_elt:
             self._err('No <map> element found at top level of map file definition.')
+        if not self.createMap(map_elt):
+            return None
+
+        self.parseImports(map_elt, self.map)
+        
+        self.parseLayers(map_elt, self.map)    
+        
+        self.parseCameras(map_elt, self.map)
+
+        return self.map
+
+    def streamMap(self, f):
+        """Incremental version of parseMap. The map is read element by
+        element; imports, layers and cameras are handled as soon as they
+        have been read, and each instance is created (and its element
+        discarded) as soon as it has been read."""
+        map_elt = None
+        instances_elt = None
+        layer_obj = None
+        layer_id = None
+        imports = []
+        imports_done = False
+        count = 0
+
+        for event, elt in ET.iterparse(f, events=('start', 'end')):
+            tag = elt.tag
+            if event == 'start':
+                if map_elt is None:
+                    if tag != 'map':
+                        self._err('No <map> element found at top level of map file definition.')
+                    map_elt = elt
+                    if not self.createMap(map_elt):
+                        return None
+                elif tag == 'layer':
+                    if not imports_done:
+                        # all imports come before the first layer
+                        imports_done = True
+                        self.loadImports(imports, self.map)
+                    layer_id = elt.get('id')
+                    layer_start = time.time()
+                    layer_obj = self.parseLayer(elt, self.map)
+                    self.layer_objects = []
+                    count = 0
+                elif tag == 'instances':
+                    instances_elt = elt
+                continue
+
+            if tag in INSTANCE_TAGS and instances_elt is not None:
+                if layer_obj is not None:
+                    self.parseInstance(elt, layer_obj)
+                    count += 1
+                    if self.callback is not None and \
+                            count % self.progress_interval == 0:
+                        self.callback('loaded instances: ' + str(layer_id),
+                                      self._streamProgress(f, 0.5))
+                # the instance has been created, drop its element
+                del instances_elt[:]
+            elif tag == 'instances':
+                instances_elt = None
+            elif tag == 'import':
+                imports.append(dict(elt.attrib))
+                del map_elt[:]
+            elif tag == 'layer':
+                if layer_obj is not None:
+                    self.flushObjects(layer_obj)
+                    self._layerDone(layer_id, count,
+                                    time.time() - layer_start)
+                    if self.callback is not None:
+                        self.callback('loaded layer :' + str(layer_id),
+                                      self._streamProgress(f, 0.5))
+                layer_obj = None
+                del map_elt[:]
+            elif tag == 'camera':
+                start = time.time()
+                self.parseCamera(elt, self.map)
+                self._phase('cameras', start)
+                if self.callback is not None:
+                    self.callback('loaded camera: ' + str(elt.get('id')),
+                                  self._streamProgress(f, 0.75))
+                del map_elt[:]
+
+        if map_elt is None:
+            self._err('No <map> element found at top level of map file definition.')
+        if not imports_done:
+            self.loadImports(imports, self.map)
+        return self.map
+
+    def buildMap(self, compiled):
+        """Build the map from its compiled form (see mapcache.py). Fires
+        the same callbacks as parseMap, plus one every progress_interval
+        instances."""
+        for text, fraction in self.buildSteps(compiled):
+            if self.callback is not None:
+                self.callback(text, fraction)
+        return self.map
+
+    def buildSteps(self, compiled, prefetched=None, cameras=True,
+                   interval=None):
+        """Generator doing the work of buildMap. It yields a (text, fraction)
+        progress tuple after every import, every interval instances
+        (default: progress_interval), every layer and every camera, so the
+        caller can spread the work over several frames. The map creation
+        fires the callback itself. prefetched are the imports as read by
+        prefetchImports; they are read first if not given."""
+        if interval is None:
+            interval = self.progress_interval
+        if not self.createMap(compiled['map']):
+            return
+
+        if prefetched is None:
+            start = time.time()
+            prefetched = self.prefetchImports(compiled['imports'])
+            self._phase('imports', start)
+        for progress in self.importSteps(compiled['imports'], self.map,
+                                         prefetched):
+            yield progress
+
+        if self.chunk_size:
+            for progress in self.chunkSteps(compiled):
+                yield progress
+            layers = []
+        else:
+            layers = compiled['layers']
+        total = float(max(mapcache.instanceCount(compiled), 1))
+        count = 0
+        for layer in layers:
+            id = layer[0].get('id')
+            # the time spent in this layer, without the time between steps
+            start = time.time()
+            elapsed = 0.0
+            layer_obj = self.parseLayer(layer[0], self.map)
+            if layer_obj is None:
+                continue
+            layer_count = 0
+            self.layer_objects = []
+            for values in mapcache.iterInstances(compiled, layer):
+                self.createInstance(layer_obj, *values)
+                count += 1
+                layer_count += 1
+                if count % interval == 0:
+                    elapsed += time.time() - start
+                    yield ('loaded instances: ' + str(id),
+                           count / total * 0.25 + 0.5)
+                    start = time.time()
+            self.flushObjects(layer_obj)
+            self._layerDone(id, layer_count, elapsed + time.time() - start)
+            yield ('loaded layer :' + str(id), count / total * 0.25 + 0.5)
+
+        if cameras:
+            for progress in self.cameraSteps(compiled['cameras'], self.map):
+                yield progress
+
+    def chunkSteps(self, compiled):
+        """Generator creating the layers of a chunked map with their pinned
+        instances (see chunks.py), yields a progress tuple after each
+        layer. The other instances are left to map.chunks."""
+        layers = []
+        for layer in compiled['layers']:
+            start = time.time()
+            layer_obj = self.parseLayer(layer[0], self.map)
+            if layer_obj is not None:
+                layers.append((layer, layer_obj))
+            self._phase('layers', start)
+        self.map.chunks = ChunkedMap(compiled, layers, self.createInstance,
+                                     self.deleteInstance, self.chunk_size,
+                                     self.chunk_radius)
+        self.profile['chunks'] = len(self.map.chunks.chunks)
+
+        pinned = {}
+        for layer_obj, values in self.map.chunks.pinnedInstances():
+            pinned.setdefault(layer_obj, []).append(values)
+        for i, (layer, layer_obj) in enumerate(layers):
+            start = time.time()
+            self.layer_objects = []
+            for values in pinned.get(layer_obj, []):
+                self.createInstance(layer_obj, *values)
+            self.flushObjects(layer_obj)
+            self._layerDone(layer[0].get('id'), len(pinned.get(layer_obj, [])),
+                            time.time() - start)
+            yield ('loaded layer :' + str(layer[0].get('id')),
+                   float(i + 1) / len(layers) * 0.25 + 0.5)
+
+    def cameraSteps(self, cameras, map):
+        """Generator creating the cameras of a compiled map, yields a
+        progress tuple after each one."""
+        for i, camera in enumerate(cameras):
+            start = time.time()
+            self.parseCamera(camera, map)
+            self._phase('cameras', start)
+            yield ('loaded camera: ' + str(camera.get('id')),
+                   float(i + 1) / len(cameras) * 0.25 + 0.75)
+
+    def prepare(self, location):
+        """First half of a background load (see mapjob.py): compile the map
+        and read the object files it imports. There are no engine calls in
+        here, so this can run on a worker thread.
+        Returns (compiled map, prefetched imports). The compiled map is None
+        if the file can only be read through the VFS, which is not thread
+        safe; applySteps reads it then."""
+        self.begin(location.getFilename())
+        self.profile['mode'] = 'background'
+        start = time.time()
+        prepared = prepareMap(self.source)
+        self._phase('read', start)
+        return prepared
+
+    def applySteps(self, prepared, interval=50):
+        """Second half of a background load, on the main thread: a
+        generator building the map from what prepare returned (see
+        buildSteps). The cameras are left out, as they start rendering
+        right away; createCameras adds them once the map is swapped in."""
+        compiled, prefetched = prepared
+        if compiled is None:
+            start = time.time()
+            f = self.vfs.open(self.source)
+            f.thisown = 1
+            compiled = mapcache.compileMap(self.source, f)
+            self._phase('parse', start)
+        self.compiled_cameras = compiled['cameras']
+        return self.buildSteps(compiled, prefetched, False, interval)
+
+    def createCameras(self):
+        """Create the cameras of a map loaded with prepare/applySteps, which
+        completes the load."""
+        if self.map is None:
+            self._err('The map was not created, so it can get no cameras.')
+        for progress in self.cameraSteps(self.compiled_cameras, self.map):
+            pass
+        self.finishProfile()
+
+    def _streamProgress(self, f, base):
+        """Map the read position in the map file onto the 0.25 wide
+        progress band starting at base."""
+        try:
+            done = float(f.getCurrentIndex()) / f.getDataLength()
+        except (AttributeError, ZeroDivisionError):
+            done = 0.0
+        return base + min(done, 1.0) * 0.25
+
+    def createMap(self, map_elt):
         id,format = map_elt.get('id'),map_elt.get('format')
 
         if not format == FORMAT: self._err(''.join(['This file has format ', format, ' but this loader has format ', FORMAT]))
@@ -90,57 +518,86 @@ class XMLMapLoader(fife.ResourceLoader):
         except fife.Exception, e: # NameClash appears as general fife.Exception; any ideas?
             print e.getMessage()
             print ''.join(['File: ', self.source, '. The map ', str(id), ' already exists! Ignoring map definition.'])
+            self.map = None
             return None
 
         # xml-specific directory imports. This is used by xml savers.
         self.map.importDirs = []
+        # the chunks of a chunked map, see chunkSteps
+        self.map.chunks = None
 
         if self.callback is not None:
             self.callback('created map', float(0.25) )
 
-        self.parseImports(map_elt, self.map)
-        
-        self.parseLayers(map_elt, self.map)    
-        
-        self.parseCameras(map_elt, self.map)
-
         return self.map
 
     def parseImports(self, map_elt, map):
-        parsedImports = {}
-
-        if self.callback:        
-            tmplist = map_elt.findall('import')
-            i = float(0)
-        
-        for item in map_elt.findall('import'):
-            file = item.get('file')
-            if file:
-                file = reverse_root_subfile(self.source, file)
-            dir = item.get('dir')
-            if dir:
-                dir = reverse_root_subfile(self.source, dir)
-
-            # Don't parse duplicate imports
-            if (dir,file) in parsedImports:
-                print "Duplicate import:" ,(dir,file)
-                continue
-            parsedImports[(dir,file)] = 1
-
-            if file and dir:
-                loaders.loadImportFile('/'.join(dir, file), self.engine)
-            elif file:
-                loaders.loadImportFile(file, self.engine)
-            elif dir:
-                loaders.loadImportDirRec(dir, self.engine)
-                map.importDirs.append(dir)
-            else:
-                print 'Empty import statement?'
-                
+        self.loadImports(map_elt.findall('import'), map)
+
+    def prefetchImports(self, items):
+        """Read the object files imported by items, see prefetchMapImports."""
+        return prefetchMapImports(self.source, items)
+
+    def loadImports(self, items, map):
+        """Handle the imports of a map. The imported object files are all
+        read at once on worker threads first (see loaders.prefetchImports);
+        only registering the objects with the model happens one by one.
+        If an object file could not be read that way, it is loaded the
+        normal way instead. Files that are already in the import registry
+        of loaders.py are skipped without being read. Each import that is
+        loaded is timed in self.import_timings as (file, seconds reading,
+        seconds registering)."""
+        start = time.time()
+        prefetched = self.prefetchImports(items)
+        self._phase('imports', start)
+        for text, fraction in self.importSteps(items, map, prefetched):
             if self.callback:
-                i += 1                
-                self.callback('loaded imports', float( i / float(len(tmplist)) * 0.25 + 0.25 ) )
+                self.callback(text, fraction)
 
+    def importSteps(self, items, map, prefetched):
+        """Generator registering the imports of a map, yields a progress
+        tuple after each one."""
+        parsedImports = {}
+        for i, item in enumerate(items):
+            start = time.time()
+            self.parseImport(item, map, parsedImports, prefetched)
+            self._phase('imports', start)
+            yield ('loaded imports', float(i + 1) / len(items) * 0.25 + 0.25)
+
+    def parseImport(self, item, map, parsedImports, prefetched={}):
+        file = item.get('file')
+        if file:
+            file = reverse_root_subfile(self.source, file)
+        dir = item.get('dir')
+        if dir:
+            dir = reverse_root_subfile(self.source, dir)
+
+        # Don't parse duplicate imports
+        if (dir,file) in parsedImports:
+            print "Duplicate import:" ,(dir,file)
+            return
+        parsedImports[(dir,file)] = 1
+
+        if file and dir:
+            loaders.loadImportFile('/'.join(dir, file), self.engine)
+        elif file:
+            if loaders.isImported(file):
+                # counts the hit in the import registry, no I/O
+                loaders.loadImportFile(file, self.engine)
+                return
+            desc, read_time = prefetched.get(file, (None, 0.0))
+            if isinstance(desc, Exception):
+                if not isinstance(desc, WrongFileType):
+                    print 'Could not prefetch', file, '(', desc, ')'
+                desc = None
+            start = time.time()
+            loaders.loadImportFile(file, self.engine, desc, read_time)
+            self.import_timings.append((file, read_time, time.time() - start))
+        elif dir:
+            loaders.loadImportDirRec(dir, self.engine)
+            map.importDirs.append(dir)
+        else:
+            print 'Empty import statement?'
 
     def parseLayers(self, map_elt, map):
         if self.callback is not None:        
@@ -148,197 +605,225 @@ class XMLMapLoader(fife.ResourceLoader):
             i = float(0)
 
         for layer in map_elt.findall('layer'):
-            id = layer.get('id')
-            grid_type = layer.get('grid_type')
-            x_scale = layer.get('x_scale')
-            y_scale = layer.get('y_scale')
-            rotation = layer.get('rotation')
-            x_offset = layer.get('x_offset')
-            y_offset = layer.get('y_offset')
-            pathing = layer.get('pathing')
-
-            if not x_scale: x_scale = 1.0
-            if not y_scale: y_scale = 1.0
-            if not rotation: rotation = 0.0
-            if not x_offset: x_offset = 0.0
-            if not y_offset: y_offset = 0.0
-            if not pathing: pathing = "cell_edges_only"
-
-            if not id: self._err('<layer> declared with no id attribute.')
-            if not grid_type: self._err(''.join(['Layer ', str(id), ' has no grid_type attribute.']))
-
-            allow_diagonals = pathing == "cell_edges_and_diagonals"
-            cellgrid = self.model.getCellGrid(grid_type)
-            if not cellgrid: self._err('<layer> declared with invalid cellgrid type. (%s)' % grid_type)
-
-            cellgrid.setRotation(float(rotation))
-            cellgrid.setXScale(float(x_scale))
-            cellgrid.setYScale(float(y_scale))
-            cellgrid.setXShift(float(x_offset))
-            cellgrid.setYShift(float(y_offset))
-
-            layer_obj = None
-            try:
-                layer_obj = map.createLayer(str(id), cellgrid)
-            except fife.Exception, e:
-                print e.getMessage()
-                print 'The layer ' + str(id) + ' already exists! Ignoring this layer.'
+            start = time.time()
+            layer_obj = self.parseLayer(layer, map)
+            if layer_obj is None:
                 continue
 
-            strgy = fife.CELL_EDGES_ONLY
-            if pathing == "cell_edges_and_diagonals":
-                strgy = fife.CELL_EDGES_AND_DIAGONALS
-            if pathing == "freeform":
-                strgy = fife.FREEFORM
-            layer_obj.setPathingStrategy(strgy)
-
-            self.parseInstances(layer, layer_obj)
+            count = self.parseInstances(layer, layer_obj)
+            self._layerDone(layer.get('id'), count, time.time() - start)
 
             if self.callback is not None:
                 i += 1
-                self.callback('loaded layer :' + str(id), float( i / float(len(tmplist)) * 0.25 + 0.5 ) )
+                self.callback('loaded layer :' + str(layer.get('id')), float( i / float(len(tmplist)) * 0.25 + 0.5 ) )
 
         # cleanup
         if self.callback is not None:
             del tmplist
             del i
 
+    def parseLayer(self, layer, map):
+        """Create the layer declared by a <layer> element. Only the
+        attributes of the element are used, so this also works on the
+        start event of a streamed layer. Returns None if the layer
+        could not be created."""
+        id = layer.get('id')
+        grid_type = layer.get('grid_type')
+        x_scale = layer.get('x_scale')
+        y_scale = layer.get('y_scale')
+        rotation = layer.get('rotation')
+        x_offset = layer.get('x_offset')
+        y_offset = layer.get('y_offset')
+        pathing = layer.get('pathing')
+
+        if not x_scale: x_scale = 1.0
+        if not y_scale: y_scale = 1.0
+        if not rotation: rotation = 0.0
+        if not x_offset: x_offset = 0.0
+        if not y_offset: y_offset = 0.0
+        if not pathing: pathing = "cell_edges_only"
+
+        if not id: self._err('<layer> declared with no id attribute.')
+        if not grid_type: self._err(''.join(['Layer ', str(id), ' has no grid_type attribute.']))
+
+        allow_diagonals = pathing == "cell_edges_and_diagonals"
+        cellgrid = self.model.getCellGrid(grid_type)
+        if not cellgrid: self._err('<layer> declared with invalid cellgrid type. (%s)' % grid_type)
+
+        cellgrid.setRotation(float(rotation))
+        cellgrid.setXScale(float(x_scale))
+        cellgrid.setYScale(float(y_scale))
+        cellgrid.setXShift(float(x_offset))
+        cellgrid.setYShift(float(y_offset))
+
+        layer_obj = None
+        try:
+            layer_obj = map.createLayer(str(id), cellgrid)
+        except fife.Exception, e:
+            print e.getMessage()
+            print 'The layer ' + str(id) + ' already exists! Ignoring this layer.'
+            return None
+
+        strgy = fife.CELL_EDGES_ONLY
+        if pathing == "cell_edges_and_diagonals":
+            strgy = fife.CELL_EDGES_AND_DIAGONALS
+        if pathing == "freeform":
+            strgy = fife.FREEFORM
+        layer_obj.setPathingStrategy(strgy)
+
+        return layer_obj
+
     def parseInstances(self, layerelt, layer):
         instelt = layerelt.find('instances')
 
         instances = instelt.findall('i')
         instances.extend(instelt.findall('inst'))
         instances.extend(instelt.findall('instance'))
+        self.layer_objects = []
         for instance in instances:
+            self.parseInstance(instance, layer)
+        self.flushObjects(layer)
+        return len(instances)
+
+    def parseInstance(self, instance, layer):
+        self.createInstance(layer, *self.reader.read(instance))
+
+    def createInstance(self, layer, objectID, nspace, x, y, z, rotation,
+                       stackpos, id, parpg):
+        """Create an instance from the values returned by
+        InstanceReader.read. Returns the instance, or None if its object
+        could not be found or the instance was deleted again because its
+        PARPG object is gone from the game."""
+        entry = self.lookupObject(objectID, nspace)
+        if entry is None:
+            not_found = self.profile['not_found']
+            not_found[objectID] = not_found.get(objectID, 0) + 1
+            return None
+        object, default_rotation, has_default_action = entry
 
-            objectID = instance.get('object')
-            if not objectID:
-                objectID = instance.get('obj')
-            if not objectID:
-                objectID = instance.get('o')
-
-            if not objectID: self._err('<instance> does not specify an object attribute.')
-
-            nspace = instance.get('namespace')
-            if not nspace:
-                nspace = instance.get('ns')
-            if not nspace:
-                nspace = self.nspace
+        inst = layer.createInstance(object, fife.ExactModelCoordinate(x,y,z), id)
 
-            if not nspace: self._err('<instance> %s does not specify an object namespace, and no default is available.' % str(objectID))
+        if rotation is None:
+            rotation = default_rotation
+        inst.setRotation(rotation)
 
-            self.nspace = nspace
+        fife.InstanceVisual.create(inst)
+        if stackpos is not None:
+            inst.get2dGfxVisual().setStackPosition(stackpos)
 
-            object = self.model.getObject(str(objectID), str(nspace))
+        if has_default_action:
+            target = fife.Location(layer)
+            inst.act('default', target, True)
+            
+        #Check for PARPG specific object attributes
+        if ( parpg ):
+            object_type, is_open, locked, name, text = parpg
+            inst_dict = {}
+            inst_dict["type"] = object_type
+            inst_dict["id"] = id
+            inst_dict["xpos"] = x
+            inst_dict["ypos"] = y
+            inst_dict["gfx"] = objectID
+            inst_dict["is_open"] = is_open
+            inst_dict["locked"] = locked
+            inst_dict["name"] = name
+            inst_dict["text"] = text
+            if self.layer_objects is not None:
+                self.layer_objects.append((inst_dict, inst))
+            else:
+                start = time.time()
+                deleted = self.data.createObjects(layer, [(inst_dict, inst)])
+                self._phase('objects', start)
+                self.profile['objects'] += 1
+                if deleted:
+                    return None
+
+        return inst
+
+    def flushObjects(self, layer):
+        """Create the PARPG objects collected for a layer in one call, and
+        go back to creating them one at a time."""
+        objects, self.layer_objects = self.layer_objects, None
+        if objects:
+            start = time.time()
+            self.data.createObjects(layer, objects)
+            self._phase('objects', start)
+            self.profile['objects'] += len(objects)
+                
+    def deleteInstance(self, layer, inst):
+        """Delete an instance created by createInstance, when the chunk it
+        is in is unloaded."""
+        layer.deleteInstance(inst)
+
+    def lookupObject(self, objectID, nspace):
+        """Get the object for an instance, together with the instance
+        defaults that only depend on the object: (object, default rotation,
+        whether it has a default action). A layer uses a handful of objects
+        many times over, so every object is only resolved through the model
+        once per load. Returns None if the object does not exist."""
+        key = (objectID, nspace)
+        try:
+            entry = self.object_cache[key]
+        except KeyError:
+            self.object_cache_misses += 1
+            object = self.model.getObject(objectID, nspace)
             if not object:
                 print ''.join(['Object with id=', str(objectID), ' ns=', str(nspace), ' could not be found. Omitting...'])
-                continue
-
-            x = instance.get('x')
-            y = instance.get('y')
-            z = instance.get('z')
-            stackpos = instance.get('stackpos')
-            id = instance.get('id')
-
-            if x:
-                x = float(x)
-                self.x = x
+                entry = None
             else:
-                self.x = self.x + 1
-                x = self.x
-
-            if y:
-                y = float(y)
-                self.y = y
-            else:
-                y = self.y
-
-            if z:
-                z = float(z)
-            else:
-                z = 0.0
-
-            if not id:
-                id = ''
-            else:
-                id = str(id)
-
-            inst = layer.createInstance(object, fife.ExactModelCoordinate(x,y,z), str(id))
-
-            rotation = instance.get('r')
-            if not rotation:
-                rotation = instance.get('rotation')
-            if not rotation:
                 angles = object.get2dGfxVisual().getStaticImageAngles()
                 if angles:
                     rotation = angles[0]
                 else:
                     rotation = 0
-            else:
-                rotation = int(rotation)
-            inst.setRotation(rotation)
-
-            fife.InstanceVisual.create(inst)
-            if (stackpos):
-                inst.get2dGfxVisual().setStackPosition(int(stackpos))
+                entry = (object, rotation, bool(object.getAction('default')))
+            self.object_cache[key] = entry
+        else:
+            self.object_cache_hits += 1
+        return entry
 
-            if (object.getAction('default')):
-                target = fife.Location(layer)
-                inst.act('default', target, True)
-                
-            #Check for PARPG specific object attributes
-            object_type = instance.get('object_type')
-            if ( object_type ):
-                inst_dict = {}
-                inst_dict["type"] = object_type
-                inst_dict["id"] = id
-                inst_dict["xpos"] = x
-                inst_dict["ypos"] = y
-                inst_dict["gfx"] = objectID
-                inst_dict["is_open"] = instance.get('is_open')
-                inst_dict["locked"] = instance.get('locked')
-                inst_dict["name"] = instance.get('name')
-                inst_dict["text"] = instance.get('text')
-                self.data.createObject( layer, inst_dict, inst )
-                
     def parseCameras(self, map_elt, map):
         if self.callback:        
             tmplist = map_elt.findall('camera')
             i = float(0)
 
         for camera in map_elt.findall('camera'):
-            id = camera.get('id')
-            zoom = camera.get('zoom')
-            tilt = camera.get('tilt')
-            rotation = camera.get('rotation')
-            ref_layer_id = camera.get('ref_layer_id')
-            ref_cell_width = camera.get('ref_cell_width')
-            ref_cell_height = camera.get('ref_cell_height')
-            viewport = camera.get('viewport')
-
-            if not zoom: zoom = 1
-            if not tilt: tilt = 0
-            if not rotation: rotation = 0
-
-            if not id: self._err('Camera declared without an id.')
-            if not ref_layer_id: self._err(''.join(['Camera ', str(id), ' declared with no reference layer.']))
-            if not (ref_cell_width and ref_cell_height): self._err(''.join(['Camera ', str(id), ' declared without reference cell dimensions.']))
-
-            try:
-                if viewport:
-                    cam = self.engine.getView().addCamera(str(id), map.getLayer(str(ref_layer_id)),fife.Rect(*[int(c) for c in viewport.split(',')]),fife.ExactModelCoordinate(0,0,0))
-                else:
-                    screen = self.engine.getRenderBackend()
-                    cam = self.engine.getView().addCamera(str(id), map.getLayer(str(ref_layer_id)),fife.Rect(0,0,screen.getScreenWidth(),screen.getScreenHeight()),fife.ExactModelCoordinate(0,0,0))
-
-                cam.setCellImageDimensions(int(ref_cell_width), int(ref_cell_height))
-                cam.setRotation(float(rotation))
-                cam.setTilt(float(tilt))
-                cam.setZoom(float(zoom))
-            except fife.Exception, e:
-                print e.getMessage()
+            start = time.time()
+            self.parseCamera(camera, map)
+            self._phase('cameras', start)
                 
             if self.callback:
                 i += 1
-                self.callback('loaded camera: ' +  str(id), float( i / len(tmplist) * 0.25 + 0.75 ) )    
-            
+                self.callback('loaded camera: ' +  str(camera.get('id')), float( i / len(tmplist) * 0.25 + 0.75 ) )
+
+    def parseCamera(self, camera, map):
+        id = camera.get('id')
+        zoom = camera.get('zoom')
+        tilt = camera.get('tilt')
+        rotation = camera.get('rotation')
+        ref_layer_id = camera.get('ref_layer_id')
+        ref_cell_width = camera.get('ref_cell_width')
+        ref_cell_height = camera.get('ref_cell_height')
+        viewport = camera.get('viewport')
+
+        if not zoom: zoom = 1
+        if not tilt: tilt = 0
+        if not rotation: rotation = 0
+
+        if not id: self._err('Camera declared without an id.')
+        if not ref_layer_id: self._err(''.join(['Camera ', str(id), ' declared with no reference layer.']))
+        if not (ref_cell_width and ref_cell_height): self._err(''.join(['Camera ', str(id), ' declared without reference cell dimensions.']))
+
+        try:
+            if viewport:
+                cam = self.engine.getView().addCamera(str(id), map.getLayer(str(ref_layer_id)),fife.Rect(*[int(c) for c in viewport.split(',')]),fife.ExactModelCoordinate(0,0,0))
+            else:
+                screen = self.engine.getRenderBackend()
+                cam = self.engine.getView().addCamera(str(id), map.getLayer(str(ref_layer_id)),fife.Rect(0,0,screen.getScreenWidth(),screen.getScreenHeight()),fife.ExactModelCoordinate(0,0,0))
+
+            cam.setCellImageDimensions(int(ref_cell_width), int(ref_cell_height))
+            cam.setRotation(float(rotation))
+            cam.setTilt(float(tilt))
+            cam.setZoom(float(zoom))
+        except fife.Exception, e:
+            print e.getMessage()
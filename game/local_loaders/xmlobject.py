@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Most of this code was copied from the FIFE file xmlobject.py
+# It is part of the local code base now so that reading an object file and
+# registering the object with the model are two separate steps: reading
+# (parseObject) involves no engine calls at all, so many object files can
+# be read at once on worker threads; only registerObject has to run on the
+# main thread.
+
+import fife
+try:
+    import xml.etree.cElementTree as ET
+except:
+    import xml.etree.ElementTree as ET
+
+from serializers import WrongFileType, NameClash
+
+OBJECT_HEADER = '<?fife type="object"?>'
+
+def _relative(filename, source):
+    """Paths in an object file are relative to the object file"""
+    path = filename.split('/')
+    path.pop()
+    path.append(str(source))
+    return '/'.join(path)
+
+def parseObject(f, filename):
+    """Read an object file into a plain python descriptor.
+       @type f: file
+       @param f: Open object file, anything with a read() method
+       @type filename: string
+       @param filename: Name of the object file, used to resolve the image
+                        and animation paths
+       @rtype: dict
+       @return: The object descriptor"""
+    if f.read(len(OBJECT_HEADER)) != OBJECT_HEADER:
+        raise WrongFileType('Tried to open non-object file %s with XMLObjectLoader.' % filename)
+    object = ET.parse(f).getroot()
+    if object.tag != 'object':
+        raise SyntaxError('Expected <object> tag, but found <%s>.' % object.tag)
+
+    id = object.get('id')
+    if not id:
+        raise SyntaxError('<object> declared without an id attribute.')
+    nspace = object.get('namespace')
+    if not nspace:
+        raise SyntaxError('<object> %s declared without a namespace attribute.' % str(id))
+
+    images = []
+    for image in object.findall('image'):
+        source = image.get('source')
+        if not source:
+            raise SyntaxError('<image> declared without a source attribute.')
+        images.append((_relative(filename, source),
+                       int(image.get('direction', 0)),
+                       int(image.get('x_offset', 0)),
+                       int(image.get('y_offset', 0))))
+
+    actions = []
+    for action in object.findall('action'):
+        action_id = action.get('id')
+        if not action_id:
+            raise SyntaxError('<action> declared without an id attribute.')
+        animations = []
+        for anim in action.findall('animation'):
+            source = anim.get('source')
+            if not source:
+                raise SyntaxError('Animation declared with no source location.')
+            animations.append((_relative(filename, source),
+                               int(anim.get('direction', 0))))
+        actions.append((str(action_id), animations))
+
+    return {'file': filename,
+            'id': str(id),
+            'namespace': str(nspace),
+            'parent': object.get('parent'),
+            # parsed like FIFE's XMLObjectLoader does
+            'blocking': bool(object.get('blocking')),
+            'static': bool(object.get('static')),
+            'pather': object.get('pather', 'RoutePather'),
+            'images': images,
+            'actions': actions}
+
+def parseObjectFile(filename):
+    """Read an object file from disk (not through the VFS, which must only
+       be used from the main thread).
+       @rtype: dict
+       @return: The object descriptor"""
+    f = open(filename, 'rb')
+    try:
+        return parseObject(f, filename)
+    finally:
+        f.close()
+
+class XMLObjectLoader(fife.ResourceLoader):
+    def __init__(self, image_pool, anim_pool, model, vfs=None):
+        fife.ResourceLoader.__init__(self)
+        self.image_pool = image_pool
+        self.anim_pool = anim_pool
+        self.model = model
+        self.vfs = vfs
+
+    def loadResource(self, location):
+        """Read an object file through the VFS and register its object"""
+        filename = location.getFilename()
+        f = self.vfs.open(filename)
+        f.thisown = 1
+        return self.registerObject(parseObject(f, filename))
+
+    def registerObject(self, desc):
+        """Create the object described by a descriptor from parseObject in
+        the model. Raises NameClash if the object already exists."""
+        id, nspace = desc['id'], desc['namespace']
+        if self.model.getObject(id, nspace):
+            raise NameClash('Tried to create already existing object %s:%s' % (nspace, id))
+
+        parent = None
+        if desc['parent']:
+            parent = self.model.getObject(str(desc['parent']), nspace)
+        obj = self.model.createObject(id, nspace, parent)
+        obj.setResourceLocation(fife.ResourceLocation(desc['file']))
+        fife.ObjectVisual.create(obj)
+        obj.setBlocking(desc['blocking'])
+        obj.setStatic(desc['static'])
+        obj.setPather(self.model.getPather(desc['pather']))
+
+        for path, direction, x_offset, y_offset in desc['images']:
+            img_id = self.image_pool.addResourceFromFile(path)
+            obj.get2dGfxVisual().addStaticImage(direction, img_id)
+            img = self.image_pool.getImage(img_id)
+            img.setXShift(x_offset)
+            img.setYShift(y_offset)
+
+        for action_id, animations in desc['actions']:
+            action = obj.createAction(action_id)
+            fife.ActionVisual.create(action)
+            for path, direction in animations:
+                anim_id = self.anim_pool.addResourceFromFile(path)
+                animation = self.anim_pool.getAnimation(anim_id)
+                action.get2dGfxVisual().addAnimation(direction, anim_id)
+                action.setDuration(animation.getDuration())
+        return obj
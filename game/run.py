@@ -28,6 +28,8 @@ from scripts import world
 from scripts import engine
 from scripts.engine import Engine
 from scripts.common import eventlistenerbase
+from local_loaders import loaders
+from scripts.autosave import Autosaver, DEFAULT_SLOTS
 from basicapplication import ApplicationBase
 from settings import Setting
 
@@ -76,6 +78,31 @@ class ApplicationListener(eventlistenerbase.EventListenerBase):
         if (command.lower() in ('quit', 'exit')):
             self.quitGame()
 
+        # profile: the last map load, profile all: every recent one,
+        # profile log <file>/off: append the profiles to a JSON lines file,
+        # profile prefetch: how many map changes found their map prefetched
+        profile_regex = re.compile('^profile')
+        p_matches = profile_regex.match(command.lower())
+        if (p_matches != None):
+            p_args = command[p_matches.end():].split()
+            if p_args[:1] == ['log'] and len(p_args) == 2:
+                if p_args[1].lower() == 'off':
+                    loaders.profile_log = None
+                    return "Map load profiles are not logged"
+                loaders.profile_log = p_args[1]
+                return "Logging map load profiles to " + p_args[1]
+            if p_args[:1] == ['prefetch']:
+                stats = self.world.prefetcher.stats
+                return "Prefetched map changes: %d of %d (%.0f%%)" % (
+                    stats['hits'], stats['hits'] + stats['misses'],
+                    self.world.prefetcher.hitRate() * 100)
+            if not loaders.load_profiles:
+                return "No map has been loaded yet"
+            if p_args[:1] == ['all']:
+                return '\n'.join([loaders.formatProfile(p, verbose=False)
+                                  for p in loaders.load_profiles])
+            return loaders.formatProfile(loaders.load_profiles[-1])
+
         load_regex = re.compile('^load')
         l_matches = load_regex.match(command.lower())
         if (l_matches != None):
@@ -134,6 +161,11 @@ class PARPG(ApplicationBase):
         self.world = world.World(self.engine)
         self.model = engine.Engine(self.world)
         self.world.data = self.model
+        interval = TDS.readSetting("AutosaveInterval")
+        if interval and float(interval) > 0:
+            slots = TDS.readSetting("AutosaveSlots") or DEFAULT_SLOTS
+            self.model.autosaver = Autosaver('saves', float(interval), 
+                                             int(slots))
         self.listener = ApplicationListener(self.engine,self.world,self.model)
         self.world.quitFunction = self.listener.quitGame
         self.model.loadMap("main_map", str(TDS.readSetting("MapFile")))   
@@ -188,6 +220,8 @@ class PARPG(ApplicationBase):
            @return: None"""
         if self.listener.quit:
             self.breakRequested = True
+            if self.model.autosaver is not None:
+                self.model.autosaver.wait()
         else:
             self.model.pump()
             self.world.pump()
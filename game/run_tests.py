@@ -10,6 +10,17 @@ for p in _paths:
         sys.path.append(_jp(p))
 
 from scripts.tests.classTests import WoodenCrateTest
+from scripts.tests.mapjobTests import MapLoadJobTest
+from scripts.tests.mapprefetchTests import MapPrefetcherTest
+from scripts.tests.autosaveTests import AutosaveTest
+from scripts.tests.chunksTests import ChunkedMapTest
+from scripts.tests.engineTests import EngineTest
+from scripts.tests.gamestateTests import GameStateTest
+from scripts.tests.hoverTests import HoverTrackerTest
+from scripts.tests.objectsTests import ObjectRegistryTest
+from scripts.tests.savegameTests import SaveGameTest
+from scripts.tests.transitionTests import TransitionTest
+from scripts.tests.saveindexTests import SaveIndexTest
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# there should be NO references to FIFE here!
+import os, sys, time, threading
+from savegame import snapshotGame, writeSnapshot
+from saveindex import updateIndex
+
+# default number of autosave files that are used in turn
+DEFAULT_SLOTS = 3
+
+class Autosaver(object):
+    """Saves the game every interval seconds without holding up the game:
+       the game thread only takes a snapshot of what is saved (see 
+       savegame.snapshotGame), a worker thread writes it. Every autosave 
+       goes to the next of a number of slots, so a crash while writing one
+       leaves the others, and is written to a temporary file that is only
+       renamed over the slot once it is on disk."""
+    def __init__(self, directory, interval, slots=DEFAULT_SLOTS, 
+                 clock=time.time, threaded=True):
+        """Set up the autosaver.
+           @type directory: string
+           @param directory: Where to put the autosave files
+           @type interval: float
+           @param interval: Seconds between autosaves
+           @type slots: integer
+           @param slots: Number of autosave files used in turn
+           @type clock: function
+           @param clock: Returns the current time in seconds
+           @type threaded: Boolean
+           @param threaded: Write on a worker thread; False writes during
+                            pump, for tests
+           @return: None"""
+        self.directory = directory
+        self.interval = interval
+        self.slots = max(1, slots)
+        self.clock = clock
+        self.threaded = threaded
+        self.last_save = clock()
+        self.worker = None
+        # exception of the last write, reported on the next pump
+        self.error = None
+        # seconds the game thread was held up by the last autosave, and 
+        # by all of them
+        self.stats = {'saves': 0, 'blocked': 0.0, 'last_blocked': 0.0,
+                      'max_blocked': 0.0, 'write': 0.0}
+        # carry on after the newest autosave of an earlier game
+        self.slot = 0
+        newest = None
+        for slot in range(self.slots):
+            path = self.slotPath(slot)
+            if os.path.exists(path) and \
+                    (newest is None or os.path.getmtime(path) > newest):
+                newest = os.path.getmtime(path)
+                self.slot = (slot + 1) % self.slots
+
+    def slotPath(self, slot):
+        """@return: The file name of an autosave slot"""
+        return os.path.join(self.directory, 'autosave%d.dat' % slot)
+
+    def busy(self):
+        """@return: True while an autosave is being written"""
+        return self.worker is not None and self.worker.isAlive()
+
+    def pump(self, state):
+        """Autosave state if it is time to.
+           @type state: GameState
+           @param state: The game state
+           @return: None"""
+        if self.error is not None:
+            sys.stderr.write("Error: Autosave failed: %s\n" % self.error)
+            self.error = None
+        if self.clock() - self.last_save >= self.interval and not self.busy():
+            self.save(state)
+
+    def save(self, state):
+        """Autosave state to the next slot now.
+           @type state: GameState
+           @param state: The game state
+           @return: None"""
+        start = time.time()
+        self.last_save = self.clock()
+        snapshot = snapshotGame(state, delta=True)
+        path = self.slotPath(self.slot)
+        self.slot = (self.slot + 1) % self.slots
+        if self.threaded:
+            self.worker = threading.Thread(target=self.write, 
+                                           args=(snapshot, path))
+            self.worker.start()
+        blocked = time.time() - start
+        self.stats['saves'] += 1
+        self.stats['blocked'] += blocked
+        self.stats['last_blocked'] = blocked
+        self.stats['max_blocked'] = max(self.stats['max_blocked'], blocked)
+        if not self.threaded:
+            self.write(snapshot, path)
+
+    def write(self, snapshot, path):
+        """Write a snapshot to path, by way of a temporary file.
+           @return: None"""
+        start = time.time()
+        temp = path + '.tmp'
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            f = open(temp, 'wb')
+            try:
+                writeSnapshot(f, snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+            # Windows can't rename over a file
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(temp, path)
+            updateIndex(self.directory, os.path.basename(path))
+        except Exception, e:
+            self.error = e
+            if os.path.exists(temp):
+                os.remove(temp)
+        self.stats['write'] = time.time() - start
+
+    def wait(self):
+        """Wait for the autosave being written, if any, e.g. before quitting.
+           @return: None"""
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
@@ -16,11 +16,14 @@
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
 # there should be NO references to FIFE here!
-import pickle, sys
+import sys, time
 from gamestate import GameState
+from savegame import writeGame, readGame, SaveError
+from saveindex import updateIndex
 from objects import *
 from objectLoader import ObjectXMLParser
 from objects.action import *
+from objects.base import PC, NPC, DOOR, CONTAINER, CARRYABLE
 
 # design note:
 # there is a map file that FIFE reads. We use that file for half the map
@@ -32,6 +35,11 @@ from objects.action import *
 # from another file if in their initial state
 # This other file has the name AAA_objects.xml where AAA.xml is the name
 # of the original mapfile.
+# Saves are deltas against that initial state: only the objects that
+# differ from what their map creates are saved (see savegame.writeGame).
+
+# seconds per frame spent building a map that is loaded in the background
+MAP_LOAD_SLICE = 0.01
 
 class Engine:
     """Engine holds the logic for the game.
@@ -49,6 +57,14 @@ class Engine:
         self.view = view
         self.mapchange = False
         self.gameState = GameState()
+        # the background load of the next map, see startMapChange
+        self.map_job = None
+        # set threaded_loading to False and load_clock to a
+        # mapjob.SimulatedClock to make map changes deterministic
+        self.threaded_loading = True
+        self.load_clock = time.time
+        # an autosave.Autosaver, if the game autosaves
+        self.autosaver = None
 
     def reset(self):
         """Clears the data on a map reload so we don't have objects/npcs from
@@ -62,28 +78,22 @@ class Engine:
            @return: None"""
         fname = '/'.join([path,filename])
         try:
-            f = open(fname, 'w')
+            f = open(fname, 'wb')
         except(IOError):
             sys.stderr.write("Error: Can't find save game: " + fname + "\n")
             return
         
-        # can't pickle SwigPyObjects
-        behaviours = {}
-        behaviours[self.gameState.PC.ID] = self.gameState.PC.behaviour;
-        self.gameState.PC.behaviour = None;
-        
-        npcs = [npc for npc in self.gameState.objects.values() if npc.trueAttr("NPC")]
-        for npc in npcs:
-            behaviours[npc.ID] = npc.behaviour;
-            npc.behaviour = None;
-        
-        pickle.dump(self.gameState, f)
-        f.close()
-        
-        # restore behaviours
-        for npc in npcs:
-            npc.behaviour = behaviours[npc.ID];
-        self.gameState.PC.behaviour = behaviours[self.gameState.PC.ID]
+        # the behaviours are SwigPyObjects; they are transient fields, so 
+        # the save leaves them out
+        try:
+            writeGame(f, self.gameState, delta=True)
+        finally:
+            f.close()
+        # so the load browser doesn't have to open the save to describe it
+        try:
+            updateIndex(path, filename)
+        except (IOError, OSError), e:
+            sys.stderr.write("Error: Can't index save game: %s\n" % e)
 
     def load(self, path, filename):
         """Loads a saver from a file.
@@ -92,14 +102,20 @@ class Engine:
            @return: None"""
         fname = '/'.join([path, filename])
         try:
-            f = open(fname, 'r')
+            f = open(fname, 'rb')
         except(IOError):
             sys.stderr.write("Error: Can't find save game file\n")
             return
-        self.gameState = pickle.load(f)
-        f.close()
+        try:
+            self.gameState = readGame(f)
+        except SaveError, e:
+            sys.stderr.write("Error: Can't load save game: %s\n" % e)
+            return
+        finally:
+            f.close()
         if self.gameState.currentMap:
-            self.loadMap(self.gameState.currentMap) 
+            # maps are stored under the name of their file
+            self.loadMap(self.gameState.currentMap, self.gameState.currentMap)
 
     def createObject (self, layer, attributes, instance):
         """Create an object and add it to the current map.
@@ -110,18 +126,38 @@ class Engine:
             Return:
                 Nothing
         """
+        self.createObjects(layer, [(attributes, instance)])
+
+    def createObjects (self, layer, objects):
+        """Create the objects of a layer at once and add them to the current
+           map.
+            Inputs:
+                layer = FIFE layer the objects exist in
+                objects = list of (attributes, instance) tuples, as taken
+                          by createObject
+            Return:
+                The instances of objects that are gone from the game; they
+                have been deleted from the layer
+        """
         # create the extra data
         extra = {}
         extra['agent_layer'] = layer
         extra['engine'] = self
         
-        obj = createObject(attributes, extra)
+        created = createObjects([attributes for attributes, instance
+                                 in objects], extra)
         
-        if obj.trueAttr("PC"):
-            self.addPC( layer, obj, instance)
-        else:
-            self.addObject( layer, obj, instance)
-
+        deleted = []
+        for obj, (attributes, instance) in zip(created, objects):
+            if obj.capabilities & PC:
+                self.addPC( layer, obj, instance)
+            elif obj.ID in self.gameState.destroyed:
+                # the map still has it, but it is gone from the game
+                layer.deleteInstance(instance)
+                deleted.append(instance)
+            else:
+                self.addObject( layer, obj, instance)
+        return deleted
         
 
     def addPC(self, layer, pc, instance):
@@ -134,11 +170,16 @@ class Engine:
                 Nothing
         """
         # add to view data 
-        self.view.activeMap.addObject(pc.ID, instance)          
+        self.view.getLoadingMap().addObject(pc.ID, instance)          
         
         # sync with game data
         if not self.gameState.PC:
             self.gameState.PC = pc
+        elif getattr(self.gameState.PC, 'behaviour', None) is None:
+            # behaviours aren't saved, so a loaded PC takes over the one
+            # created for the PC of the map
+            self.gameState.PC.behaviour = pc.behaviour
+            pc.behaviour.parent = self.gameState.PC
             
         self.gameState.PC.setup()
 
@@ -152,12 +193,16 @@ class Engine:
             Returns:
                 Nothing
         """
-        
+
+        # remember the object as the map has it, for delta saves
+        obj.map_id = self.gameState.currentMap
+        if obj.ID not in self.gameState.baselines:
+            self.gameState.setBaseline(obj)
+
         ref = self.gameState.getObjectById(obj.ID) 
         if ref is None:
             # no, add it to the game state
-            obj.map_id = self.gameState.currentMap
-            self.gameState.objects[obj.ID] = obj
+            self.gameState.addObject(obj)
         else:
             # yes, use the current game state data
             obj.X = ref.X
@@ -165,9 +210,9 @@ class Engine:
             obj.gfx = ref.gfx  
             
         # add it to the view
-        self.view.activeMap.addObject(obj.ID, instance)          
+        self.view.getLoadingMap().addObject(obj.ID, instance)          
        
-        if obj.trueAttr("NPC"):
+        if obj.capabilities & NPC:
             # create the agent
             obj.setup()
             
@@ -190,12 +235,11 @@ class Engine:
            @param ident: ID of object
            @rtype: boolean
            @return: Status of result (True/False)"""
-        for i in self.gameState.getObjectsFromMap(self.gameState.currentMap):
-            if (i.ID == ident):
-                # we found a match
-                return i         
-        # no match
-        return False
+        obj = self.gameState.getObjectOnMap(ident, self.gameState.currentMap)
+        if obj is None:
+            # no match
+            return False
+        return obj
 
     def getItemActions(self, obj_id):
         """Given the objects ID, return the text strings and callbacks.
@@ -208,11 +252,11 @@ class Engine:
         obj = self.gameState.getObjectById(obj_id)
         
         if obj:
-            if obj.trueAttr("NPC"):
+            if obj.capabilities & NPC:
                 # keep it simple for now, None to be replaced by callbacks
                 actions.append(["Talk", "Talk", self.initTalk, obj])
                 actions.append(["Attack", "Attack", self.nullFunc, obj]) 
-            elif obj.trueAttr("Door"):
+            elif obj.capabilities & DOOR:
                 actions.append(["Change Map", "Change Map", \
                        self.gameState.PC.approach, [obj.X, obj.Y], \
                         ChangeMapAction(self, self.doors[str(i.ID)].map, [i.destx, i.desty])])
@@ -221,10 +265,10 @@ class Engine:
                 actions.append(["Examine", "Examine", self.gameState.PC.approach,  
                                 [obj.X, obj.Y], ExamineBoxAction(self, obj.name, obj.text)])
                 # is it a container?
-                if obj.trueAttr("container"):
+                if obj.capabilities & CONTAINER:
                     actions.append(["Open", "Open", self.gameState.PC.approach, [obj.X, obj.Y], OpenBoxAction(self, "Box")])
                 # can you pick it up?
-                if obj.trueAttr("carryable"):
+                if obj.capabilities & CARRYABLE:
                     actions.append(["Pick Up", "Pick Up", self.nullFunc, obj])       
                     
         return actions
@@ -262,6 +306,9 @@ class Engine:
            @type position: fife.ScreenPoint
            @param position: Screen position of click
            @return: None"""
+        # the PC already belongs to the map that is being loaded
+        if self.map_job is not None:
+            return
         self.gameState.PC.run(position)
         
     def changeMap(self, map, targetPosition):
@@ -281,12 +328,62 @@ class Engine:
         # issue the mapchange
         self.mapchange = True
 
+    def startMapChange(self, map_name, map_file):
+        """Start loading a new map in the background. The current map keeps
+           running until pumpMapChange has built the new one, then they
+           are swapped.
+           @type map_name: string
+           @param map_name: Name to store the map under
+           @type map_file: string
+           @param map_file: Name of map file to load
+           @return: None"""
+        if self.map_job is not None:
+            # a change to yet another map: get the pending one over with
+            self.map_job.finish()
+            self.finishMapChange()
+        if self.view.mapInModel(str(map_file)):
+            # FIFE can't hold two maps with the same id (the current map and
+            # a map file declaring the same id as it, say), so the current
+            # map has to go first
+            self.loadMap(map_name, map_file)
+            return
+        self.gameState.currentMap = map_file
+        self.map_job = self.view.beginMapLoad(map_name, str(map_file),
+                                              self.threaded_loading,
+                                              self.load_clock)
+
+    def pumpMapChange(self):
+        """Build the map that is loaded in the background for another
+           MAP_LOAD_SLICE seconds, and swap it in once it is done.
+           @return: None"""
+        if self.map_job is None:
+            return
+        done = self.map_job.step(MAP_LOAD_SLICE)
+        self.view.hud.showLoadProgress(*self.map_job.progress)
+        if done:
+            self.finishMapChange()
+
+    def finishMapChange(self):
+        """Swap in the map loaded by startMapChange.
+           @return: None"""
+        self.map_job = None
+        self.view.finishMapLoad()
+        self.view.hud.showLoadProgress(None)
+        self.reset()
+        # create the PC agent
+        self.view.activeMap.addPC(self.gameState.PC.behaviour.agent)
+        self.gameState.PC.start()
+
     def handleCommands(self):
         if self.mapchange:
-            self.loadMap(self.targetMap)
+            self.startMapChange(self.targetMap, self.targetMap)
             self.mapchange = False
 
     def pump(self):
         """Main loop in the engine."""
         self.handleCommands()
+        self.pumpMapChange()
+        # the game state is in between maps while one is being loaded
+        if self.autosaver is not None and self.map_job is None:
+            self.autosaver.pump(self.gameState)
 
@@ -15,7 +15,50 @@
 #   You should have received a copy of the GNU General Public License
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
+import operator
 from objects import base
+from objects.base import CAPABILITIES
+
+def snapshotObject(obj):
+    """Takes a snapshot of the saved fields of an object, that stays the
+       same when the object changes (to one level deep: lists and dicts in
+       the fields are copied, not their contents).
+       @type obj: GameObject
+       @param obj: The object
+       @rtype: tuple
+       @return: The snapshot; compare it with fieldValues of the object"""
+    return tuple([_copy(value) for value in fieldValues(obj)])
+
+def fieldValues(obj):
+    """Gets the values of the saved fields of an object.
+       @type obj: GameObject
+       @param obj: The object
+       @rtype: tuple
+       @return: The values, with _MISSING for fields that are not set"""
+    cls = obj.__class__
+    getter = _getters.get(cls)
+    if getter is None:
+        fields = cls.saved_fields
+        getter = _getters[cls] = operator.attrgetter(*(fields + fields[:1]))
+    try:
+        # the first field is fetched twice so there is always a tuple
+        return getter(obj)[:-1]
+    except AttributeError:
+        return tuple([getattr(obj, field, _MISSING)
+                      for field in cls.saved_fields])
+
+# class -> attrgetter of its saved fields
+_getters = {}
+# stands in for a field that isn't set
+_MISSING = ('missing',)
+
+def _copy(value):
+    kind = type(value)
+    if kind is list:
+        return list(value)
+    elif kind is dict:
+        return dict(value)
+    return value
 
 class GameState(object):
     """This class holds the current state of the game."""
@@ -23,15 +66,161 @@ class GameState(object):
         """initialize attributes"""
         self.PC = None
         self.objects = {}
+        # map_id -> {ID: object}, kept in step with self.objects so that
+        # per-map lookups don't have to scan every object in the game
+        self.map_objects = {}
+        # capability bit -> {ID: object} for every object of a class with it
+        self.capability_objects = {}
+        # ID -> snapshotObject of the object as its map created it, see
+        # setBaseline
+        self.baselines = {}
+        # IDs of objects created by their map that have been removed since
+        self.destroyed = set()
         self.currentMap = None
-        
+
+    def __getstate__(self):
+        """The indexes are derived data, so leave them out of saves."""
+        state = self.__dict__.copy()
+        state.pop('map_objects', None)
+        state.pop('capability_objects', None)
+        state.pop('baselines', None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore a saved game state and rebuild the indexes. This also
+           works for saves written before the indexes existed."""
+        self.baselines = {}
+        self.destroyed = set()
+        self.__dict__.update(state)
+        self.rebuildIndex()
+
+    def rebuildIndex(self):
+        """Rebuilds the per-map and per-capability indexes from self.objects.
+           @return: None"""
+        self.map_objects = {}
+        self.capability_objects = {}
+        for obj in self.objects.values():
+            self.indexObject(obj)
+
+    def indexObject(self, obj):
+        """Adds an object to the indexes."""
+        self.map_objects.setdefault(obj.map_id, {})[obj.ID] = obj
+        for bit in obj.capability_bits:
+            self.capability_objects.setdefault(bit, {})[obj.ID] = obj
+
+    def unindexObject(self, obj):
+        """Removes an object from the indexes."""
+        on_map = self.map_objects.get(obj.map_id)
+        if on_map is not None:
+            on_map.pop(obj.ID, None)
+            if not on_map:
+                del self.map_objects[obj.map_id]
+        for bit in obj.capability_bits:
+            self.capability_objects[bit].pop(obj.ID, None)
+
+    def addObject(self, obj, map_id=None):
+        """Adds an object to the game state, replacing any object that
+           already has the same ID.
+           @type obj: GameObject
+           @param obj: The object to add.
+           @type map_id: String
+           @param map_id: The map the object is on; if None the object's own
+                          map_id is kept.
+           @return: None"""
+        old = self.objects.get(obj.ID)
+        if old is not None:
+            self.unindexObject(old)
+        if map_id is not None:
+            obj.map_id = map_id
+        self.objects[obj.ID] = obj
+        self.indexObject(obj)
+
+    def removeObject(self, id):
+        """Removes an object from the game state. If its map created it, it
+           is remembered as destroyed so that the map won't create it again.
+           @type id: String
+           @param id: The id of the object.
+           @returns: The removed object or None."""
+        obj = self.objects.pop(id, None)
+        if obj is not None:
+            self.unindexObject(obj)
+            if self.baselines.pop(id, None) is not None:
+                self.destroyed.add(id)
+        return obj
+
+    def moveObject(self, id, map_id):
+        """Moves an object to another map.
+           @type id: String
+           @param id: The id of the object.
+           @type map_id: String
+           @param map_id: The map to move the object to.
+           @returns: The moved object or None if there is no such object."""
+        obj = self.objects.get(id)
+        if obj is not None and obj.map_id != map_id:
+            self.unindexObject(obj)
+            obj.map_id = map_id
+            self.indexObject(obj)
+        return obj
+
+    def setBaseline(self, obj):
+        """Remembers the state of an object as its map creates it. Delta
+           saves (see savegame.writeGame) only hold the objects that differ
+           from their baseline.
+           @type obj: GameObject
+           @param obj: The object, as just created from its map
+           @return: None"""
+        self.baselines[obj.ID] = snapshotObject(obj)
+
+    def isChanged(self, obj):
+        """Checks if an object differs from its baseline.
+           @type obj: GameObject
+           @param obj: The object
+           @rtype: Boolean
+           @return: True if it differs, or it has no baseline"""
+        baseline = self.baselines.get(obj.ID)
+        return baseline is None or baseline != fieldValues(obj)
+
     def getObjectsFromMap(self, map_id):
         """Gets all objects that are currently on the given map.
            @type map: String
            @param map: The map name.
            @returns: The list of objects on this map."""
-        return [i for i in self.objects.values() if i.map_id == map_id]
-    
+        return self.map_objects.get(map_id, {}).values()
+
+    def getObjectsWithCapability(self, mask, map_id=None):
+        """Gets all objects with the given capabilities, e.g. all NPCs on a
+           map, without looking at any other objects.
+           @type mask: Integer
+           @param mask: Capability bits from objects.base OR'd together
+           @type map_id: String
+           @param map_id: The map name, or None for all maps.
+           @returns: The list of objects."""
+        # start from the smallest index that covers the query
+        candidates = None
+        if map_id is not None:
+            candidates = self.map_objects.get(map_id, {})
+        for bit in CAPABILITIES.values():
+            if mask & bit:
+                with_bit = self.capability_objects.get(bit, {})
+                if candidates is None or len(with_bit) < len(candidates):
+                    candidates = with_bit
+        if candidates is None:
+            candidates = self.objects
+        return [obj for obj in candidates.values()
+                if obj.capabilities & mask == mask and
+                (map_id is None or obj.map_id == map_id)]
+
+    def getObjectOnMap(self, id, map_id):
+        """Gets an object by it's id if it is on the given map.
+           @type id: String
+           @param id: The id of the object.
+           @type map_id: String
+           @param map_id: The map name.
+           @returns: The object or None."""
+        on_map = self.map_objects.get(map_id)
+        if on_map is not None:
+            return on_map.get(id)
+   
     def getObjectById(self, id):
         """Gets an object by it's id
            @type id: String
@@ -40,3 +229,40 @@ class GameState(object):
         if id in self.objects:
             return self.objects[id]
 
+    def checkConsistency(self):
+        """Checks that the indexes match self.objects.
+           @rtype: list
+           @return: A description of every mismatch; empty if consistent."""
+        problems = []
+        indexed = 0
+        for map_id, on_map in self.map_objects.items():
+            if not on_map:
+                problems.append("empty index entry for map %r" % (map_id,))
+            for id, obj in on_map.items():
+                indexed += 1
+                if self.objects.get(id) is not obj:
+                    problems.append("%r on map %r is not in objects" %
+                                    (id, map_id))
+                elif obj.map_id != map_id:
+                    problems.append("%r indexed on map %r but is on %r" %
+                                    (id, map_id, obj.map_id))
+        for id, obj in self.objects.items():
+            if obj.ID != id:
+                problems.append("%r stored under id %r" % (obj.ID, id))
+            if self.map_objects.get(obj.map_id, {}).get(id) is not obj:
+                problems.append("%r missing from index of map %r" %
+                                (id, obj.map_id))
+            for bit in obj.capability_bits:
+                if self.capability_objects.get(bit, {}).get(id) is not obj:
+                    problems.append("%r missing from index of capability %d"
+                                    % (id, bit))
+        for bit, with_bit in self.capability_objects.items():
+            for id, obj in with_bit.items():
+                if self.objects.get(id) is not obj or \
+                   not obj.capabilities & bit:
+                    problems.append("%r wrongly in index of capability %d" %
+                                    (id, bit))
+        if indexed != len(self.objects):
+            problems.append("index holds %d objects, objects holds %d" %
+                            (indexed, len(self.objects)))
+        return problems
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import time
+
+# default size in pixels of the screen cells the hover query is memoized by
+DEFAULT_CELL = 4
+# default number of hover queries allowed per second
+DEFAULT_RATE = 20
+
+class HoverTracker(object):
+    """Keeps track of the instances under the mouse cursor, so that moving
+       the mouse only queries the camera when the cursor enters another
+       screen cell, at most rate times per second, and only outlines or
+       names an instance when the cursor enters or leaves it. The callbacks
+       do all the work on the engine."""
+    def __init__(self, query, lookup, enter, leave, cell=DEFAULT_CELL,
+                 rate=DEFAULT_RATE, clock=time.time):
+        """Set up the tracker.
+           @type query: function
+           @param query: query(x, y) returns the instances at a screen point
+           @type lookup: function
+           @param lookup: lookup(id) returns the game object of an instance
+                          id, or a false value if the object is not active
+           @type enter: function
+           @param enter: enter(instance, object) is called when the cursor
+                         moves onto an instance
+           @type leave: function
+           @param leave: leave(instance) is called when the cursor moves off
+                         an instance
+           @type cell: integer
+           @param cell: Size in pixels of a memoized screen cell
+           @type rate: integer
+           @param rate: Queries allowed per second, 0 for no limit
+           @type clock: function
+           @param clock: Returns the current time in seconds
+           @return: None"""
+        self.query = query
+        self.lookup = lookup
+        self.enter = enter
+        self.leave = leave
+        self.cell = max(1, cell)
+        self.interval = rate and 1.0 / rate or 0
+        self.clock = clock
+        self.stats = {'moves': 0, 'queries': 0, 'entered': 0, 'left': 0}
+        self.reset()
+
+    def reset(self):
+        """Forget everything without calling leave, for when the instances
+           are gone anyway (e.g. on a map change).
+           @return: None"""
+        # instance id -> instance, for every hovered active instance
+        self.hovered = {}
+        self.last_cell = None
+        self.last_query = None
+        # screen point still waiting for a query because of the rate limit
+        self.pending = None
+
+    def moved(self, x, y):
+        """The mouse moved to screen point x, y.
+           @return: None"""
+        self.stats['moves'] += 1
+        cell = (x // self.cell, y // self.cell)
+        if cell == self.last_cell:
+            self.pending = None
+            return
+        now = self.clock()
+        if self.last_query is not None and \
+           now - self.last_query < self.interval:
+            self.pending = (x, y)
+            return
+        self.update(x, y, now)
+
+    def pump(self):
+        """Run a query held back by the rate limit, once it is allowed.
+           Call this every frame.
+           @return: None"""
+        if self.pending is not None:
+            now = self.clock()
+            if now - self.last_query >= self.interval:
+                x, y = self.pending
+                self.update(x, y, now)
+
+    def update(self, x, y, now):
+        """Query the instances at x, y and handle the transitions."""
+        self.stats['queries'] += 1
+        self.pending = None
+        self.last_query = now
+        self.last_cell = (x // self.cell, y // self.cell)
+        hovered = {}
+        for inst in self.query(x, y):
+            id = inst.getId()
+            if id in self.hovered:
+                hovered[id] = self.hovered.pop(id)
+                continue
+            obj = self.lookup(id)
+            if obj:
+                hovered[id] = inst
+                self.stats['entered'] += 1
+                self.enter(inst, obj)
+        for inst in self.hovered.values():
+            self.stats['left'] += 1
+            self.leave(inst)
+        self.hovered = hovered
+
+    def forget(self, ids):
+        """Drop instances that have been deleted, without calling leave.
+           @type ids: list
+           @param ids: The ids of the deleted instances
+           @return: None"""
+        for id in ids:
+            if self.hovered.pop(id, None) is not None:
+                # the cursor may be over whatever replaces it
+                self.last_cell = None
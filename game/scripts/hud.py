@@ -95,6 +95,20 @@ class Hud(object):
         self.actionsText.insert(0, action)
         self.refreshActionsBox()
 
+    def showLoadProgress(self, text, fraction=0.0):
+        """Show how far the map that is loaded in the background is.
+           @type text: string
+           @param text: What the loader is doing, None to clear the display
+           @type fraction: float
+           @param fraction: How much of the map is loaded, from 0 to 1
+           @return: None"""
+        label = self.hud.findChild(name="loadProgress")
+        if text is None:
+            label.text = unicode("")
+        else:
+            label.text = unicode("Loading: %.0f%% (%s)" %
+                                 (fraction * 100, text))
+
     def showHUD(self):
         """Show the HUD.
            @return: None"""
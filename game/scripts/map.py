@@ -16,12 +16,23 @@
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
 import fife, time
-from local_loaders.loaders import loadMapFile
+from local_loaders.loaders import loadMapFile, loadMapFileAsync, \
+     finishMapFileAsync
+from local_loaders.chunks import CHUNK_RADIUS
 from scripts.common.eventlistenerbase import EventListenerBase
 
 from settings import Setting
 TDS = Setting()
 
+def chunkSettings():
+    """Read the chunked map settings.
+       @rtype: tuple
+       @return: (chunk size, chunk radius); a size of 0 means maps are not
+                chunked"""
+    size = TDS.readSetting("ChunkSize")
+    radius = TDS.readSetting("ChunkRadius")
+    return int(size or 0), int(radius or CHUNK_RADIUS)
+
 class Map(fife.MapChangeListener):
     """Map class used to flag changes in the map"""
     def __init__(self, engine, data):
@@ -41,14 +52,19 @@ class Map(fife.MapChangeListener):
         self.cur_cam2_x, self.initial_cam2_x, self.cam2_scrolling_right = 0,0,True
         self.target_rotation = 0
         self.outline_renderer = None
+        self.load_job = None
+        # the chunks of a chunked map and the PC agent they follow
+        self.chunks = None
+        self.pc_agent = None
         
     def reset(self):
         """Reset the data to default settings.
            @return: None"""
         # We have to delete the map in Fife.
         # TODO: We're killing the PC now, but later we will have to save the PC
+        # The objects are kept: the import registry in local_loaders.loaders
+        # shares them between maps, so they are not imported again
         if self.map:
-            self.model.deleteObjects()
             self.model.deleteMap(self.map)
         self.transitions = []
         self.obj_hash = {}
@@ -60,6 +76,8 @@ class Map(fife.MapChangeListener):
         self.cur_cam2_x,self.initial_cam2_x,self.cam2_scrolling_right = 0,0,True
         self.target_rotation = 0
         self.outline_renderer = None
+        self.chunks = None
+        self.pc_agent = None
         
     def makeActive(self):
         """Makes this map the active one.
@@ -72,8 +90,55 @@ class Map(fife.MapChangeListener):
            @param filename: Name of map to load
            @return: None"""
         self.reset()
-        self.map = loadMapFile(filename, self.engine, self.data)
-         
+        chunk_size, chunk_radius = chunkSettings()
+        self.map = loadMapFile(filename, self.engine, self.data,
+                               chunk_size=chunk_size,
+                               chunk_radius=chunk_radius)
+        self.setup()
+
+    def beginLoad(self, filename, threaded=True, clock=time.time,
+                  prepared=None):
+        """Start loading a map in the background (see loadMapFileAsync).
+           Unlike load, this leaves the view alone: the current map keeps
+           being rendered until finishLoad.
+           @type filename: string
+           @param filename: Name of map to load
+           @type threaded: boolean
+           @param threaded: Read the map on a worker thread
+           @type clock: function
+           @param clock: Clock the job measures its time slices with
+           @type prepared: tuple
+           @param prepared: The map as prefetched by prepareMapFile, if it was
+           @rtype: mapjob.MapLoadJob
+           @return: The job, to be stepped until it is done"""
+        chunk_size, chunk_radius = chunkSettings()
+        self.load_job = loadMapFileAsync(filename, self.engine, self.data,
+                                         threaded, clock, prepared,
+                                         chunk_size, chunk_radius)
+        return self.load_job
+
+    def finishLoad(self, previous=None):
+        """Finish a load started with beginLoad once its job is done. The
+           previous map is reset first, to make room for the cameras of this
+           one. If the loader could not create the map (it has printed why),
+           nothing is done and the previous map is left as it is.
+           @type previous: Map
+           @param previous: The map this one replaces, if any
+           @rtype: boolean
+           @return: Whether the map was loaded"""
+        job, self.load_job = self.load_job, None
+        if job.loader.map is None:
+            return False
+        if previous is not None:
+            previous.reset()
+        self.map = finishMapFileAsync(job)
+        self.setup()
+        return True
+
+    def setup(self):
+        """Set up the layers, cameras and renderers of a loaded map.
+           @return: None"""
+        self.chunks = self.map.chunks
         # there must be a PC object on the objects layer!
         self.agent_layer = self.map.getLayer('ObjectLayer')
         
@@ -105,6 +170,22 @@ class Map(fife.MapChangeListener):
         # actually this is real easy, we just have to
         # attach the main camera to the PC
         self.cameras['main'].attach(agent)
+        # and bring in the chunks around it
+        self.pc_agent = agent
+        self.updateChunks()
+
+    def updateChunks(self):
+        """Load the chunks around the PC and unload the others, if the map
+           is chunked. Cheap while the PC stays in its chunk.
+           @rtype: list
+           @return: The ids of the instances that were deleted"""
+        if self.chunks is None or self.pc_agent is None:
+            return []
+        coords = self.pc_agent.getLocation().getLayerCoordinates()
+        deleted = self.chunks.update(coords.x, coords.y)
+        for id in deleted:
+            self.obj_hash.pop(id, None)
+        return deleted
 
     def addObject(self, name, obj):
         """Add an object to this map0
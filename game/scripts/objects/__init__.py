@@ -20,15 +20,28 @@ import sys
 
 object_modules = [containers, actors,]
 
+# name of a concrete game object class -> the class, see registerObject
+object_registry = {}
+
+def registerObject (obj_class, name = None):
+    """Makes a game object class available to createObject under its name,
+    or the given one. Returns the class, so it can be used as a decorator
+    by modules adding object classes of their own:
+
+        @registerObject
+        class TinCan (GameObject, Carryable):
+            ..."""
+    object_registry[name or obj_class.__name__] = obj_class
+    return obj_class
+
+for module in object_modules:
+    for class_name in module.__all__:
+        registerObject(getattr(module, class_name), class_name)
+
 def getAllObjects ():
     """Returns a dictionary with the names of the concrete game object classes
     mapped to the classes themselves"""
-    result = {}
-    for module in object_modules:
-        for class_name in module.__all__:
-            result[class_name] = getattr (module,class_name)
-            
-    return result
+    return dict(object_registry)
 
 def createObject(info, extra = {}):
         """Called when we need to get an actual object. 
@@ -37,16 +50,33 @@ def createObject(info, extra = {}):
            @type extra: dict
            @param extra: stores additionally required attributes, like agent layer, engine etc.
            @return: the object"""
-        # First, we try to get the type and ID, which every game_obj needs.
-        try:
-            obj_type = info.pop('type')
-            ID = info.pop('id')
-        except KeyError:
-            sys.stderr.write("Error: Game object missing type or id.")
-            sys.exit(False)
-        
-        # add the extra info
-        for key, val in extra.items():
-            info[key] = val
-
-        return getAllObjects()[obj_type](ID, **info)
\ No newline at end of file
+        return createObjects([info], extra)[0]
+
+def createObjects(infos, extra = {}):
+        """Creates several objects in one go, e.g. all those of a map layer.
+           @type infos: list
+           @param infos: an info dict as taken by createObject for every object
+           @type extra: dict
+           @param extra: additionally required attributes shared by all objects
+           @return: the objects, in the order of infos"""
+        objects = []
+        for info in infos:
+            # First, we try to get the type and ID, which every game_obj needs.
+            try:
+                obj_type = info.pop('type')
+                ID = info.pop('id')
+            except KeyError:
+                sys.stderr.write("Error: Game object missing type or id.")
+                sys.exit(False)
+
+            # add the extra info
+            info.update(extra)
+
+            # values the type has as defaults are shared, not stored per object
+            obj_class = object_registry[obj_type]
+            for key, val in obj_class.defaults.items():
+                if key in info and info[key] == val:
+                    del info[key]
+
+            objects.append(obj_class(ID, **info))
+        return objects
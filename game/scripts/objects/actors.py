@@ -15,7 +15,6 @@
 #   You should have received a copy of the GNU General Public License
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 import fife
-from scripts import world
 from base import *
 
 """All actors go here. Concrete classes only."""
@@ -98,6 +97,10 @@ class PlayerCharacter (GameObject, Living, CharStats):
     """
     PC class
     """
+    _fields = ('is_PC', 'inventory', 'state', 'behaviour', 'posx', 'posy')
+    _transient = ('behaviour',)
+    capability = 'PC'
+
     def __init__ (self, ID, agent_layer = None, **kwargs):
         GameObject.__init__( self, ID, **kwargs )
         Living.__init__( self, **kwargs )
@@ -207,8 +210,12 @@ class NonPlayerCharacter(GameObject, Living, Scriptable, CharStats):
     """
     NPC class
     """
-    def __init__(self, ID, agent_layer = None, name = 'NPC', \
-                 text = 'A nonplayer character', **kwargs):
+    _fields = ('is_NPC', 'inventory', 'state', 'behaviour')
+    _transient = ('behaviour',)
+    capability = 'NPC'
+    defaults = {'name': 'NPC', 'text': 'A nonplayer character'}
+
+    def __init__(self, ID, agent_layer = None, **kwargs):
         # init game object
         GameObject.__init__( self, ID, **kwargs )
         Living.__init__( self, **kwargs )
@@ -27,10 +27,26 @@
       *at the end* of your __init__() (makes it easier to follow)
    3. There should always be an is_x class member set to True on __init__ 
       (where X is the name of the class)
+   4. Declare the capability the class adds in a capability class member 
+      (named like the is_x member). The capabilities of a game object class 
+      are combined into a bitmask once, when the class is created, so use 
+      hasCapability() rather than trueAttr() for them on hot paths.
+   5. Game objects keep their attributes in __slots__ instead of a __dict__. 
+      Set __slots__ to an empty tuple and list every attribute __init__ or any
+      other method sets in a _fields class member; the slots of the game 
+      object classes are made from the _fields of all their bases. Fields
+      that can't or shouldn't be saved (engine objects) are also listed in a
+      _transient class member.
+   6. Data that is the same for most objects of a class (names, descriptions,
+      graphics) goes in a defaults class member instead of _fields. Objects
+      only store the values that differ from it.
 
    EXAMPLE:
 
    class Openable(object):
+       __slots__ = ()
+       _fields = ('is_openable', 'is_open')
+       capability = 'openable'
        def __init__ (self, is_open = True, **kwargs):
            self.is_openable = True
            self.is_open = is_open
@@ -43,23 +59,153 @@
    2. Base classes other than GameObject can be inherited in any order
    3. The __init__ functoin of the composed class should always invoke the
       parent's __init__() *before* it starts customizing any variables.
+   4. Attributes that only the composed class sets go in its own _fields 
+      member (don't set __slots__ there, that is done for you).
+   5. Only one of the bases may be a game object class, as Python can't 
+      combine the slots of two of them.
 
    EXAMPLE:
 
    class TinCan (GameObject, Container, Scriptable, Destructable, Carryable):
+       _fields = ('dented',)
+       defaults = {'name': 'Tin Can'}
        def __init__ (self, *args, **kwargs):
            super(TinCan,self).__init__ (*args, **kwargs)
-           self.name = 'Tin Can'"""
+           self.dented = False"""
 import fife
 from settings import Setting
 from random import randrange
 
+# capability name -> bit in the capabilities mask of game object classes
+CAPABILITIES = {}
+
+def capabilityBit(name):
+    """Gets the bit of a capability, assigning the next free bit to a new one.
+       @type name: String
+       @param name: The capability, e.g. 'container'
+       @rtype: Integer
+       @return: The bit"""
+    if name not in CAPABILITIES:
+        CAPABILITIES[name] = 1 << len(CAPABILITIES)
+    return CAPABILITIES[name]
+
+OPENABLE = capabilityBit('openable')
+LOCKABLE = capabilityBit('lockable')
+CARRYABLE = capabilityBit('carryable')
+CONTAINER = capabilityBit('container')
+INVENTORY = capabilityBit('inventory')
+LIVING = capabilityBit('living')
+SCRIPTABLE = capabilityBit('scriptable')
+CHARSTATS = capabilityBit('charstats')
+WEARABLE = capabilityBit('wearable')
+USABLE = capabilityBit('usable')
+WEAPON = capabilityBit('weapon')
+DESTRUCTABLE = capabilityBit('destructable')
+TRAPPABLE = capabilityBit('trappable')
+PC = capabilityBit('PC')
+NPC = capabilityBit('NPC')
+DOOR = capabilityBit('Door')
+
+def classFields(klass):
+    """Gets the _fields of a class and all its bases.
+       @type klass: Class
+       @param klass: The class
+       @rtype: list
+       @return: The field names, bases first and without duplicates"""
+    fields = []
+    for base in reversed(klass.__mro__):
+        for field in base.__dict__.get('_fields', ()):
+            if field not in fields:
+                fields.append(field)
+    return fields
+
+class SharedField(object):
+    """Descriptor for a field listed in the defaults of a game object class.
+       Reads return the object's override if it has one, otherwise the 
+       default that all objects of the class share. Setting the default 
+       value drops the override again."""
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return cls.defaults[self.name]
+        overrides = obj.overrides
+        if overrides is not None and self.name in overrides:
+            return overrides[self.name]
+        return obj.defaults[self.name]
+
+    def __set__(self, obj, value):
+        overrides = obj.overrides
+        if value == obj.defaults[self.name]:
+            if overrides is not None:
+                overrides.pop(self.name, None)
+                if not overrides:
+                    obj.overrides = None
+            return
+        if type(value) is str:
+            # identical text read for many objects is only kept once
+            value = intern(value)
+        if overrides is None:
+            obj.overrides = overrides = {}
+        overrides[self.name] = value
+
+class GameObjectClass(type):
+    """Metaclass of the game objects. Turns the _fields of a class and its
+       bases into __slots__, combines their capability members into the 
+       capabilities bitmask of the class, and keeps the single bits in 
+       capability_bits. The fields of the class and its bases end up in
+       field_names, and those that are saved in saved_fields. Their 
+       defaults are merged into defaults and get a SharedField each."""
+    def __new__(meta, name, bases, members):
+        if '__slots__' not in members:
+            fields = []
+            for base in bases:
+                for field in classFields(base) + list(members.get('_fields', ())):
+                    if field not in fields:
+                        fields.append(field)
+            slotted = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    slotted.update(klass.__dict__.get('__slots__', ()))
+            members['__slots__'] = tuple([field for field in fields 
+                                          if field not in slotted])
+        return super(GameObjectClass, meta).__new__(meta, name, bases, members)
+
+    def __init__(cls, name, bases, members):
+        super(GameObjectClass, cls).__init__(name, bases, members)
+        mask = 0
+        for klass in cls.__mro__:
+            capability = klass.__dict__.get('capability')
+            if capability:
+                mask |= capabilityBit(capability)
+        defaults = {}
+        for klass in reversed(cls.__mro__):
+            defaults.update(klass.__dict__.get('defaults', {}))
+        cls.defaults = defaults
+        for field in defaults:
+            if not isinstance(getattr(cls, field, None), SharedField):
+                setattr(cls, field, SharedField(field))
+        cls.field_names = tuple(classFields(cls))
+        transient = set()
+        for klass in cls.__mro__:
+            transient.update(klass.__dict__.get('_transient', ()))
+        cls.saved_fields = tuple([field for field in cls.field_names
+                                  if field not in transient])
+        cls.capabilities = mask
+        cls.capability_bits = tuple([bit for bit in CAPABILITIES.values()
+                                     if mask & bit])
+
 class GameObject (object):
     """A base class to be inherited by all game objects. This must be the
        first class (left to right) inherited by any game object."""
-    def __init__ (self, ID, gfx = {}, xpos = 0.0, ypos = 0.0, map_id = None, 
-                  blocking=True, name="Generic object", text="Item description",
-                  desc="Detailed description", **kwargs):
+    __metaclass__ = GameObjectClass
+    _fields = ('ID', 'X', 'Y', 'map_id', 'blocking', 'overrides')
+    defaults = {'gfx': {}, 'name': "Generic object", 
+                'text': "Item description", 'desc': "Detailed description"}
+
+    def __init__ (self, ID, gfx = None, xpos = 0.0, ypos = 0.0, map_id = None, 
+                  blocking=True, name=None, text=None, desc=None, **kwargs):
         """Set the basic values that are shared by all game objects.
            @type ID: String
            @param ID: Unique object identifier. Must be present.
@@ -77,23 +223,67 @@ class GameObject (object):
            @param text: A longer description of the item
            @type desc: String
            @param desc: A long description of the item that is displayed when it is examined
+           
+           gfx, name, text and desc default to the defaults of the class.
            """
         
         self.ID = ID
-        self.gfx = gfx
+        # the values of the defaults fields that differ for this object
+        self.overrides = None
         self.X = xpos
         self.Y = ypos
         self.map_id = map_id
         self.blocking = True
-        self.name = name
-        self.text = text
-        self.desc = desc
+        for field, value in (('gfx', gfx), ('name', name), ('text', text),
+                             ('desc', desc)):
+            if value is not None:
+                setattr(self, field, value)
         
     def trueAttr(self, attr):
         """Shortcut function to check if the current object has a member named
            is_%attr and if that attribute evaluates to True"""
         return hasattr(self,'is_%s' % attr) and getattr(self, 'is_%s' % attr)
 
+    def hasCapability(self, mask):
+        """Check if the class of the object has all the given capabilities.
+           This is what the class can do, not its current state: a dead
+           Living object still has the LIVING capability.
+           @type mask: Integer
+           @param mask: Capability bits OR'd together, e.g. CONTAINER | LOCKABLE
+           @rtype: Boolean
+           @return: Whether all the capabilities are present"""
+        return self.capabilities & mask == mask
+
+    def __getstate__(self):
+        """Slotted objects have no __dict__ for pickle to save, so hand it 
+           the fields that are set instead. Defaults are not saved, only 
+           the overrides.
+           @rtype: Dictionary
+           @return: field name -> value"""
+        state = {}
+        for field in self.field_names:
+            if hasattr(self, field):
+                state[field] = getattr(self, field)
+        return state
+
+    def __setstate__(self, state):
+        """Restores the fields saved by __getstate__. Also takes the 
+           __dict__ of objects saved before game objects were slotted; 
+           attributes that are no longer kept are dropped.
+           @type state: Dictionary
+           @param state: field name -> value"""
+        if isinstance(state, tuple):
+            # (__dict__, slots) as saved by pickle protocol 2
+            dict_state, slot_state = state
+            state = dict(dict_state or {})
+            state.update(slot_state or {})
+        self.overrides = None
+        for field, value in state.items():
+            try:
+                setattr(self, field, value)
+            except AttributeError:
+                pass
+
     def _getCoords(self):
         """Get-er property function"""
         return (self.X, self.Y)
@@ -112,6 +302,9 @@ class GameObject (object):
 class Openable(object):
     """Adds open() and .close() capabilities to game objects
     The current state is tracked by the .is_open variable"""
+    __slots__ = ()
+    _fields = ('is_openable', 'is_open')
+    capability = 'openable'
     def __init__(self, is_open = True, **kwargs):
         """Init operation for openable objects
         @type is_open: Boolean
@@ -122,17 +315,20 @@ class Openable(object):
     def open(self):
         """Opens the object, and runs an 'onOpen' script, if present"""
         self.is_open = True
-        if self.trueAttr ('scriptable'):
+        if self.capabilities & SCRIPTABLE:
             self.runScript('onOpen')
             
     def close(self):
         """Opens the object, and runs an 'onClose' script, if present"""
         self.is_open = False
-        if self.trueAttr ('scriptable'):
+        if self.capabilities & SCRIPTABLE:
             self.runScript('onClose')             
         
 class Lockable (Openable):
     """Allows objects to be locked"""
+    __slots__ = ()
+    _fields = ('is_lockable', 'locked')
+    capability = 'lockable'
     def __init__ (self, locked = True, **kwargs):
         """Init operation for lockable objects
         @type locked: Boolean
@@ -160,6 +356,9 @@ class Lockable (Openable):
         
 class Carryable (object):
     """Allows objects to be stored in containers"""
+    __slots__ = ()
+    _fields = ('is_carryable', 'in_container', 'weight')
+    capability = 'carryable'
     def __init__ (self, **kwargs):
         self.is_carryable = True
         self.in_container = None
@@ -167,6 +366,9 @@ class Carryable (object):
     
 class Container (object):
     """Gives objects the capability to hold other objects"""
+    __slots__ = ()
+    _fields = ('is_container', 'items')
+    capability = 'container'
     def __init__ (self, **kwargs):
         self.is_container = True
         self.items = []
@@ -174,12 +376,12 @@ class Container (object):
     def placeItem (self, item):
         """Adds the provided carriable item to the inventory. 
            Runs an 'onStoreItem' script, if present"""    
-        if not item.trueAttr ('carryable'):
+        if not item.capabilities & CARRYABLE:
             raise ValueError ('% is not carriable!' % item)
         item.in_container = self
         self.items.append (item)
         # Run any scripts associated with storing an item in the container
-        if self.trueAttr ('scriptable'):
+        if self.capabilities & SCRIPTABLE:
             self.runScript('onPlaceItem')
         
     def takeItem (self, item):
@@ -189,16 +391,22 @@ class Container (object):
             raise ValueError ('I do not contain this item: %s' % item)
         self.items.remove (item)
         # Run any scripts associated with popping an item out of the container
-        if self.trueAttr ('scriptable'):
+        if self.capabilities & SCRIPTABLE:
             self.runScript('ontakeItem')
         
 class Inventory (object):
     """Aggregate class for things that have multiple Containers"""
+    __slots__ = ()
+    _fields = ('is_inventory', 'containers')
+    capability = 'inventory'
     def __init__ (self, **kwargs):
         self.is_inventory = True
         self.containers = []
     
 class Living (object):
+    __slots__ = ()
+    _fields = ('is_living',)
+    capability = 'living'
     def __init__ (self, **kwargs):
         self.is_living = True
     def die(self):
@@ -206,6 +414,9 @@ class Living (object):
         
 class Scriptable (object):
     """Allows objects to have predefined scripts executed on certain events"""
+    __slots__ = ()
+    _fields = ('is_scriptable', 'scripts')
+    capability = 'scriptable'
     def __init__ (self, scripts = {}, **kwargs):
         """Init operation for scriptable objects
            @type scripts: Dictionary
@@ -226,10 +437,16 @@ class Scriptable (object):
 
 class CharStats (object):
     """Provides the object with character statistics"""
+    __slots__ = ()
+    _fields = ('is_charstats',)
+    capability = 'charstats'
     def __init__ (self, **kwargs):
         self.is_charstats = True
         
 class Wearable (object):
+    __slots__ = ()
+    _fields = ('is_wearable',)
+    capability = 'wearable'
     def __init__ (self, **kwargs):
         """Allows the object to be weared somewhere on the body (e.g. pants)"""
         self.is_wearable = True
@@ -237,21 +454,33 @@ class Wearable (object):
 class Usable (object):
     """Allows the object to be used in some way (e.g. a Zippo lighter 
        to make a fire)"""
+    __slots__ = ()
+    _fields = ('is_usable',)
+    capability = 'usable'
     def __init__ (self, **kwargs):
         self.is_usable = True
         
 class Weapon (object):
     """Allows the object to be used as a weapon"""
+    __slots__ = ()
+    _fields = ('is_weapon',)
+    capability = 'weapon'
     def __init__ (self, **kwargs):
         self.is_weapon = True
         
 class Destructable (object):
     """Allows the object to be destroyed"""
+    __slots__ = ()
+    _fields = ('is_destructable',)
+    capability = 'destructable'
     def __init__ (self, **kwargs):
         self.is_destructable = True
         
 class Trappable (object):
     """Provides trap slots to the object"""
+    __slots__ = ()
+    _fields = ('is_trappable',)
+    capability = 'trappable'
     def __init__ (self, **kwargs):
         self.is_trappable = True
         
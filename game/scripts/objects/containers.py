@@ -23,7 +23,7 @@ __all__ = ["WoodenCrate",]
 from composed import ImmovableContainer
 
 class WoodenCrate (ImmovableContainer):
-    def __init__ (self, ID, name = 'Wooden Crate', \
-            text = 'A battered crate', gfx = 'crate', **kwargs):
-        ImmovableContainer.__init__(self, ID = ID, name = name, gfx = gfx, \
-                text = text, **kwargs)
+    defaults = {'name': 'Wooden Crate', 'text': 'A battered crate', 
+                'gfx': 'crate'}
+    def __init__ (self, ID, **kwargs):
+        ImmovableContainer.__init__(self, ID = ID, **kwargs)
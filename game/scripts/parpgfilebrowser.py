@@ -1,13 +1,22 @@
 # coding: utf-8
 
-import fife, sys
+import fife, sys, os, time
 import pychan
 from pychan import widgets
 from filebrowser import FileBrowser
+from saveindex import listSaves
 
 def u2s(string):
 	return string.encode(sys.getfilesystemencoding())
 
+def describeSave(name, entry):
+	"""@return: The label of a save in the file list"""
+	if entry is None or entry.info is None or entry.info.map is None:
+		return name
+	info = entry.info
+	when = time.strftime('%Y-%m-%d %H:%M', time.localtime(info.timestamp))
+	return u'%s - %s (%d, %d), %s' % (name, os.path.basename(info.map), info.x, info.y, when)
+
 class PARPGFileBrowser(FileBrowser):
 	"""
 	A sub-class of filebrowser.FileBrowser
@@ -15,6 +24,16 @@ class PARPGFileBrowser(FileBrowser):
 	def __init__(self, engine, fileSelected, savefile=False, selectdir=False, extensions=('xml',), guixmlpath="gui/filebrowser.xml"):
 		FileBrowser.__init__(self, engine, fileSelected, False, False, extensions, guixmlpath)
 
+	def _setDirectory(self):
+		"""Lists the files, and what the index knows of the saves among them"""
+		FileBrowser._setDirectory(self)
+		try:
+			saves = dict([(entry.filename, entry) for entry in listSaves(self.path)])
+		except OSError:
+			return
+		labels = [describeSave(name, saves.get(u2s(name))) for name in self.file_list]
+		self._widget.distributeInitialData({'fileList': labels})
+
 	def _selectFile(self):
 		self._widget.hide()
 		selection = self._widget.collectData('fileList')
@@ -0,0 +1,627 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# there should be NO references to FIFE here!
+"""Reads and writes saved games. A save file is laid out as:
+
+   header     SAVE_HEADER: magic, format version, flags and the offsets of
+              the parts below
+   info       SAVE_INFO: what the load browser shows of the save (see
+              readInfo), and the offset and length of the thumbnail
+   strings    every string in the save, once; values refer to them by index
+   schema     per object class: its name and the fields its records hold
+   directory  per map: the map id, and offset, length and object count of
+              the map's section
+   globals    the current map, the PC and the IDs of destroyed objects
+   sections   the objects of one map each
+   thumbnail  an image of the game when it was saved, if there is one
+
+   All numbers are little endian. A value is a one byte tag followed by its
+   data (see Writer.value). A game object is written as a record: the index
+   of its class in the schema, its ID, then one value per schema field. An
+   object that has been written before in the same section is written as a
+   reference to its ID instead, so every section can be read on its own
+   (see readMap).
+
+   A delta save (DELTA_FLAG) only holds the objects that differ from what
+   their map creates (see GameState.setBaseline); the rest is created from
+   the maps again when they are loaded.
+
+   Saving is split in two: snapshotGame copies what is saved out of the
+   live objects, and writeSnapshot encodes and writes that copy, which it
+   can do on another thread while the game goes on (see autosave).
+
+   Saves that don't start with SAVE_MAGIC are the pickled GameStates of
+   older versions; readGame still loads those."""
+
+import struct, pickle, marshal, time
+from operator import attrgetter
+from gamestate import GameState
+from objects import object_registry
+from objects.base import GameObject
+
+SAVE_MAGIC = 'PARPGSAV'
+SAVE_VERSION = 1
+# flags in the header
+DELTA_FLAG = 1
+# magic, version, flags, strings, schema, directory, globals offset,
+# globals length
+SAVE_HEADER = struct.Struct('<8sHHIIIII')
+# current map (utf-8, padded with NULs or cut short), PC position, time of
+# the save, thumbnail offset (0 for none) and length
+SAVE_INFO = struct.Struct('<128sdddII')
+
+# format version -> function(class_name, fields) returning the class name
+# and fields of a schema entry written by that version as the next version
+# would have written them; a field mapped to None is skipped. Loading
+# applies every one from the version of the file up to SAVE_VERSION.
+# Changes to the values themselves belong in the __setstate__ of the class.
+MIGRATIONS = {}
+
+_UINT = struct.Struct('<I')
+_CLASS = struct.Struct('<H')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_ENTRY = struct.Struct('<III')
+# placeholder for a field the object doesn't have set
+_MISSING = object()
+# values that are saved as they are
+_SCALARS = set([str, unicode, int, float, bool, type(None)])
+
+class SaveError(Exception):
+    """The game can't be saved, or the save can't be read"""
+    pass
+
+class ObjectRef(object):
+    """Stands in for a game object in a Snapshot"""
+    __slots__ = ('ID',)
+    def __init__(self, ID):
+        self.ID = ID
+
+class Snapshot(object):
+    """A copy of what writeGame saves of a game state, that doesn't share
+       anything that can change with the live game objects"""
+    def __init__(self, delta):
+        self.delta = delta
+        # [current map, ObjectRef to the PC, destroyed IDs]
+        self.globals = None
+        # [(map id, [ID of each object on the map])]
+        self.maps = []
+        # ID -> (class, values of savedFields(class)) of every object the
+        # others refer to; the values are marshalled if they can be
+        self.objects = {}
+        # SaveInfo of the game when the snapshot was taken
+        self.info = None
+
+def savedFields(cls):
+    """@return: The saved fields of cls that its records hold (all but the
+                ID, which comes first)"""
+    fields = _saved_fields.get(cls)
+    if fields is None:
+        fields = _saved_fields[cls] = [field for field in cls.saved_fields
+                                       if field != 'ID']
+    return fields
+
+# class -> savedFields(class)
+_saved_fields = {}
+# class -> attrgetter of savedFields(class), with the ID appended so it
+# always returns a tuple
+_getters = {}
+
+def snapshotGame(state, delta=False):
+    """Copies what writeGame would save of a game state.
+       @type state: GameState
+       @param state: The game state
+       @type delta: Boolean
+       @param delta: Only take the objects that differ from their baseline
+       @rtype: Snapshot
+       @return: The copy"""
+    snapshot = Snapshot(delta)
+    objects = snapshot.objects
+    pending = []
+
+    def claim(obj):
+        if obj.ID not in objects:
+            # claimed now, so objects that refer to each other end
+            objects[obj.ID] = None
+            pending.append(obj)
+
+    def freeze(value):
+        kind = type(value)
+        if kind in _SCALARS:
+            return value
+        elif kind is list:
+            return [freeze(item) for item in value]
+        elif kind is tuple:
+            return tuple([freeze(item) for item in value])
+        elif kind is dict:
+            return dict([(freeze(key), freeze(item))
+                         for key, item in value.items()])
+        elif isinstance(value, GameObject):
+            claim(value)
+            return ObjectRef(value.ID)
+        # writeSnapshot raises the SaveError for it
+        return value
+
+    snapshot.globals = [state.currentMap, freeze(state.PC),
+                        sorted(state.destroyed)]
+    snapshot.info = SaveInfo(SAVE_VERSION, state.currentMap,
+                             getattr(state.PC, 'X', 0.0),
+                             getattr(state.PC, 'Y', 0.0), time.time())
+    for map_id, map_objects in state.map_objects.items():
+        map_objects = map_objects.values()
+        if delta:
+            map_objects = [obj for obj in map_objects if state.isChanged(obj)]
+            if not map_objects:
+                continue
+        for obj in map_objects:
+            claim(obj)
+        snapshot.maps.append((map_id, [obj.ID for obj in map_objects]))
+    while pending:
+        obj = pending.pop()
+        cls = obj.__class__
+        getter = _getters.get(cls)
+        if getter is None:
+            getter = _getters[cls] = attrgetter(*(savedFields(cls) + ['ID']))
+        try:
+            values = getter(obj)[:-1]
+        except AttributeError:
+            values = [getattr(obj, field, _MISSING)
+                      for field in savedFields(cls)]
+        try:
+            # a marshalled copy is made in one go, and can't change; it
+            # can only hold plain values, though
+            values = marshal.dumps(values)
+        except ValueError:
+            values = [freeze(value) for value in values]
+        objects[obj.ID] = (cls, values)
+    return snapshot
+
+class SaveInfo(object):
+    """What readInfo reads of a save"""
+    def __init__(self, version, map=None, x=None, y=None, timestamp=None,
+                 thumbnail=None):
+        """@type version: integer
+           @param version: Format version, 0 for a pickled save
+           @type map: unicode
+           @param map: The current map, None if the save doesn't say
+           @type x: float
+           @param x: X position of the PC
+           @type y: float
+           @param y: Y position of the PC
+           @type timestamp: float
+           @param timestamp: Time of the save, in seconds since the epoch
+           @type thumbnail: tuple
+           @param thumbnail: Offset and length of the thumbnail, or None"""
+        self.version = version
+        self.map = map
+        self.x = x
+        self.y = y
+        self.timestamp = timestamp
+        self.thumbnail = thumbnail
+
+class Writer(object):
+    """Encodes sections, collecting the strings and schema of the save"""
+    def __init__(self, objects):
+        # ID -> (class, field values), see Snapshot
+        self.objects = objects
+        self.strings = {}
+        self.string_list = []
+        # class -> schema index
+        self.classes = {}
+        self.class_list = []
+        self.written = None
+
+    def string(self, text):
+        """@return: The index of text in the string table"""
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.string_list)
+            self.string_list.append(text)
+        return index
+
+    def schema(self, cls):
+        """@rtype: int
+           @return: The index of cls in the schema"""
+        index = self.classes.get(cls)
+        if index is None:
+            index = self.classes[cls] = len(self.class_list)
+            self.class_list.append(cls)
+        return index
+
+    def section(self, values):
+        """Encode a section of values; objects are only written in full the
+           first time they appear in it.
+           @rtype: string
+           @return: The encoded section"""
+        self.written = set()
+        out = []
+        for value in values:
+            self.value(value, out)
+        self.written = None
+        return ''.join(out)
+
+    def value(self, value, out):
+        """Append the encoding of value to the list out"""
+        kind = type(value)
+        if value is None:
+            out.append('N')
+        elif value is True:
+            out.append('T')
+        elif value is False:
+            out.append('F')
+        elif kind is int:
+            out.append('i' + _INT.pack(value))
+        elif kind is float:
+            out.append('f' + _FLOAT.pack(value))
+        elif kind is str:
+            out.append('s' + _UINT.pack(self.string(value)))
+        elif kind is unicode:
+            out.append('u' + _UINT.pack(self.string(value.encode('utf-8'))))
+        elif kind is list or kind is tuple:
+            out.append((kind is list and 'l' or 't') + _UINT.pack(len(value)))
+            for item in value:
+                self.value(item, out)
+        elif kind is dict:
+            out.append('d' + _UINT.pack(len(value)))
+            for key, item in value.items():
+                self.value(key, out)
+                self.value(item, out)
+        elif kind is ObjectRef:
+            self.record(value.ID, out)
+        else:
+            raise SaveError("Can't save %r" % (value,))
+
+    def record(self, obj_id, out):
+        """Append a game object, or a reference to it if it has already
+           been written in this section"""
+        if obj_id in self.written:
+            out.append('r')
+            self.value(obj_id, out)
+            return
+        self.written.add(obj_id)
+        cls, values = self.objects[obj_id]
+        if type(values) is str:
+            values = marshal.loads(values)
+        out.append('o' + _CLASS.pack(self.schema(cls)))
+        self.value(obj_id, out)
+        for value in values:
+            if value is _MISSING:
+                out.append('x')
+            else:
+                self.value(value, out)
+
+class Reader(object):
+    """Decodes the sections of a save"""
+    def __init__(self, data, strings, schema, version, classes):
+        self.data = data
+        self.pos = 0
+        self.strings = strings
+        self.schema = schema
+        self.version = version
+        self.classes = classes
+        self.read_objects = None
+
+    def section(self, offset, count):
+        """Decode count values starting at offset. Every object read, also
+           those inside other objects, is in read_objects afterwards.
+           @rtype: list
+           @return: The values"""
+        self.pos = offset
+        self.read_objects = {}
+        return [self.value() for i in xrange(count)]
+
+    def uint(self):
+        value, = _UINT.unpack_from(self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def value(self):
+        """Decode the value at the current position"""
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == 's':
+            return self.strings[self.uint()]
+        elif tag == 'N':
+            return None
+        elif tag == 'T':
+            return True
+        elif tag == 'F':
+            return False
+        elif tag == 'i':
+            value, = _INT.unpack_from(self.data, self.pos)
+            self.pos += 8
+            return value
+        elif tag == 'f':
+            value, = _FLOAT.unpack_from(self.data, self.pos)
+            self.pos += 8
+            return value
+        elif tag == 'u':
+            return self.strings[self.uint()].decode('utf-8')
+        elif tag == 'l' or tag == 't':
+            items = [self.value() for i in xrange(self.uint())]
+            if tag == 't':
+                return tuple(items)
+            return items
+        elif tag == 'd':
+            result = {}
+            for i in xrange(self.uint()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        elif tag == 'o':
+            return self.record()
+        elif tag == 'r':
+            return self.read_objects[self.value()]
+        raise SaveError("Corrupt save: unknown tag %r at %d" %
+                        (tag, self.pos - 1))
+
+    def record(self):
+        """Decode a game object"""
+        index, = _CLASS.unpack_from(self.data, self.pos)
+        self.pos += 2
+        class_name, fields = self.schema[index]
+        cls = self.classes.get(class_name)
+        if cls is None:
+            raise SaveError("Unknown object class %s in save" % class_name)
+        obj_id = self.value()
+        # objects inside this one may refer back to it, so it is created
+        # before its fields are read
+        obj = cls.__new__(cls)
+        self.read_objects[obj_id] = obj
+        state = {'ID': obj_id}
+        for field in fields:
+            if self.data[self.pos] == 'x':
+                self.pos += 1
+            else:
+                value = self.value()
+                if field is not None:
+                    state[field] = value
+        obj.__setstate__(state)
+        return obj
+
+def writeGame(f, state, delta=False, thumbnail=None):
+    """Writes a game state to a file.
+       @type f: file
+       @param f: A file opened for writing in binary mode
+       @type state: GameState
+       @param state: The game state
+       @type delta: Boolean
+       @param delta: Only write the objects that differ from their baseline
+       @type thumbnail: string
+       @param thumbnail: Image data to show in the load browser, if any
+       @return: None"""
+    writeSnapshot(f, snapshotGame(state, delta), thumbnail)
+
+def writeSnapshot(f, snapshot, thumbnail=None):
+    """Writes a snapshot of a game state to a file. This only reads the
+       snapshot, so it is safe to call off the game thread.
+       @type f: file
+       @param f: A file opened for writing in binary mode
+       @type snapshot: Snapshot
+       @param snapshot: The snapshot, from snapshotGame
+       @type thumbnail: string
+       @param thumbnail: see writeGame
+       @return: None"""
+    writer = Writer(snapshot.objects)
+    globals = writer.section(snapshot.globals)
+    directory = []
+    for map_id, ids in snapshot.maps:
+        objects = [ObjectRef(obj_id) for obj_id in ids]
+        key = []
+        writer.value(map_id, key)
+        directory.append((''.join(key), writer.section(objects),
+                          len(objects)))
+
+    schema = [_UINT.pack(len(writer.class_list))]
+    for cls in writer.class_list:
+        fields = savedFields(cls)
+        schema.append(_UINT.pack(writer.string(cls.__name__)))
+        schema.append(_CLASS.pack(len(fields)))
+        for field in fields:
+            schema.append(_UINT.pack(writer.string(field)))
+    schema = ''.join(schema)
+    strings = [_UINT.pack(len(writer.string_list))]
+    for text in writer.string_list:
+        strings.append(_UINT.pack(len(text)))
+        strings.append(text)
+    strings = ''.join(strings)
+
+    strings_offset = SAVE_HEADER.size + SAVE_INFO.size
+    schema_offset = strings_offset + len(strings)
+    directory_offset = schema_offset + len(schema)
+    globals_offset = directory_offset + _UINT.size + \
+                     sum([len(key) + _ENTRY.size
+                          for key, section, count in directory])
+    offset = globals_offset + len(globals)
+    entries = [_UINT.pack(len(directory))]
+    for key, section, count in directory:
+        entries.append(key + _ENTRY.pack(offset, len(section), count))
+        offset += len(section)
+
+    f.write(SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION,
+                             snapshot.delta and DELTA_FLAG or 0, strings_offset,
+                             schema_offset, directory_offset, globals_offset,
+                             len(globals)))
+    info = snapshot.info
+    map = info.map or ''
+    if type(map) is unicode:
+        map = map.encode('utf-8')
+    thumbnail_offset = thumbnail and offset or 0
+    f.write(SAVE_INFO.pack(map, info.x, info.y,
+                           info.timestamp, thumbnail_offset,
+                           len(thumbnail or '')))
+    f.write(strings)
+    f.write(schema)
+    f.write(''.join(entries))
+    f.write(globals)
+    for key, section, count in directory:
+        f.write(section)
+    if thumbnail:
+        f.write(thumbnail)
+
+def readHeader(data):
+    """Unpacks the header at the start of data.
+       @rtype: tuple
+       @return: The SAVE_HEADER fields"""
+    if len(data) < SAVE_HEADER.size:
+        raise SaveError("Corrupt save: header cut short")
+    header = SAVE_HEADER.unpack_from(data)
+    if header[0] != SAVE_MAGIC:
+        raise SaveError("Not a saved game")
+    if header[1] > SAVE_VERSION:
+        raise SaveError("Save format %d is newer than this game" % header[1])
+    return header
+
+def readInfo(f):
+    """Reads what the load browser shows of a save, without reading the
+       rest of it.
+       @type f: file
+       @param f: A save, opened for reading in binary mode
+       @rtype: SaveInfo
+       @return: The info; pickled saves only have their version"""
+    data = f.read(SAVE_HEADER.size + SAVE_INFO.size)
+    if not data.startswith(SAVE_MAGIC):
+        if data[:1] in ('(', 'c', '\x80'):
+            # most likely a pickled GameState
+            return SaveInfo(0)
+        raise SaveError("Not a saved game")
+    version = readHeader(data)[1]
+    if len(data) < SAVE_HEADER.size + SAVE_INFO.size:
+        raise SaveError("Corrupt save: header cut short")
+    map, x, y, timestamp, offset, length = \
+        SAVE_INFO.unpack_from(data, SAVE_HEADER.size)
+    return SaveInfo(version, map.rstrip('\0').decode('utf-8', 'replace'),
+                    x, y, timestamp, offset and (offset, length) or None)
+
+def readThumbnail(f):
+    """@type f: file
+       @param f: A save, opened for reading in binary mode
+       @rtype: string
+       @return: The thumbnail of the save, or None"""
+    info = readInfo(f)
+    if info.thumbnail is None:
+        return None
+    offset, length = info.thumbnail
+    f.seek(offset)
+    return f.read(length)
+
+def readTables(data, base, header, classes):
+    """Reads the string table, schema and directory.
+       @type data: string
+       @param data: The save from the file offset base on
+       @rtype: tuple
+       @return: (Reader, map id -> (offset, length, object count))"""
+    magic, version, flags, strings_offset, schema_offset, directory_offset, \
+        globals_offset, globals_length = header
+    reader = Reader(data, [], [], version, classes)
+    reader.pos = strings_offset - base
+    strings = reader.strings
+    for i in xrange(reader.uint()):
+        length = reader.uint()
+        strings.append(data[reader.pos:reader.pos + length])
+        reader.pos += length
+    for i in xrange(reader.uint()):
+        name = strings[reader.uint()]
+        count, = _CLASS.unpack_from(data, reader.pos)
+        reader.pos += 2
+        fields = [strings[reader.uint()] for j in xrange(count)]
+        for migrate in xrange(version, SAVE_VERSION):
+            if migrate in MIGRATIONS:
+                name, fields = MIGRATIONS[migrate](name, fields)
+        reader.schema.append((name, fields))
+    directory = {}
+    for i in xrange(reader.uint()):
+        map_id = reader.value()
+        directory[map_id] = _ENTRY.unpack_from(data, reader.pos)
+        reader.pos += _ENTRY.size
+    return reader, directory
+
+def readGame(f, classes=None):
+    """Reads a game state from a file written by writeGame, or pickled by
+       an older version of the game.
+       @type f: file
+       @param f: A file opened for reading in binary mode
+       @type classes: dict
+       @param classes: class name -> game object class, defaults to every
+                       registered object class
+       @rtype: GameState
+       @return: The game state"""
+    data = f.read()
+    if not data.startswith(SAVE_MAGIC):
+        return readLegacyGame(data)
+    header = readHeader(data)
+    reader, directory = readTables(data, 0, header, classes or object_registry)
+    state = GameState()
+    state.currentMap, state.PC, destroyed = reader.section(header[6], 3)
+    state.destroyed = set(destroyed)
+    for map_id, (offset, length, count) in directory.items():
+        reader.section(offset, count)
+        # a delta save may only have an unchanged object inside a changed
+        # one, so that is added as well
+        for obj in reader.read_objects.values():
+            state.addObject(obj)
+    return state
+
+def readLegacyGame(data):
+    """Loads a save pickled by a version of the game without SAVE_MAGIC;
+       GameState and the game objects bring those up to date when they are
+       unpickled.
+       @rtype: GameState
+       @return: The game state"""
+    try:
+        return pickle.loads(data)
+    except Exception, e:
+        raise SaveError("Not a saved game: %s" % e)
+
+def readMap(f, map_id, classes=None):
+    """Reads the objects of one map without reading the other maps.
+       @type f: file
+       @param f: A file written by writeGame, opened in binary mode
+       @type map_id: String
+       @param map_id: The map
+       @type classes: dict
+       @param classes: see readGame
+       @rtype: list
+       @return: The objects on the map"""
+    header = readHeader(f.read(SAVE_HEADER.size))
+    base = header[3]
+    f.seek(base)
+    tables = f.read(header[6] - base)
+    reader, directory = readTables(tables, base, header,
+                                   classes or object_registry)
+    if map_id not in directory:
+        return []
+    offset, length, count = directory[map_id]
+    f.seek(offset)
+    reader.data = f.read(length)
+    return reader.section(0, count)
+
+def listMaps(f):
+    """Gets the maps in a save without reading any of them.
+       @type f: file
+       @param f: A file written by writeGame, opened in binary mode
+       @rtype: dict
+       @return: map id -> number of objects on it"""
+    header = readHeader(f.read(SAVE_HEADER.size))
+    base = header[3]
+    f.seek(base)
+    reader, directory = readTables(f.read(header[6] - base), base, header,
+                                   object_registry)
+    return dict([(map_id, count) for map_id, (offset, length, count)
+                 in directory.items()])
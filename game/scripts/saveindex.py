@@ -0,0 +1,174 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# there should be NO references to FIFE here!
+"""Keeps an index of the saves in a directory, so the load browser can 
+   show what is in them without opening every one. The index file holds 
+   the SaveInfo of every save along with the size and modification time 
+   the save had when it was read; listSaves only reads the saves that 
+   have changed since, and writes the index again if any have. Saves are
+   written from the autosave thread as well as the game thread, so the 
+   index is only read and written again with _lock held."""
+
+import os, marshal, tempfile, threading
+from savegame import SaveInfo, SaveError, readInfo
+
+INDEX_FILE = 'saves.idx'
+INDEX_VERSION = 1
+# extension of saved games
+SAVE_EXTENSION = '.dat'
+
+# held while the index of a directory is read, changed and written back
+_lock = threading.Lock()
+
+class SaveEntry(object):
+    """A save in the index"""
+    def __init__(self, filename, size, mtime, info):
+        """@type filename: string
+           @param filename: Name of the save in its directory
+           @type size: integer
+           @param size: Size of the save when info was read
+           @type mtime: float
+           @param mtime: Modification time of the save when info was read
+           @type info: SaveInfo
+           @param info: What readInfo read, None if it isn't a save"""
+        self.filename = filename
+        self.size = size
+        self.mtime = mtime
+        self.info = info
+
+    def current(self, stat):
+        """@type stat: posix.stat_result
+           @param stat: os.stat of the save
+           @return: True if the entry still describes the save"""
+        return self.size == stat.st_size and self.mtime == stat.st_mtime
+
+def readEntry(directory, filename, stat=None):
+    """Read the SaveInfo of a save.
+       @rtype: SaveEntry
+       @return: The entry of the save"""
+    path = os.path.join(directory, filename)
+    if stat is None:
+        stat = os.stat(path)
+    try:
+        f = open(path, 'rb')
+        try:
+            info = readInfo(f)
+        finally:
+            f.close()
+    except (IOError, SaveError):
+        info = None
+    return SaveEntry(filename, stat.st_size, stat.st_mtime, info)
+
+def readIndex(directory):
+    """@rtype: dict
+       @return: file name -> SaveEntry of the index of directory; empty if 
+                there is none or it can't be read"""
+    try:
+        f = open(os.path.join(directory, INDEX_FILE), 'rb')
+        try:
+            version, entries = marshal.load(f)
+        finally:
+            f.close()
+        if version != INDEX_VERSION:
+            return {}
+        index = {}
+        for filename, size, mtime, info in entries:
+            if info is not None:
+                info = SaveInfo(*info)
+            index[filename] = SaveEntry(filename, size, mtime, info)
+        return index
+    except (IOError, EOFError, ValueError, TypeError):
+        return {}
+
+def writeIndex(directory, index):
+    """Write the index of directory, replacing the old one in one go.
+       @type index: dict
+       @param index: file name -> SaveEntry
+       @return: None"""
+    entries = []
+    for entry in index.values():
+        info = entry.info
+        if info is not None:
+            info = (info.version, info.map, info.x, info.y, info.timestamp,
+                    info.thumbnail)
+        entries.append((entry.filename, entry.size, entry.mtime, info))
+    path = os.path.join(directory, INDEX_FILE)
+    # a save and an autosave may both be updating the index
+    handle, temp = tempfile.mkstemp(prefix=INDEX_FILE, dir=directory)
+    f = os.fdopen(handle, 'wb')
+    try:
+        marshal.dump((INDEX_VERSION, entries), f)
+    finally:
+        f.close()
+    # Windows can't rename over a file
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp, path)
+
+def listSaves(directory):
+    """List the saves in a directory, bringing its index up to date.
+       @type directory: string
+       @param directory: The directory
+       @rtype: list
+       @return: A SaveEntry for every save, by file name"""
+    _lock.acquire()
+    try:
+        return _listSaves(directory)
+    finally:
+        _lock.release()
+
+def _listSaves(directory):
+    """listSaves, with _lock held"""
+    index = readIndex(directory)
+    saves = []
+    changed = False
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(SAVE_EXTENSION):
+            continue
+        path = os.path.join(directory, filename)
+        stat = os.stat(path)
+        entry = index.get(filename)
+        if entry is None or not entry.current(stat):
+            entry = readEntry(directory, filename, stat)
+            changed = True
+        saves.append(entry)
+    if changed or len(saves) != len(index):
+        try:
+            writeIndex(directory, dict([(entry.filename, entry) 
+                                        for entry in saves]))
+        except (IOError, OSError):
+            # a read-only directory just doesn't get an index
+            pass
+    return saves
+
+def updateIndex(directory, filename):
+    """Bring the index entry of a save that has just been written up to 
+       date.
+       @type directory: string
+       @param directory: The directory of the save
+       @type filename: string
+       @param filename: The name of the save
+       @return: None"""
+    _lock.acquire()
+    try:
+        index = readIndex(directory)
+        index[filename] = readEntry(directory, filename)
+        writeIndex(directory, index)
+    finally:
+        _lock.release()
@@ -0,0 +1,59 @@
+import unittest, os, tempfile, shutil
+from scripts.autosave import Autosaver
+from scripts.savegame import readGame
+from scripts.gamestate import GameState
+from scripts.objects.base import GameObject
+from scripts.objects.containers import WoodenCrate
+from scripts.tests.fixtures import CLASSES
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+class AutosaveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='parpg-test-')
+        self.state = GameState()
+        self.state.currentMap = "maps/map.xml"
+        self.state.PC = GameObject("pc")
+        self.crate = WoodenCrate("crate", locked=False)
+        self.state.addObject(self.crate, "maps/map.xml")
+        self.clock = Clock()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def load(self, slot):
+        f = open(os.path.join(self.dir, 'autosave%d.dat' % slot), 'rb')
+        try:
+            return readGame(f, CLASSES)
+        finally:
+            f.close()
+
+    def test_interval(self):
+        saver = Autosaver(self.dir, 10, 2, self.clock, threaded=False)
+        saver.pump(self.state)
+        self.assertEqual(os.listdir(self.dir), [])
+        for now in (10, 15, 20, 30):
+            self.clock.now = now
+            saver.pump(self.state)
+        self.assertEqual(saver.stats['saves'], 3)
+        # the slots are used in turn, and nothing else is left behind
+        self.assertEqual(sorted(os.listdir(self.dir)), 
+                         ['autosave0.dat', 'autosave1.dat', 'saves.idx'])
+        self.assertEqual(saver.slot, 1)
+        self.assertEqual(Autosaver(self.dir, 10, 2).slot, 1)
+        self.assertTrue(saver.stats['max_blocked'] > 0)
+
+    def test_snapshot(self):
+        saver = Autosaver(self.dir, 10)
+        saver.save(self.state)
+        # changes made while the worker writes are not in the autosave
+        self.crate.locked = True
+        self.crate.items.append(GameObject("key"))
+        saver.wait()
+        self.assertEqual(saver.error, None)
+        crate = self.load(0).objects["crate"]
+        self.assertEqual((crate.locked, crate.items), (False, []))
@@ -0,0 +1,87 @@
+import unittest
+from local_loaders import mapcache
+from local_loaders.chunks import ChunkedMap, chunkKey, chunksAround
+
+class Instance(object):
+    def __init__(self, values):
+        self.values = values
+
+    def getId(self):
+        return self.values[7]
+
+class ChunkedMapTest(unittest.TestCase):
+    def setUp(self):
+        self.compiled = mapcache.compileMap('maps/map.xml')
+        self.layers = [(layer, layer[0]['id'])
+                       for layer in self.compiled['layers']]
+        # layer id -> created instances
+        self.model = dict([(id, []) for layer, id in self.layers])
+        self.chunks = ChunkedMap(self.compiled, self.layers, self.create,
+                                 self.delete, size=8, radius=1)
+
+    def create(self, layer_obj, *values):
+        inst = Instance(values)
+        self.model[layer_obj].append(inst)
+        return inst
+
+    def delete(self, layer_obj, inst):
+        self.model[layer_obj].remove(inst)
+
+    def created(self):
+        return sorted([(id, inst.values) for id in self.model
+                       for inst in self.model[id]])
+
+    def test_keys(self):
+        self.assertEqual(chunkKey(7.9, -0.1, 8), (0, -1))
+        self.assertEqual(len(chunksAround((0, 0), 2)), 25)
+
+    def test_pinned(self):
+        pinned = [values for layer_obj, values
+                  in self.chunks.pinnedInstances()]
+        self.assertEqual(sorted([v[8][0] for v in pinned]),
+                         ['NonPlayerCharacter', 'PlayerCharacter'])
+
+    def test_every_instance_once(self):
+        for layer_obj, values in self.chunks.pinnedInstances():
+            self.create(layer_obj, *values)
+        for key in self.chunks.chunks:
+            self.chunks.loadChunk(key)
+        everything = sorted([(id, values) for layer, id in self.layers
+                             for values in
+                             mapcache.iterInstances(self.compiled, layer)])
+        self.assertEqual(self.created(), everything)
+
+    def test_update(self):
+        self.assertEqual(self.chunks.update(0, 0), [])
+        self.assertEqual(len(self.chunks.loaded), 9)
+        first = self.created()
+        # nothing happens within the chunk
+        self.assertEqual(self.chunks.update(7, 7), [])
+        self.assertEqual(self.chunks.stats['loaded'], 9)
+        # far away and back: the same instances, with the same ids
+        self.chunks.update(1000, 1000)
+        self.assertEqual(self.created(), [])
+        self.chunks.update(0, 0)
+        self.assertEqual(self.created(), first)
+        self.assertEqual(self.chunks.stats['deleted'], len(first))
+
+    def test_gone(self):
+        # the instances of objects that are gone from the game are deleted
+        # right away, so unloading must not delete them again
+        def create(layer_obj, *values):
+            inst = self.create(layer_obj, *values)
+            if values[8] is not None:
+                self.delete(layer_obj, inst)
+                return None
+            return inst
+        self.chunks.create = create
+        for key in self.chunks.chunks:
+            self.chunks.loadChunk(key)
+        # the PC and the NPC are pinned, not chunked
+        self.assertTrue(self.chunks.stats['created'] <
+                        mapcache.instanceCount(self.compiled) - 2)
+        self.chunks.update(1000, 1000)
+        self.assertEqual(self.created(), [])
+
+if __name__=='__main__':
+    unittest.main()
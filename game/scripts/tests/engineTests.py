@@ -0,0 +1,121 @@
+import unittest, os, tempfile, shutil
+from scripts.engine import Engine
+from scripts.gamestate import GameState
+from scripts.objects import registerObject, object_registry
+from scripts.objects.base import GameObject
+from scripts.objects.containers import WoodenCrate
+
+class Behaviour(object):
+    def __init__(self, parent, layer):
+        self.parent, self.layer = parent, layer
+        self.agent = None
+
+class Hero(GameObject):
+    """A PC without an agent in FIFE"""
+    _fields = ('behaviour', 'started')
+    _transient = ('behaviour',)
+    capability = 'PC'
+
+    def __init__(self, ID, agent_layer=None, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        self.behaviour = Behaviour(self, agent_layer)
+        self.started = False
+
+    def setup(self):
+        self.behaviour.agent = self.behaviour.layer.getInstance(self.ID)
+
+    def start(self):
+        self.started = True
+
+class Layer(object):
+    def __init__(self):
+        self.instances = {}
+
+    def getInstance(self, id):
+        return self.instances[id]
+
+    def deleteInstance(self, inst):
+        del self.instances[inst]
+
+class View(object):
+    """Stands in for the World: loading a map creates its objects"""
+    def __init__(self, objects):
+        # attributes of the objects on the map
+        self.objects = objects
+        self.loaded = []
+        self.activeMap = self
+
+    def loadMap(self, mapname, filename):
+        self.loaded.append((mapname, filename))
+        self.map_objects = {}
+        self.layer = Layer()
+        for attributes in self.objects:
+            self.layer.instances[attributes['id']] = attributes['id']
+        self.engine.createObjects(self.layer,
+            [(dict(attributes), attributes['id'])
+             for attributes in self.objects])
+
+    def setActiveMap(self, mapname):
+        pass
+
+    def getLoadingMap(self):
+        return self
+
+    def addObject(self, id, instance):
+        self.map_objects[id] = instance
+
+    def addPC(self, agent):
+        self.agent = agent
+
+MAP = [{'type': 'Hero', 'id': 'hero', 'xpos': 1.0, 'ypos': 2.0},
+       {'type': 'WoodenCrate', 'id': 'crate', 'xpos': 3.0, 'ypos': 4.0},
+       {'type': 'WoodenCrate', 'id': 'junk', 'xpos': 5.0, 'ypos': 6.0}]
+
+class EngineTest(unittest.TestCase):
+    def setUp(self):
+        registerObject(Hero)
+        self.dir = tempfile.mkdtemp(prefix='parpg-test-')
+
+    def tearDown(self):
+        object_registry.pop('Hero', None)
+        shutil.rmtree(self.dir)
+
+    def engine(self):
+        view = View(MAP)
+        engine = Engine(view)
+        view.engine = engine
+        return engine
+
+    def test_load(self):
+        engine = self.engine()
+        engine.gameState.currentMap = 'maps/map.xml'
+        engine.loadMap('maps/map.xml', 'maps/map.xml')
+        engine.gameState.getObjectById('crate').X = 10.0
+        engine.gameState.removeObject('junk')
+        engine.save(self.dir, 'save.dat')
+
+        loaded = self.engine()
+        loaded.load(self.dir, 'save.dat')
+        view, state = loaded.view, loaded.gameState
+        self.assertEqual(view.loaded, [('maps/map.xml', 'maps/map.xml')])
+        # the loaded PC took over the behaviour of the map's PC
+        self.assertEqual(view.agent, 'hero')
+        self.assertEqual(state.PC.behaviour.parent, state.PC)
+        self.assertTrue(state.PC.started)
+        self.assertEqual(state.getObjectById('crate').X, 10.0)
+        # the destroyed object was deleted from the map, once
+        self.assertEqual(sorted(view.map_objects), ['crate', 'hero'])
+        self.assertEqual(sorted(view.layer.instances), ['crate', 'hero'])
+
+    def test_destroyed(self):
+        engine = self.engine()
+        engine.gameState.destroyed.add('junk')
+        layer = Layer()
+        layer.instances = {'crate': 'crate', 'junk': 'junk'}
+        engine.view.map_objects = {}
+        self.assertEqual(engine.createObjects(layer,
+            [(dict(MAP[1]), 'crate'), (dict(MAP[2]), 'junk')]), ['junk'])
+        self.assertEqual(layer.instances, {'crate': 'crate'})
+
+if __name__ == '__main__':
+    unittest.main()
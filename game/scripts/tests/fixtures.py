@@ -0,0 +1,11 @@
+"""Game objects shared by the tests"""
+from scripts.objects.base import GameObject, Carryable
+from scripts.objects.containers import WoodenCrate
+
+class Can(GameObject, Carryable):
+    def __init__(self, ID, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Carryable.__init__(self, **kwargs)
+
+# the classes to read saves of the test objects with
+CLASSES = {'WoodenCrate': WoodenCrate, 'Can': Can, 'GameObject': GameObject}
@@ -0,0 +1,106 @@
+import unittest, pickle
+from scripts.gamestate import GameState
+from scripts.objects.base import GameObject, Lockable, \
+     CARRYABLE, CONTAINER, LOCKABLE, OPENABLE, SCRIPTABLE
+from scripts.objects.containers import WoodenCrate
+from scripts.tests.fixtures import Can
+
+class GameStateTest(unittest.TestCase):
+    def setUp(self):
+        self.state = GameState()
+        for i in range(6):
+            self.state.addObject(GameObject("obj%d" % i), "map%d" % (i % 2))
+
+    def onMap(self, map_id):
+        return sorted([obj.ID for obj in 
+                       self.state.getObjectsFromMap(map_id)])
+
+    def test_add(self):
+        self.assertEqual(self.onMap("map0"), ["obj0", "obj2", "obj4"])
+        self.assertEqual(self.onMap("nowhere"), [])
+        self.assertEqual(self.state.getObjectOnMap("obj1", "map1").ID, "obj1")
+        self.assertEqual(self.state.getObjectOnMap("obj1", "map0"), None)
+        # same ID on another map replaces the old object
+        self.state.addObject(GameObject("obj0"), "map1")
+        self.assertEqual(self.onMap("map0"), ["obj2", "obj4"])
+        self.assertEqual(self.state.checkConsistency(), [])
+
+    def test_removeAndMove(self):
+        self.assertEqual(self.state.removeObject("obj2").ID, "obj2")
+        self.assertEqual(self.state.removeObject("obj2"), None)
+        self.state.moveObject("obj4", "map1")
+        self.state.moveObject("obj0", "map2")
+        self.assertEqual(self.onMap("map0"), [])
+        self.assertEqual(self.onMap("map1"), ["obj1", "obj3", "obj4", "obj5"])
+        self.assertEqual(self.state.getObjectById("obj0").map_id, "map2")
+        self.assertEqual(self.state.checkConsistency(), [])
+
+    def test_capabilities(self):
+        crate = WoodenCrate("crate")
+        self.assertTrue(crate.hasCapability(CONTAINER | LOCKABLE | OPENABLE))
+        self.assertFalse(crate.hasCapability(CONTAINER | CARRYABLE))
+        self.assertEqual(Can("can").capabilities, CARRYABLE)
+        self.assertEqual(GameObject("obj").capabilities, 0)
+        # a capability added to a mixin later is picked up by new classes
+        class Sealed(GameObject, Lockable):
+            capability = 'sealed'
+        self.assertEqual(len(Sealed.capability_bits), 3)
+
+    def test_capabilityQueries(self):
+        for i in range(4):
+            self.state.addObject(WoodenCrate("crate%d" % i), "map%d" % (i % 2))
+            self.state.addObject(Can("can%d" % i), "map%d" % (i % 2))
+        def ids(mask, map_id=None):
+            return sorted([obj.ID for obj in 
+                           self.state.getObjectsWithCapability(mask, map_id)])
+        self.assertEqual(ids(CARRYABLE, "map1"), ["can1", "can3"])
+        self.assertEqual(ids(CONTAINER | SCRIPTABLE), 
+                         ["crate0", "crate1", "crate2", "crate3"])
+        self.assertEqual(ids(CONTAINER | CARRYABLE), [])
+        self.state.moveObject("crate1", "map0")
+        self.state.removeObject("can3")
+        self.assertEqual(ids(CONTAINER, "map0"), ["crate0", "crate1", "crate2"])
+        self.assertEqual(ids(CARRYABLE, "map1"), ["can1"])
+        self.assertEqual(self.state.checkConsistency(), [])
+
+    def test_slots(self):
+        crate = WoodenCrate("crate")
+        self.assertFalse(hasattr(crate, '__dict__'))
+        self.assertRaises(AttributeError, setattr, crate, 'colour', 'red')
+        self.assertEqual(Can.__slots__, 
+                         ('is_carryable', 'in_container', 'weight'))
+        # an object pickled before game objects were slotted
+        old = WoodenCrate.__new__(WoodenCrate)
+        old.__setstate__({'ID': 'old', 'locked': False, 'colour': 'red'})
+        self.assertEqual((old.ID, old.locked), ('old', False))
+        self.assertEqual(old.__getstate__(), 
+                         {'ID': 'old', 'locked': False, 'overrides': None})
+
+    def test_defaults(self):
+        crate = WoodenCrate("crate", name="Wooden Crate", text="Dusty")
+        self.assertEqual((crate.name, crate.text, crate.desc), 
+                         ("Wooden Crate", "Dusty", "Detailed description"))
+        self.assertEqual(crate.overrides, {'text': "Dusty"})
+        self.assertEqual(WoodenCrate.name, "Wooden Crate")
+        crate.text = "A battered crate"
+        self.assertEqual(crate.overrides, None)
+        crate.name = "Box"
+        copy = pickle.loads(pickle.dumps(crate))
+        self.assertEqual((copy.name, copy.text), ("Box", "A battered crate"))
+        self.assertEqual(copy.__getstate__()['overrides'], {'name': "Box"})
+
+    def test_consistency(self):
+        self.state.getObjectById("obj3").map_id = "map0"
+        del self.state.objects["obj5"]
+        self.assertEqual(len(self.state.checkConsistency()), 4)
+
+    def test_pickle(self):
+        state = pickle.loads(pickle.dumps(self.state))
+        self.assertEqual(state.checkConsistency(), [])
+        self.assertEqual(sorted(state.map_objects), ["map0", "map1"])
+        # saves written before the index existed
+        old = self.state.__dict__.copy()
+        del old['map_objects']
+        state = GameState.__new__(GameState)
+        state.__setstate__(old)
+        self.assertEqual(state.checkConsistency(), [])
@@ -0,0 +1,71 @@
+import unittest
+from scripts.hover import HoverTracker
+
+class Instance(object):
+    def __init__(self, id):
+        self.id = id
+
+    def getId(self):
+        return self.id
+
+class HoverTrackerTest(unittest.TestCase):
+    def setUp(self):
+        # a crate covering x 0-19 and a barrel covering x 10-29
+        self.crate, self.barrel = Instance("crate"), Instance("barrel")
+        self.events = []
+        self.queries = 0
+        self.now = 0.0
+        self.tracker = HoverTracker(self.query, self.lookup, self.enter,
+                                    self.leave, cell=4, rate=10,
+                                    clock=lambda: self.now)
+
+    def query(self, x, y):
+        self.queries += 1
+        return [inst for inst, lo, hi in ((self.crate, 0, 19),
+                                          (self.barrel, 10, 29))
+                if lo <= x <= hi]
+
+    def lookup(self, id):
+        return id
+
+    def enter(self, inst, obj):
+        self.events.append(('enter', obj))
+
+    def leave(self, inst):
+        self.events.append(('leave', inst.getId()))
+
+    def move(self, x, advance=1.0):
+        self.now += advance
+        self.tracker.moved(x, 0)
+
+    def test_transitions(self):
+        for x in range(0, 40):
+            self.move(x)
+        self.assertEqual(self.events, [('enter', 'crate'), 
+                                       ('enter', 'barrel'),
+                                       ('leave', 'crate'), 
+                                       ('leave', 'barrel')])
+        # one query per cell of 4 pixels
+        self.assertEqual(self.queries, 10)
+
+    def test_throttle(self):
+        self.move(0)
+        self.move(12, 0.01)
+        self.move(24, 0.01)
+        self.assertEqual(self.queries, 1)
+        self.tracker.pump()
+        self.assertEqual(self.queries, 1)
+        self.now += 0.1
+        self.tracker.pump()
+        self.tracker.pump()
+        self.assertEqual(self.queries, 2)
+        self.assertEqual(self.events, [('enter', 'crate'), 
+                                       ('enter', 'barrel'),
+                                       ('leave', 'crate')])
+
+    def test_forget(self):
+        self.move(0)
+        self.tracker.forget(["crate"])
+        self.move(1)
+        self.assertEqual(self.events, [('enter', 'crate'), 
+                                       ('enter', 'crate')])
@@ -0,0 +1,42 @@
+import unittest
+from local_loaders.mapjob import MapLoadJob, SimulatedClock
+
+def apply(count):
+    """Apply stage doing count units of work"""
+    done = []
+    for i in range(count):
+        done.append(i)
+        yield ('unit %d' % i, float(i + 1) / count)
+
+class MapLoadJobTest(unittest.TestCase):
+    def test_deterministic(self):
+        # a slice of 5 clock readings: 5 units per frame, and one more
+        # frame to see the apply stage end
+        for run in range(2):
+            job = MapLoadJob(lambda: 20, apply, threaded=False,
+                             clock=SimulatedClock(0.25))
+            frames = 0
+            while not job.step(1.25):
+                frames += 1
+                self.assertEqual(job.progress[1], frames * 5 / 20.0)
+            self.assertEqual(frames, 4)
+            self.assertEqual(job.frames, 5)
+            self.assertEqual(job.progress, ('map loaded', 1.0))
+            self.assertEqual(job.step(1.25), True)
+
+    def test_threaded(self):
+        job = MapLoadJob(lambda: 100, apply)
+        job.finish()
+        self.assertEqual(job.done, True)
+        self.assertEqual(job.progress[1], 1.0)
+
+    def test_prepare_error(self):
+        def prepare():
+            raise IOError('no such map')
+        for threaded in (False, True):
+            job = MapLoadJob(prepare, apply, threaded)
+            self.assertRaises(IOError, job.finish)
+            self.assertEqual(job.step(0.005), True)
+
+if __name__=='__main__':
+    unittest.main()
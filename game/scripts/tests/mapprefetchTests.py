@@ -0,0 +1,49 @@
+import unittest
+from local_loaders.mapprefetch import MapPrefetcher, doorTargets, \
+     estimateSize
+
+def prepare(filename):
+    """Prepared map of a size given by the number of prefetched imports"""
+    return (None, dict.fromkeys(range(int(filename[-1]))))
+
+def targets(filename):
+    return {'a1': ['b2', 'c3', 'a1'], 'b2': ['a1', 'd4'], 'c3': ['a1'],
+            'd4': ['b2']}[filename]
+
+class MapPrefetcherTest(unittest.TestCase):
+    def setUp(self):
+        # room for b2 + c3 or a1 + d4, but not b2 + c3 + d4
+        budget = estimateSize(prepare('c3')) + estimateSize(prepare('b2'))
+        self.prefetcher = MapPrefetcher(prepare, budget, targets)
+
+    def prefetch(self, map_file):
+        self.prefetcher.prefetchDoors(map_file)
+        while self.prefetcher.pump():
+            self.prefetcher._thread.join()
+
+    def test_door_targets(self):
+        self.assertEqual(doorTargets('maps/map2.xml'), ['maps/map.xml'])
+        self.assertEqual(doorTargets('maps/shanty.xml'), ['maps/map.xml'])
+        self.assertEqual(doorTargets('maps/map.xml'), [])
+
+    def test_prefetch(self):
+        self.prefetch('a1')
+        self.assertEqual(self.prefetcher.entries.keys(), ['b2', 'c3'])
+        self.assertEqual(self.prefetcher.take('b2'), prepare('b2'))
+        # a1 pushes out c3, the least recently used, and d4 then b2
+        self.prefetch('b2')
+        self.assertEqual(self.prefetcher.entries.keys(), ['a1', 'd4'])
+        self.assertEqual(self.prefetcher.stats['evicted'], 2)
+        self.assertTrue(self.prefetcher.size <= self.prefetcher.budget)
+        self.assertEqual(self.prefetcher.take('a1'), prepare('a1'))
+        self.assertEqual(self.prefetcher.take('c3'), None)
+        self.assertEqual(self.prefetcher.hitRate(), 2 / 3.0)
+
+    def test_take_pending(self):
+        self.prefetcher.prefetchDoors('a1')
+        self.prefetcher.pump()
+        self.assertEqual(self.prefetcher.take('b2'), prepare('b2'))
+        self.assertEqual(self.prefetcher.hitRate(), 1.0)
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from scripts.objects import registerObject, getAllObjects, createObject, \
+     createObjects, object_registry
+from scripts.objects.containers import WoodenCrate
+from scripts.tests.fixtures import Can
+
+class ObjectRegistryTest(unittest.TestCase):
+    def tearDown(self):
+        object_registry.pop('Can', None)
+        object_registry.pop('TinCan', None)
+
+    def test_register(self):
+        self.assertEqual(getAllObjects()['WoodenCrate'], WoodenCrate)
+        self.assertEqual(registerObject(Can), Can)
+        registerObject(Can, 'TinCan')
+        self.assertEqual(createObject({'type': 'TinCan', 'id': 'can'}).ID, 
+                         'can')
+
+    def test_createObjects(self):
+        registerObject(Can)
+        objects = createObjects([{'type': 'WoodenCrate', 'id': 'crate', 
+                                  'name': 'Wooden Crate', 'locked': 'False'},
+                                 {'type': 'Can', 'id': 'can'}], 
+                                {'map_id': 'map'})
+        self.assertEqual([(obj.__class__, obj.ID, obj.map_id) 
+                          for obj in objects],
+                         [(WoodenCrate, 'crate', 'map'), (Can, 'can', 'map')])
+        # the default name is shared, not stored
+        self.assertEqual(objects[0].overrides, None)
+        self.assertEqual(objects[0].locked, 'False')
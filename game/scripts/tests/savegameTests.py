@@ -0,0 +1,124 @@
+import unittest, pickle
+from StringIO import StringIO
+from scripts import savegame
+from scripts.savegame import writeGame, readGame, readMap, listMaps, \
+     readInfo, readThumbnail, SaveError
+from scripts.gamestate import GameState
+from scripts.objects.base import GameObject
+from scripts.objects.containers import WoodenCrate
+from scripts.tests.fixtures import Can, CLASSES
+
+class SaveGameTest(unittest.TestCase):
+    def setUp(self):
+        self.state = GameState()
+        self.state.currentMap = "maps/map.xml"
+        self.state.PC = GameObject("pc", xpos=1.5, name=u"H\xe9ro")
+        for i in range(4):
+            crate = WoodenCrate("crate%d" % i, xpos=float(i), 
+                                locked=bool(i % 2), text="Crate %d" % i)
+            self.state.addObject(crate, "maps/map%d.xml" % (i % 2))
+        can = Can("can")
+        self.state.objects["crate0"].placeItem(can)
+        self.state.addObject(can, "maps/map0.xml")
+
+    def save(self):
+        f = StringIO()
+        writeGame(f, self.state)
+        f.seek(0)
+        return f
+
+    def describe(self, state):
+        result = []
+        for obj in state.objects.values():
+            fields = obj.__getstate__()
+            for field in ('items', 'in_container'):
+                if field in fields:
+                    fields[field] = repr(fields[field])
+            result.append((obj.__class__.__name__, fields))
+        return sorted(result)
+
+    def test_roundTrip(self):
+        state = readGame(self.save(), CLASSES)
+        self.assertEqual(state.checkConsistency(), [])
+        self.assertEqual(state.currentMap, "maps/map.xml")
+        self.assertEqual((state.PC.name, state.PC.X), (u"H\xe9ro", 1.5))
+        self.assertEqual(self.describe(state), self.describe(self.state))
+        # the can is written inside the crate and refers back to it
+        crate, can = state.objects["crate0"], state.objects["can"]
+        self.assertTrue(crate.items[0] is can)
+        self.assertTrue(can.in_container is crate)
+
+    def test_info(self):
+        f = StringIO()
+        writeGame(f, self.state, thumbnail='PNG')
+        f.seek(0)
+        info = readInfo(f)
+        self.assertEqual((info.version, info.map, info.x, info.y),
+                         (savegame.SAVE_VERSION, u"maps/map.xml", 1.5, 0.0))
+        f.seek(0)
+        self.assertEqual(readThumbnail(f), 'PNG')
+        f.seek(0)
+        self.assertEqual(len(readGame(f, CLASSES).objects), 5)
+        self.assertEqual(readThumbnail(self.save()), None)
+
+    def test_readMap(self):
+        f = self.save()
+        self.assertEqual(listMaps(f), {"maps/map0.xml": 3, 
+                                       "maps/map1.xml": 2})
+        f.seek(0)
+        objects = readMap(f, "maps/map1.xml", CLASSES)
+        self.assertEqual(sorted([obj.ID for obj in objects]), 
+                         ["crate1", "crate3"])
+        f.seek(0)
+        self.assertEqual(readMap(f, "nowhere", CLASSES), [])
+
+    def test_legacy(self):
+        f = StringIO(pickle.dumps(self.state))
+        self.assertEqual(self.describe(readGame(f, CLASSES)), 
+                         self.describe(self.state))
+        self.assertRaises(SaveError, readGame, StringIO("garbage"))
+
+    def test_migration(self):
+        # pretend the current format is an old one that called Y X and
+        # had a Y that is gone now
+        def rename(class_name, fields):
+            return class_name, [{'X': 'Y', 'Y': None}.get(field, field) 
+                                for field in fields]
+        f = self.save()
+        savegame.MIGRATIONS[savegame.SAVE_VERSION] = rename
+        savegame.SAVE_VERSION += 1
+        try:
+            state = readGame(f, CLASSES)
+        finally:
+            savegame.SAVE_VERSION -= 1
+            del savegame.MIGRATIONS[savegame.SAVE_VERSION]
+        self.assertEqual(state.objects["crate2"].Y, 2.0)
+
+    def test_delta(self):
+        for obj in self.state.objects.values():
+            self.state.setBaseline(obj)
+        self.state.objects["crate1"].locked = False
+        self.state.removeObject("crate2")
+        self.state.addObject(WoodenCrate("new"), "maps/map1.xml")
+        f = StringIO()
+        writeGame(f, self.state, delta=True)
+        f.seek(0)
+        self.assertEqual(listMaps(f), {"maps/map1.xml": 2})
+        f.seek(0)
+        state = readGame(f, CLASSES)
+        self.assertEqual(sorted(state.objects), ["crate1", "new"])
+        self.assertEqual(state.objects["crate1"].locked, False)
+        self.assertEqual(state.destroyed, set(["crate2"]))
+        # an unchanged object comes along with a changed one inside it
+        self.state.objects["can"].weight = 2.0
+        f = StringIO()
+        writeGame(f, self.state, delta=True)
+        f.seek(0)
+        state = readGame(f, CLASSES)
+        self.assertEqual(sorted(state.objects), 
+                         ["can", "crate0", "crate1", "new"])
+        self.assertEqual(state.checkConsistency(), [])
+
+    def test_unsaveable(self):
+        self.state.objects["crate1"].gfx = object()
+        self.assertRaises(SaveError, self.save)
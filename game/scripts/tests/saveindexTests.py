@@ -0,0 +1,89 @@
+import unittest, os, tempfile, shutil, threading, time
+from scripts import saveindex
+from scripts.saveindex import listSaves, updateIndex, INDEX_FILE
+from scripts.savegame import writeGame
+from scripts.gamestate import GameState
+from scripts.objects.base import GameObject
+
+class SaveIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='parpg-test-')
+        self.state = GameState()
+        self.state.PC = GameObject("pc", xpos=2.0, ypos=3.0)
+        self.reads = []
+        self.readEntry = saveindex.readEntry
+        def readEntry(directory, filename, stat=None):
+            self.reads.append(filename)
+            return self.readEntry(directory, filename, stat)
+        saveindex.readEntry = readEntry
+
+    def tearDown(self):
+        saveindex.readEntry = self.readEntry
+        shutil.rmtree(self.dir)
+
+    def save(self, filename, map):
+        self.state.currentMap = map
+        f = open(os.path.join(self.dir, filename), 'wb')
+        writeGame(f, self.state)
+        f.close()
+
+    def describe(self):
+        return [(entry.filename, entry.info and entry.info.map) 
+                for entry in listSaves(self.dir)]
+
+    def test_list(self):
+        self.save("a.dat", "maps/a.xml")
+        self.save("b.dat", "maps/b.xml")
+        open(os.path.join(self.dir, "junk.dat"), 'w').write("junk")
+        open(os.path.join(self.dir, "notes.txt"), 'w').write("notes")
+        expected = [("a.dat", u"maps/a.xml"), ("b.dat", u"maps/b.xml"),
+                    ("junk.dat", None)]
+        self.assertEqual(self.describe(), expected)
+        self.assertEqual(len(self.reads), 3)
+        # the second time everything comes from the index
+        self.assertEqual(self.describe(), expected)
+        self.assertEqual(len(self.reads), 3)
+        entry = listSaves(self.dir)[0]
+        self.assertEqual((entry.info.x, entry.info.y), (2.0, 3.0))
+
+    def test_stale(self):
+        self.save("a.dat", "maps/a.xml")
+        self.save("b.dat", "maps/b.xml")
+        self.describe()
+        del self.reads[:]
+        self.save("a.dat", "maps/much_longer_name.xml")
+        os.remove(os.path.join(self.dir, "b.dat"))
+        self.assertEqual(self.describe(), 
+                         [("a.dat", u"maps/much_longer_name.xml")])
+        self.assertEqual(self.reads, ["a.dat"])
+        # a missing or broken index is built again
+        open(os.path.join(self.dir, INDEX_FILE), 'w').write("broken")
+        self.assertEqual(self.describe(), 
+                         [("a.dat", u"maps/much_longer_name.xml")])
+        os.remove(os.path.join(self.dir, INDEX_FILE))
+        self.assertEqual(len(listSaves(self.dir)), 1)
+        self.assertEqual(self.reads, ["a.dat"] * 3)
+
+    def test_update(self):
+        self.save("a.dat", "maps/a.xml")
+        updateIndex(self.dir, "a.dat")
+        self.assertEqual(self.describe(), [("a.dat", u"maps/a.xml")])
+        self.assertEqual(self.reads, ["a.dat"])
+
+    def test_threads(self):
+        # the autosave thread and the game thread both update the index
+        names = ["%d.dat" % i for i in range(8)]
+        for name in names:
+            self.save(name, "maps/%s.xml" % name)
+        readEntry = saveindex.readEntry
+        def slowEntry(directory, filename, stat=None):
+            time.sleep(0.001)
+            return readEntry(directory, filename, stat)
+        saveindex.readEntry = slowEntry
+        threads = [threading.Thread(target=updateIndex, args=(self.dir, name))
+                   for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(saveindex.readIndex(self.dir)), names)
@@ -0,0 +1,149 @@
+import unittest, os, sys, tempfile, shutil
+from StringIO import StringIO
+from utilities import transition
+from utilities.transition import LocalMap
+
+class TileByTileMap(LocalMap):
+    """LocalMap without NumPy"""
+    def __init__(self):
+        LocalMap.__init__(self)
+        self.use_numpy = False
+
+class BruteForceMap(TileByTileMap):
+    """LocalMap as it was before the grid, to check against"""
+    def PMatchSearch(self, x, y, search):
+        if(self.CheckRange(x,y) == False):
+            return False
+        size = len(search)
+        for t in self.layers[0].tiles:
+            if((t.x == x)and(t.y == y)and(t.object[:size] == search)):
+                return(True)
+        return False
+
+class SlowSaveMap(TileByTileMap):
+    """LocalMap with the layer packing and output of before SaveMap 
+       bucketed the tiles, to check against"""
+    def OutputTransLayer(self, l_file, l_count):
+        if(len(self.render_tiles) == 0):
+            return True
+        layer_name="TransitionLayer"+str(l_count)
+        l_file.write('''    <layer x_offset="0.0" pathing="''')
+        l_file.write('''cell_edges_and_diagonals" y_offset="0.0"''')
+        l_file.write(''' grid_type="square" id="''')
+        l_file.write(layer_name+'''"''')
+        l_file.write(''' x_scale="1" y_scale="1" rotation="0.0">\n''')
+        l_file.write('        <instances>\n')
+        for tile in self.render_tiles:
+            l_file.write('''            <i x="''')
+            l_file.write(str(tile.x))
+            l_file.write('''" o="''')
+            l_file.write(tile.object)
+            l_file.write('''" y="''')
+            l_file.write(str(tile.y))
+            l_file.write('''" r="0" z="0.0"></i>\n''')
+        l_file.write('        </instances>\n    </layer>\n')
+        return True
+
+    def SaveMap(self, filename):
+        map_file = open(filename, 'wt')
+        layer_count = 0
+        while(self.ttiles != []):
+            recycled_tiles = []
+            self.render_tiles = []
+            for t in self.ttiles:
+                if(self.CoordsMatch(t.x, t.y, self.render_tiles) == False):
+                    self.render_tiles.append(t)
+                else:
+                    recycled_tiles.append(t)
+            self.OutputTransLayer(map_file,layer_count)
+            layer_count += 1
+            self.ttiles=recycled_tiles
+        map_file.close()
+        return True
+
+class TransitionTest(unittest.TestCase):
+    def build(self, cls, search):
+        local_map = cls()
+        self.assertTrue(local_map.LoadFromXML("maps/map.xml"))
+        local_map.GetSize()
+        local_map.BuildTransLayer(search)
+        return [(t.x, t.y, t.object) for t in local_map.ttiles]
+
+    def test_grid(self):
+        for search in ("gravel", "brick"):
+            tiles = self.build(LocalMap, search)
+            self.assertTrue(tiles)
+            self.assertEqual(tiles, self.build(BruteForceMap, search))
+
+    @unittest.skipIf(transition.numpy is None, "NumPy is not installed")
+    def test_numpy(self):
+        for search in ("gravel", "brick", "snow"):
+            tiles = self.build(LocalMap, search)
+            self.assertEqual(tiles, self.build(TileByTileMap, search))
+
+    def test_terrains(self):
+        searches = ["gravel", "brick", "snow"]
+        expected = []
+        for search in searches:
+            expected.extend(self.build(TileByTileMap, search))
+        for cls in (LocalMap, TileByTileMap):
+            local_map = cls()
+            local_map.LoadFromXML("maps/map.xml")
+            local_map.GetSize()
+            stats = local_map.BuildTransLayers(searches)
+            tiles = [(t.x, t.y, t.object) for t in local_map.ttiles]
+            # the same as one terrain after the other
+            self.assertEqual(tiles, expected)
+            self.assertEqual(sorted(stats.keys()), sorted(searches))
+
+    def test_save(self):
+        tmp = tempfile.mkdtemp(prefix='parpg-test-')
+        stdout = sys.stdout
+        try:
+            output = []
+            for cls in (LocalMap, SlowSaveMap):
+                local_map = cls()
+                local_map.LoadFromXML("maps/map.xml")
+                local_map.GetSize()
+                local_map.BuildTransLayers(["gravel", "brick", "snow"])
+                filename = os.path.join(tmp, cls.__name__ + ".xml")
+                sys.stdout = StringIO()
+                self.assertTrue(local_map.SaveMap(filename))
+                sys.stdout = stdout
+                output.append(open(filename).read())
+            self.assertTrue("TransitionLayer3" in output[0])
+            self.assertEqual(output[0], output[1])
+        finally:
+            sys.stdout = stdout
+            shutil.rmtree(tmp)
+
+    def test_splice(self):
+        tmp = tempfile.mkdtemp(prefix='parpg-test-')
+        stdout = sys.stdout
+        original = open("maps/map.xml").read()
+        def splice(searches):
+            local_map = LocalMap()
+            local_map.LoadFromXML(filename)
+            local_map.GetSize()
+            local_map.BuildTransLayers(searches)
+            sys.stdout = StringIO()
+            self.assertTrue(local_map.SpliceMap(filename))
+            sys.stdout = stdout
+            return open(filename).read()
+        try:
+            filename = os.path.join(tmp, "map.xml")
+            open(filename, 'w').write(original)
+            spliced = splice(["gravel", "brick"])
+            local_map = LocalMap()
+            local_map.LoadFromXML(filename)
+            self.assertEqual([layer.name for layer in local_map.layers],
+                             ["GroundLayer", "TransitionLayer0", 
+                              "TransitionLayer1", "TransitionLayer2",
+                              "OverlayLayer", "ObjectLayer"])
+            # the old transition layers are replaced, not added to
+            self.assertEqual(splice(["gravel", "brick"]), spliced)
+            self.assertEqual(splice(["nothing"]), original)
+            self.assertEqual(os.listdir(tmp), ["map.xml"])
+        finally:
+            sys.stdout = stdout
+            shutil.rmtree(tmp)
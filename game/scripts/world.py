@@ -20,13 +20,16 @@ import pychan
 from sounds import SoundEngine
 from datetime import date
 from scripts.common.eventlistenerbase import EventListenerBase
-from local_loaders.loaders import loadMapFile
+from local_loaders import loaders
+from local_loaders.loaders import loadMapFile, prepareMapFile, readMapId
+from local_loaders.mapprefetch import MapPrefetcher, DEFAULT_BUDGET
 from sounds import SoundEngine
 from settings import Setting
 from scripts import inventory, hud
 from scripts.popups import *
 from pychan.tools import callbackWithArguments as cbwa
 from map import Map
+from hover import HoverTracker, DEFAULT_CELL, DEFAULT_RATE
 
 TDS = Setting()
 
@@ -59,6 +62,30 @@ class World(EventListenerBase):
         # self.map is a Map object, set to none here
         self.activeMap = None
         self.maps = {}
+        # (name, file, Map) of a map being loaded in the background
+        self.loadingMap = None
+        # prepares the maps behind the doors of the active map
+        budget = TDS.readSetting("PrefetchBudget")
+        if budget:
+            budget = int(budget) * 1024 * 1024
+        else:
+            budget = DEFAULT_BUDGET
+        self.prefetcher = MapPrefetcher(prepareMapFile, budget)
+        # where to log the profile of every map load, if anywhere
+        profile_log = TDS.readSetting("MapLoadLog")
+        if profile_log:
+            loaders.profile_log = profile_log
+        loaders.print_profiles = TDS.readSetting("MapLoadPrint") == "1"
+        # only outlines and names the objects under the cursor on changes
+        cell = TDS.readSetting("HoverCellSize")
+        rate = TDS.readSetting("HoverRate")
+        if cell is None:
+            cell = DEFAULT_CELL
+        if rate is None:
+            rate = DEFAULT_RATE
+        self.hover = HoverTracker(self.hoverQuery, self.hoverLookup,
+                                  self.hoverEnter, self.hoverLeave,
+                                  int(cell), int(rate))
         self.hud = hud.Hud(self.engine, self, TDS)
 
         self.action_number = 1
@@ -92,6 +119,9 @@ class World(EventListenerBase):
     def loadMap(self, mapname, filename):
         """Loads a map an stores it under the given name in the maps list.
         """
+        # the new map may well be the same one, which FIFE can't hold twice
+        if self.activeMap:
+            self.activeMap.reset()
         map = Map(self.engine, self.data)
         
         """Need to set active map before we load it because the map 
@@ -102,13 +132,65 @@ class World(EventListenerBase):
         self.setActiveMap(mapname)
 
         map.load(filename)
+        self.prefetcher.prefetchDoors(filename)
 
     
+    def beginMapLoad(self, mapname, filename, threaded=True, clock=time.time):
+        """Start loading a map in the background, see Map.beginLoad. The
+           active map stays active until finishMapLoad.
+           @type mapname: string
+           @param mapname: Name to store the map under
+           @type filename: string
+           @param filename: Name of map to load
+           @rtype: mapjob.MapLoadJob
+           @return: The job; call finishMapLoad once it is done"""
+        map = Map(self.engine, self.data)
+        self.loadingMap = (mapname, filename, map)
+        prepared = self.prefetcher.take(filename)
+        return map.beginLoad(filename, threaded, clock, prepared)
+
+    def finishMapLoad(self):
+        """Replace the active map with the one loaded in the background. If
+           that could not be created next to the active map after all, it is
+           loaded again the slow way, see loadMap.
+           @return: None"""
+        mapname, filename, map = self.loadingMap
+        self.loadingMap = None
+        if not map.finishLoad(self.activeMap):
+            self.loadMap(mapname, filename)
+            return
+        self.maps[mapname] = map
+        self.setActiveMap(mapname)
+        self.prefetcher.prefetchDoors(filename)
+
+    def mapInModel(self, filename):
+        """Whether the model already holds a map with the id declared in a
+           map file. FIFE can't hold two maps with the same id, so such a map
+           can only be loaded once the other one is gone.
+           @type filename: string
+           @param filename: Name of the map file
+           @rtype: boolean
+           @return: True if it does, or if the id can't be read"""
+        id = readMapId(filename)
+        if id is None:
+            return True
+        return id in [map.getId() for map in self.engine.getModel().getMaps()]
+
+    def getLoadingMap(self):
+        """Returns the map new objects go to: the one being loaded in the
+           background if there is one, otherwise the active map.
+           @rtype: Map
+           @return: The map"""
+        if self.loadingMap is not None:
+            return self.loadingMap[2]
+        return self.activeMap
+
     def setActiveMap(self, mapname):
         """Sets the active map that is to be rendered.
         """
         self.activeMap = self.maps[mapname]
         self.activeMap.makeActive()
+        self.hover.reset()
 
     def displayObjectText(self, obj, text):
         """Display on screen the text of the object over the object.
@@ -201,22 +283,40 @@ class World(EventListenerBase):
            @type evt: fife.event
            @param evt: The event that fife caught
            @return: None"""
-        click = fife.ScreenPoint(evt.getX(), evt.getY())
-        i=self.activeMap.cameras['main'].getMatchingInstances(click, self.activeMap.agent_layer)
-        # no object returns an empty tuple
-        if(i != ()):
-            for obj in i:
-                # check to see if this in our list at all
-                if(self.data.objectActive(obj.getId())):
-                    # yes, so outline 
-                    self.activeMap.outline_render.addOutlined(obj, 0, 137, 255, 2)
-                    # get the text
-                    item = self.data.objectActive(obj.getId())
-                    if(item):
-                        self.displayObjectText(obj, item.name)
-        else:
-            # erase the outline
-            self.activeMap.outline_render.removeAllOutlines()
+        if self.activeMap is not None and self.loadingMap is None:
+            self.hover.moved(evt.getX(), evt.getY())
+
+    def hoverQuery(self, x, y):
+        """Get the instances at a screen point, for the hover tracker.
+           @rtype: tuple
+           @return: The instances on the agent layer"""
+        return self.activeMap.cameras['main'].getMatchingInstances(
+            fife.ScreenPoint(x, y), self.activeMap.agent_layer)
+
+    def hoverLookup(self, ident):
+        """Get the game object of a hovered instance, if it is active.
+           @type ident: string
+           @param ident: ID of object
+           @return: The object or False"""
+        return self.data.objectActive(ident)
+
+    def hoverEnter(self, instance, obj):
+        """Outline and name an object the cursor moved onto.
+           @type instance: fife.Instance
+           @param instance: The instance of the object
+           @type obj: GameObject
+           @param obj: The object
+           @return: None"""
+        self.activeMap.outline_render.addOutlined(instance, 0, 137, 255, 2)
+        self.displayObjectText(instance, obj.name)
+
+    def hoverLeave(self, instance):
+        """Remove the outline and name of an object the cursor left.
+           @type instance: fife.Instance
+           @param instance: The instance of the object
+           @return: None"""
+        self.activeMap.outline_render.removeOutlined(instance)
+        instance.say("")
 
     def getCoords(self, click):
         """Get the map location x, y cords from the screen co-ords
@@ -263,5 +363,11 @@ class World(EventListenerBase):
 
     def pump(self):
         """Routine called during each frame. Our main loop is in ./run.py
-           We ignore this main loop (but FIFE complains if it is missing)."""
-        pass
+           We only use it to prefetch the maps next to the active one and to
+           follow the PC with the chunks of a chunked map, while no map is
+           being loaded."""
+        if self.loadingMap is None:
+            self.prefetcher.pump()
+            if self.activeMap:
+                self.hover.forget(self.activeMap.updateChunks())
+                self.hover.pump()
@@ -15,9 +15,17 @@
 #   You should have received a copy of the GNU General Public License
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys,cPickle
+import sys,os,time,tempfile,cPickle
+from operator import attrgetter
+from optparse import OptionParser
+from xml.parsers import expat
 from xml.sax import make_parser
 from xml.sax.handler import ContentHandler 
+# NumPy is optional: without it the transitions are worked out tile by tile
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # this code is for building the transition layer for the map
 # the world map is built of two layers: one for the world floor, and the other
@@ -26,11 +34,19 @@ from xml.sax.handler import ContentHandler
 # and outputs another file with 1 or more added layers: the layers holding
 # the information for the transition tiles that are rendered over the ground
 
-# usage: transition.py mapfile
-# outputs file new.xml, a simple text file that contains ONLY the new layers
-# needed in the mapfile. At the moment you have to splice these in by hand;
-# they must come AFTER the ground layer but BEFORE the building and objects
-# layers. PM maximinus at the PARPG forums if any questions.
+# usage: transition.py [-t terrain ...] [-o new.xml] mapfile
+#        transition.py --splice [-t terrain ...] mapfile ...
+# where the terrains are the starts of the names of the ground tiles to
+# make transitions for (grass if none are given), in the order they are
+# drawn in; they are all done in one go
+# The first form outputs file new.xml, a simple text file that contains ONLY
+# the new layers needed in the mapfile, to splice in by hand; they must come
+# AFTER the ground layer but BEFORE the building and objects layers.
+# The second form does that for you: it rewrites every map given, replacing
+# any TransitionLayer layers it has with the new ones, so it can be run over
+# all of maps/ (files without layers are left alone). The map's imports
+# have to include the transition tile objects.
+# PM maximinus at the PARPG forums if any questions.
 
 # some simple defines for each part of the tile
 TOP             =   1
@@ -64,6 +80,24 @@ CORNER_LOOKUP   =   [BOTTOM_BLOCK,  LEFT_BLOCK,
                      NONE,          NONE,
                      NONE]
 
+# (x, y) offset and bit of each of the neighbours checked by GetSurroundings
+NEIGHBOURS      =   [((0, 1), RIGHT),       ((-1, 1), BOTTOM_RIGHT),
+                     ((-1, 0), BOTTOM),     ((-1, -1), BOTTOM_LEFT),
+                     ((0, -1), LEFT),       ((1, -1), TOP_LEFT),
+                     ((1, 0), TOP),         ((1, 1), TOP_RIGHT)]
+
+# bytes SaveMap buffers before writing them out
+SAVE_BUFFER     =   65536
+# bytes SpliceMap reads and copies at a time
+SPLICE_CHUNK    =   65536
+# what the ids of the layers SaveMap outputs start with
+TRANSITION_LAYER    =   "TransitionLayer"
+
+# the NumPy engine doesn't make grids with more cells than this many per
+# tile (plus a few to spare for small maps), the tile by tile one copes
+# better with sparse maps
+MAX_CELLS_PER_TILE  =   4
+
 class XMLTileData:
     def __init__(self, x, y, z, o, i=None):
         self.x = x
@@ -143,26 +177,26 @@ class LocalMap:
         self.max_x = 0
         self.min_y = 0
         self.max_y = 0
+        # (x, y) -> names of the ground tiles there, see BuildGrid
+        self.grid = None
+        # use the NumPy engine when NumPy is there
+        self.use_numpy = True
 
     def OutputTransLayer(self, l_file, l_count):
         if(len(self.render_tiles) == 0):
             return True
         try:
-            layer_name="TransitionLayer"+str(l_count)
-            l_file.write('''    <layer x_offset="0.0" pathing="''')
-            l_file.write('''cell_edges_and_diagonals" y_offset="0.0"''')
-            l_file.write(''' grid_type="square" id="''')
-            l_file.write(layer_name+'''"''')
-            l_file.write(''' x_scale="1" y_scale="1" rotation="0.0">\n''')
-            l_file.write('        <instances>\n')
-            for tile in self.render_tiles:
-                l_file.write('''            <i x="''')
-                l_file.write(str(tile.x))
-            	l_file.write('''" o="''')
-            	l_file.write(tile.object)
-            	l_file.write('''" y="''')
-            	l_file.write(str(tile.y))
-            	l_file.write('''" r="0" z="0.0"></i>\n''')
+            layer_name=TRANSITION_LAYER+str(l_count)
+            l_file.write('    <layer x_offset="0.0" pathing="'
+                         'cell_edges_and_diagonals" y_offset="0.0"'
+                         ' grid_type="square" id="' + layer_name + '"'
+                         ' x_scale="1" y_scale="1" rotation="0.0">\n'
+                         '        <instances>\n')
+            # one write per tile, the file buffers them
+            l_file.writelines(['            <i x="%s" o="%s" y="%s" r="0"'
+                               ' z="0.0"></i>\n' % 
+                               (tile.x, tile.object, tile.y)
+                               for tile in self.render_tiles])
             l_file.write('        </instances>\n    </layer>\n')
         except(IOError):
             sys.stderr.write("Error: Couldn't write data")
@@ -219,36 +253,165 @@ class LocalMap:
         name+=str(value)
         return name
 
+    def GetTransitionNames(self, search, value):
+        """Work out the transition tiles to draw over a tile with the
+           surroundings value, corner piece first"""
+        names = []
+        # first we calculate the side tiles:
+        sides = (value&15)
+        if(sides != 0):
+            # there are some side tiles to be drawn. Now we just
+            # need to see if there are any corners to be done
+            corners = (value&240)&(CORNER_LOOKUP[sides-1])                    
+            if(corners != 0):
+                # we must add a corner piece as well
+                corners = corners/16
+                names.append(self.GetTransitionName(search, corners, True))
+            # add the side tile pieces
+            names.append(self.GetTransitionName(search, sides, False))
+        else:
+            # there are no side tiles, so let's just look at
+            # the corners (quite easy):
+            corners = (value&240)/16
+            if(corners != 0):
+                # there is a corner piece needed
+                names.append(self.GetTransitionName(search, corners, True))
+        return names
+
     def BuildTransLayer(self, search):
         """Build up the data for a transition layer
            search is the string that matches the start of the name of
            each tile that we are looking for"""
+        if(self.use_numpy and numpy != None and 
+           self.BuildTransLayersArrays([search]) != None):
+            return
         transition_tiles = self.GetTransitionTiles(search)       
         # now we have all the possible tiles, lets see what they
         # actually need to have rendered
         for t in transition_tiles:
-            # first we calculate the side tiles:
-            sides = (t[2]&15)
-            if(sides != 0):
-                # there are some side tiles to be drawn. Now we just
-                # need to see if there are any corners to be done
-                corners = (t[2]&240)&(CORNER_LOOKUP[sides-1])                    
-                if(corners != 0):
-                    # we must add a corner piece as well
-                    corners = corners/16
-                    name = self.GetTransitionName(search, corners, True)
-                    self.ttiles.append(XMLTileData(t[0], t[1], 0, name))
-                # add the side tile pieces
-                name = self.GetTransitionName(search, sides, False)
+            for name in self.GetTransitionNames(search, t[2]):
                 self.ttiles.append(XMLTileData(t[0], t[1], 0, name))
-            else:
-                # there are no side tiles, so let's just look at
-                # the corners (quite easy):
-                corners = (t[2]&240)/16
-                if(corners != 0):
-                    # there is a corner piece needed
-                    name = self.GetTransitionName(search, corners, True)
-                    self.ttiles.append(XMLTileData(t[0], t[1], 0, name))
+
+    def BuildTransLayers(self, searches):
+        """Build up the data for the transition layers of several terrains
+           in one go. searches is a list of the strings the names of the
+           tiles of each terrain start with; at each co-ord the transitions
+           are in that order, so the later terrains are drawn on top.
+           Returns search -> (seconds, transition tiles) for each terrain"""
+        stats = None
+        if(self.use_numpy and numpy != None):
+            stats = self.BuildTransLayersArrays(searches)
+        if(stats == None):
+            stats = self.BuildTransLayersTiles(searches)
+        return stats
+
+    def BuildTransLayersTiles(self, searches):
+        """BuildTransLayers tile by tile: the co-ords of the tiles of every
+           terrain are sorted out in one go over the ground layer, then
+           the surroundings of each tile are looked up in them"""
+        tiles = self.layers[0].tiles
+        sizes = [len(search) for search in searches]
+        matched = [set() for search in searches]
+        for t in tiles:
+            if(t.object != None and self.CheckRange(t.x, t.y) == True):
+                for search, size, coords in zip(searches, sizes, matched):
+                    if(t.object[:size] == search):
+                        coords.add((t.x, t.y))
+        stats = {}
+        all_values = []
+        for search, size, coords in zip(searches, sizes, matched):
+            start = time.time()
+            values = []
+            count = 0
+            for t in tiles:
+                value = 0
+                # like GetTransitionTiles: only tiles without the terrain
+                if(t.object != None and t.object[:size] != search):
+                    for (dx, dy), bit in NEIGHBOURS:
+                        if((t.x + dx, t.y + dy) in coords):
+                            value += bit
+                    if(value != 0):
+                        count += 1
+                values.append(value)
+            all_values.append(values)
+            stats[search] = (time.time() - start, count)
+        self.MergeTransLayers(searches, tiles, range(len(tiles)), 
+                              all_values)
+        return stats
+
+    def BuildTransLayersArrays(self, searches):
+        """BuildTransLayers for the whole ground layer at once with NumPy:
+           the tiles of a terrain are marked in a grid from min_x,min_y to
+           max_x,max_y, and every neighbour of GetSurroundings is a shifted
+           view of that grid.
+           Returns None, having done nothing, for maps it can't grid"""
+        tiles = self.layers[0].tiles
+        if(tiles == []):
+            return dict([(search, (0.0, 0)) for search in searches])
+        width = int(self.max_x - self.min_x) + 1
+        height = int(self.max_y - self.min_y) + 1
+        if(width * height > MAX_CELLS_PER_TILE * len(tiles) + 65536):
+            return None
+        xs = map(attrgetter('x'), tiles)
+        ys = map(attrgetter('y'), tiles)
+        objects = map(attrgetter('object'), tiles)
+        xs = numpy.array(xs) - self.min_x
+        ys = numpy.array(ys) - self.min_y
+        # tiles off the grid, or out of range because GetSize hasn't been
+        # called, are left to the tile by tile engine
+        if((xs != numpy.floor(xs)).any() or (ys != numpy.floor(ys)).any() or
+           xs.min() < 0 or xs.max() >= width or
+           ys.min() < 0 or ys.max() >= height):
+            return None
+        # the grid has a border of one cell that never matches, for the
+        # neighbours that are out of range
+        xs = xs.astype(int) + 1
+        ys = ys.astype(int) + 1
+        names = set(objects)
+        named = dict([(name, name != None) for name in names])
+        named = numpy.array(map(named.__getitem__, objects))
+        stats = {}
+        all_values = []
+        for search in searches:
+            start = time.time()
+            # there are only a few tile names, so each is matched only once
+            size = len(search)
+            kinds = dict([(name, name != None and name[:size] == search)
+                          for name in names])
+            match = numpy.array(map(kinds.__getitem__, objects))
+            grid = numpy.zeros((width + 2, height + 2), numpy.uint8)
+            grid[xs[match], ys[match]] = 1
+            values = numpy.zeros((width, height), numpy.uint8)
+            for (dx, dy), bit in NEIGHBOURS:
+                values += grid[1 + dx:width + 1 + dx, 
+                               1 + dy:height + 1 + dy] * numpy.uint8(bit)
+            # like GetTransitionTiles: tiles without the terrain, next to
+            # one with it
+            values = values[xs - 1, ys - 1] * (named & ~match)
+            all_values.append(values)
+            stats[search] = (time.time() - start, 
+                             int(numpy.count_nonzero(values)))
+        all_values = numpy.array(all_values)
+        chosen = numpy.flatnonzero(all_values.any(axis=0))
+        self.MergeTransLayers(searches, tiles, chosen.tolist(), 
+                              all_values[:, chosen].tolist())
+        return stats
+
+    def MergeTransLayers(self, searches, tiles, chosen, all_values):
+        """Add the transition tiles of several terrains to ttiles, terrain
+           by terrain and in the order of the ground layer, so that at each
+           co-ord the later terrains end up on the later layers. chosen are
+           the indexes of the tiles that might need some, all_values holds
+           a list of their surroundings for each terrain"""
+        ttiles = self.ttiles
+        for search, values in zip(searches, all_values):
+            names = [self.GetTransitionNames(search, value) 
+                     for value in range(256)]
+            for index, value in zip(chosen, values):
+                if(value != 0):
+                    t = tiles[index]
+                    for name in names[value]:
+                        ttiles.append(XMLTileData(t.x, t.y, 0, name))
 
     def LoadFromXML(self, filename):
         """Load a map from the XML file used in Fife
@@ -266,7 +429,21 @@ class LocalMap:
         map_file.close()
         # make a copy of the layer data
         self.layers = curHandler.layers
+        self.BuildGrid()
         return True
+
+    def BuildGrid(self):
+        """Index the ground tiles by their co-ords, so that PMatchSearch
+           doesn't have to go through all of them"""
+        self.grid = {}
+        if(self.layers == []):
+            return
+        for t in self.layers[0].tiles:
+            names = self.grid.get((t.x, t.y))
+            if names is None:
+                self.grid[(t.x, t.y)] = [t.object]
+            else:
+                names.append(t.object)
     
     def GetSize(self):
         """GetSize stores the size of the grid"""
@@ -288,13 +465,15 @@ class LocalMap:
         return True
 
     def PMatchSearch(self, x, y, search):
-        """Brute force method used for matching grid"""
+        """Is there a ground tile at x,y whose name starts with search?"""
         # is the tile even in range?
         if(self.CheckRange(x,y) == False):
             return False
+        if(self.grid == None):
+            self.BuildGrid()
         size = len(search)
-        for t in self.layers[0].tiles:
-            if((t.x == x)and(t.y == y)and(t.object[:size] == search)):
+        for name in self.grid.get((x, y), ()):
+            if(name[:size] == search):
                 return(True)
         # no match
         return False
@@ -312,33 +491,76 @@ class LocalMap:
         """Save the new map"""
         # open the new files for writing
         try:
-            map_file = open(filename, 'wt')
+            map_file = open(filename, 'wt', SAVE_BUFFER)
         except(IOError):
             sys.stderr.write("Error: Couldn't save map\n")
             return(False)
-        # we don't know how many layers we need, let's do that now
-        # this is a brute force solution but it does work, and speed
-        # is not required in this utility
+        layer_count = self.WriteTransLayers(map_file)
+        if(layer_count == None):
+            return False
+        # phew, that was it
+        map_file.close()
+        print "Output new file as", filename
+        print "Had to render",layer_count,"layers"
+        return True
+
+    def WriteTransLayers(self, map_file):
+        """Pack ttiles into as few layers as can be and write those
+           Returns the number of layers, or None if writing failed"""
+        # no two tiles on a layer can share co-ords, so the first tile at
+        # some co-ords goes on the first layer, the second on the second
+        # and so on
+        layers = []
+        counts = {}
+        for t in self.ttiles:
+            coords = (t.x, t.y)
+            layer = counts.get(coords, 0)
+            counts[coords] = layer + 1
+            if(layer == len(layers)):
+                layers.append([])
+            layers[layer].append(t)
+        self.ttiles = []
         layer_count = 0
-        while(self.ttiles != []):
-            recycled_tiles = []
-            self.render_tiles = []
-            for t in self.ttiles:
-                if(self.CoordsMatch(t.x, t.y, self.render_tiles) == False):
-                    # no matching tile in the grid so far, so add it
-                    self.render_tiles.append(t)
-                else:
-                    # we must save this for another layer
-                    recycled_tiles.append(t)
+        for tiles in layers:
+            self.render_tiles = tiles
             # render this layer
             if(self.OutputTransLayer(map_file,layer_count) == False):
-                return False
+                return None
             layer_count += 1
-            self.ttiles=recycled_tiles
-        # phew, that was it
-        map_file.close()
-        print "Output new file as new.xml"
-        print "Had to render",layer_count,"layers"
+        return layer_count
+
+    def SpliceMap(self, filename, target=None):
+        """Write the map in filename to target (filename itself if not
+           given) with the transition layers in place of the ones it had.
+           target is only replaced once all of it has been written
+           Returns True if it worked, False otherwise"""
+        if(target == None):
+            target = filename
+        directory = os.path.dirname(os.path.abspath(target))
+        handle, temp = tempfile.mkstemp(suffix='.xml', dir=directory)
+        try:
+            map_file = os.fdopen(handle, 'wb', SAVE_BUFFER)
+            try:
+                splicer = MapSplicer(filename, map_file, 
+                                     self.WriteTransLayers)
+                layer_count = splicer.Splice()
+                map_file.flush()
+                os.fsync(map_file.fileno())
+            finally:
+                map_file.close()
+            if(layer_count == None):
+                os.remove(temp)
+                return False
+            # Windows can't rename over a file
+            if(os.name == 'nt' and os.path.exists(target)):
+                os.remove(target)
+            os.rename(temp, target)
+        except(IOError, OSError, expat.ExpatError), e:
+            sys.stderr.write("Error: Couldn't splice map: %s\n" % e)
+            if(os.path.exists(temp)):
+                os.remove(temp)
+            return False
+        print "Spliced",layer_count,"layers into",target
         return True
     
     def PrintDetails(self):
@@ -351,15 +573,166 @@ class LocalMap:
         print "\nMap Dimensions: X=",(self.max_x-self.min_x) + 1,
         print " Y=",(self.max_y-self.min_y) + 1
 
+class MapSplicer:
+    """Copies a map file, leaving out its transition layers and writing
+       new ones after its ground layer (the first layer). expat tells where
+       the layers are, everything else is copied as it is a chunk at a
+       time, so the whole map is never in memory"""
+    def __init__(self, filename, out_file, write_layers):
+        """write_layers(out_file) writes the new layers and returns their
+           number, or None if it failed"""
+        self.filename = filename
+        self.out_file = out_file
+        self.write_layers = write_layers
+        self.parser = None
+        # the copy of the map, and how far it has got
+        self.map_file = None
+        self.pos = 0
+        # whitespace held back until we know it isn't before a layer that
+        # is left out
+        self.pending = ''
+        # leave out the newline that follows the new layers
+        self.trim = False
+        self.layer_start = None
+        self.dropping = False
+        self.layer_count = None
+
+    def Splice(self):
+        """Returns the number of new layers (0 if the map has no ground
+           layer to put them after), or None if writing them failed"""
+        self.parser = expat.ParserCreate()
+        self.parser.StartElementHandler = self.StartElement
+        self.parser.EndElementHandler = self.EndElement
+        self.map_file = open(self.filename, 'rb')
+        source = open(self.filename, 'rb')
+        try:
+            while(True):
+                data = source.read(SPLICE_CHUNK)
+                self.parser.Parse(data, data == '')
+                if(data == ''):
+                    break
+            self.CopyTo(None)
+            self.out_file.write(self.pending)
+        finally:
+            source.close()
+            self.map_file.close()
+        if(self.layer_count == None and self.trim == True):
+            return None
+        return self.layer_count or 0
+
+    def StartElement(self, name, attrs):
+        if(name == "layer"):
+            self.layer_start = self.parser.CurrentByteIndex
+            if(attrs.get('id', '').startswith(TRANSITION_LAYER)):
+                self.CopyTo(self.layer_start)
+                self.pending = ''
+                self.dropping = True
+
+    def EndElement(self, name):
+        if(name != "layer"):
+            return
+        # the end tag, or the whole tag of an empty layer
+        end = self.parser.CurrentByteIndex
+        if(self.dropping == True):
+            self.SkipTo(end)
+            self.ReadTag()
+            self.dropping = False
+        elif(self.layer_count == None and self.trim == False):
+            # the ground layer
+            self.CopyTo(end)
+            self.Write(self.ReadTag())
+            self.out_file.write(self.pending + '\n')
+            self.pending = ''
+            self.layer_count = self.write_layers(self.out_file)
+            self.trim = True
+
+    def Write(self, data):
+        data = self.pending + data
+        body = data.rstrip()
+        # whitespace may yet turn out to be before a layer left out
+        if(body != '' and self.trim == True):
+            if(data.startswith('\r\n')):
+                data = data[2:]
+            elif(data.startswith('\n')):
+                data = data[1:]
+            body = data.rstrip()
+            self.trim = False
+        self.out_file.write(body)
+        self.pending = data[len(body):]
+
+    def CopyTo(self, offset):
+        """Copy the map up to offset, or to the end if it is None"""
+        while(offset == None or self.pos < offset):
+            size = SPLICE_CHUNK
+            if(offset != None):
+                size = min(size, offset - self.pos)
+            data = self.map_file.read(size)
+            if(data == ''):
+                break
+            self.pos += len(data)
+            self.Write(data)
+
+    def SkipTo(self, offset):
+        while(self.pos < offset):
+            data = self.map_file.read(min(SPLICE_CHUNK, offset - self.pos))
+            if(data == ''):
+                break
+            self.pos += len(data)
+
+    def ReadTag(self):
+        """Read the tag at the current position and return it"""
+        tag = []
+        quote = None
+        while(True):
+            char = self.map_file.read(1)
+            if(char == ''):
+                break
+            self.pos += 1
+            tag.append(char)
+            if(quote != None):
+                if(char == quote):
+                    quote = None
+            elif(char == '"' or char == "'"):
+                quote = char
+            elif(char == '>'):
+                break
+        return ''.join(tag)
+
 if __name__=="__main__":
-    # pass a map name as the first argument
-    if(len(sys.argv) < 2):
+    parser = OptionParser(usage="%prog [options] mapfile ...")
+    parser.add_option("-t", "--terrain", action="append", dest="terrains",
+                      help="start of the names of the ground tiles to make "
+                           "transitions for, in drawing order (grass if none "
+                           "are given)")
+    parser.add_option("-o", "--output", default="new.xml",
+                      help="file to write the new layers to [%default]")
+    parser.add_option("-s", "--splice", action="store_true", default=False,
+                      help="replace the transition layers of every map "
+                           "given in the map itself")
+    options, args = parser.parse_args()
+    if(len(args) < 1):
         sys.stderr.write("Error: No map given!\n")
         sys.exit(False)
-    new_map=LocalMap()
-    if(new_map.LoadFromXML(sys.argv[1]) == True):
+    if(len(args) > 1 and options.splice == False):
+        parser.error("only --splice takes more than one map")
+    searches = options.terrains or ["grass"]
+    failed = False
+    for filename in args:
+        new_map=LocalMap()
+        if(new_map.LoadFromXML(filename) == False):
+            failed = True
+            continue
+        if(new_map.layers == []):
+            print filename, "has no layers, left alone"
+            continue
         new_map.GetSize()
-        new_map.BuildTransLayer("grass")
-        new_map.SaveMap("new.xml")
+        stats = new_map.BuildTransLayers(searches)
+        for search in searches:
+            print "%s: %d tiles need transitions, took %.1f ms" % \
+                  (search, stats[search][1], stats[search][0] * 1000)
+        if(options.splice == True):
+            failed = (new_map.SpliceMap(filename) == False) or failed
+        else:
+            failed = (new_map.SaveMap(options.output) == False) or failed
         new_map.PrintDetails()
-
+    sys.exit(failed)